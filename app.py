@@ -1,10 +1,28 @@
 import streamlit as st
-from google import genai
 import json
 import time
 import random
 from datetime import datetime
 import re
+import os
+from collections import namedtuple
+
+from backends import needs_api_key
+from gemini_client import ModelResolver
+from ingredient_extractor import canonical_ingredients, split_items
+from jobs import JobQueue, QueueFull
+from meal_plan import MAX_PLAN_SIZE, candidate_count, generate_meal_plan
+import metrics
+from nutrition import as_facts, format_nutrition, nutrition_batch, scale_recipe, servings_of
+from photo_detection import PhotoCache, detect_ingredients
+from recipe_cache import RecipeCache, make_cache_key
+from recipe_index import RecipeIndex
+from prompts import TokenUsage
+from recipe_generator import VARIANTS, generate_recipe_text, generate_variants, request_config, request_prompt
+from recipe_parser import IncrementalRecipeParser, parse_recipe_json, parse_recipe_text
+from recipe_search import split_list
+from singleflight import SingleFlight
+from storage import RecipeStore
 
 # Page configuration
 st.set_page_config(
@@ -101,8 +119,8 @@ def init_session_state():
     defaults = {
         'recipes': None,
         'ingredients': [],
-        'saved_recipes': [],
-        'shopping_list': [],
+        'saved_page': 0,
+        'list_page': 0,
         'active_timer': None,
         'timer_start': None,
         'current_tab': "🧑‍🍳 Generate Recipes"
@@ -112,31 +130,112 @@ def init_session_state():
         if key not in st.session_state:
             st.session_state[key] = value
 
+# Shared resolver per API key, so reruns never rebuild the client or re-probe models
+@st.cache_resource(show_spinner=False)
+def get_model_resolver(api_key):
+    return ModelResolver(api_key)
+
+# Process-wide recipe response cache
+CACHE_DIR = os.environ.get(
+    "RECIPE_DOCTOR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+CACHE_PATH = os.path.join(CACHE_DIR, "recipes.sqlite3")
+
+@st.cache_resource(show_spinner=False)
+def get_recipe_cache():
+    return RecipeCache(CACHE_PATH)
+
+# Saved recipes and shopping list, persisted across sessions and restarts
+STORE_PATH = os.environ.get(
+    "RECIPE_DOCTOR_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "recipe_doctor.sqlite3")
+)
+
+@st.cache_resource(show_spinner=False)
+def get_store():
+    return RecipeStore(STORE_PATH)
+
+# Process-wide coalescing of identical in-flight generations
+@st.cache_resource(show_spinner=False)
+def get_single_flight():
+    return SingleFlight()
+
+# Process-wide token accounting from response usage metadata
+@st.cache_resource(show_spinner=False)
+def get_token_usage():
+    return TokenUsage()
+
+# Ingredients detected in fridge photos, shared by near-identical photos
+PHOTO_CACHE_PATH = os.path.join(CACHE_DIR, "photos.sqlite3")
+
+@st.cache_resource(show_spinner=False)
+def get_photo_cache():
+    return PhotoCache(PHOTO_CACHE_PATH)
+
+def lookup_cached_recipes(cache, cache_key):
+    """Recipe cache lookup that also counts hits and misses"""
+    cached = cache.get(cache_key)
+    metrics.inc("cache_lookups", cache="recipes", result="hit" if cached else "miss")
+    return cached
+
+# Optional Prometheus endpoint, started once per process
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    return metrics.serve_from_env()
+
+# Saved and previously generated recipes, matched locally before calling Gemini
+@st.cache_resource(show_spinner=False)
+def get_recipe_index():
+    cache = get_recipe_cache()
+    # Generated recipes leave the index with the cache's TTL and size limit
+    index = RecipeIndex(ttl=cache.ttl, max_cached=cache.max_disk_items)
+    fill_recipe_index(index)
+    return index
+
+def fill_recipe_index(index):
+    index.add_many(get_store().iter_recipes())
+    for created_at, recipe in get_recipe_cache().iter_recipes():
+        index.add(recipe, created_at)
+
+def find_local_recipe(ingredients_list, dietary_prefs, cuisine, meal_type):
+    """A known recipe that fits the pantry, or None"""
+    # Stored recipes do not record the preferences they were made for
+    if dietary_prefs or cuisine != "Any" or meal_type != "Any":
+        return None
+    with metrics.span("local_index"):
+        matches = get_recipe_index().match(ingredients_list)
+    metrics.inc("cache_lookups", cache="local_index", result="hit" if matches else "miss")
+    return [matches[0][1]] if matches else None
+
+def preferences_dict(dietary_prefs, cuisine, meal_type, skill_level):
+    return {
+        'dietary_prefs': dietary_prefs,
+        'cuisine': cuisine,
+        'meal_type': meal_type,
+        'skill_level': skill_level
+    }
+
 # Initialize Gemini
 def init_gemini():
-    api_key = st.secrets.get("GEMINI_API_KEY", st.session_state.get("api_key", ""))
-    if api_key:
+    try:
+        api_key = st.secrets.get("GEMINI_API_KEY", st.session_state.get("api_key", ""))
+    except FileNotFoundError:
+        # No secrets.toml at all, e.g. offline runs on the fake backend
+        api_key = st.session_state.get("api_key", "")
+    # The fake and replay backends run without one
+    if api_key or not needs_api_key():
         try:
-            client = genai.Client(api_key=api_key)
-            model_name = "gemini-3-flash-preview"
+            resolver = get_model_resolver(api_key)
+            model_name = resolver.resolve()
+            probe_errors = resolver.probe_errors
             
-            try:
-                # Test connection
-                response = client.models.generate_content(
-                    model=model_name,
-                    contents="Test",
-                    config={"max_output_tokens": 10}
-                )
+            preferred = resolver.candidates[0]
+            if preferred in probe_errors:
+                st.sidebar.warning(f"Gemini 3 not available: {probe_errors[preferred]}")
+            else:
                 st.sidebar.success(f"✅ Connected to {model_name}")
-                return client, model_name
-            except Exception as e:
-                st.sidebar.warning(f"Gemini 3 not available: {str(e)[:100]}")
-                
-                try:
-                    model_name = "gemini-2.5-flash"
-                    return client, model_name
-                except:
-                    return client, "gemini-1.5-flash"
+            return resolver.resilient_client, model_name
                     
         except Exception as e:
             st.sidebar.error(f"Configuration error: {str(e)[:100]}")
@@ -145,255 +244,382 @@ def init_gemini():
         st.sidebar.warning("⚠️ No API key found.")
         return None, None
 
-# Simple ingredient detection
+# Ingredient detection - the user's own items; cache keys and the local index canonicalize them
 def detect_ingredients_from_text(ingredient_text):
     """Extract ingredients from user's text input"""
-    ingredients = []
-    raw_ingredients = [x.strip() for x in ingredient_text.split(',') if x.strip()]
-    
-    for ing in raw_ingredients:
-        if ing:
-            ingredients.append(ing)
+    return split_items(ingredient_text)
+
+# Photo detection - runs as a button callback so it can fill the text box before it renders
+def detect_photo_ingredients(client, model_name):
+    """Add the ingredients seen in the uploaded photo to the ingredient text"""
+    photo = st.session_state.get('photo_upload')
+    if photo is None:
+        return
+    try:
+        with metrics.span("photo_detection"):
+            found, from_cache, upload_size = detect_ingredients(
+                client, model_name, photo.getvalue(), get_photo_cache(), get_token_usage()
+            )
+        metrics.inc("cache_lookups", cache="photos", result="hit" if from_cache else "miss")
+    except Exception as e:
+        st.session_state.photo_status = ('error', f"Photo detection error: {str(e)[:100]}")
+        return
     
-    return ingredients
+    if not found:
+        st.session_state.photo_status = ('warning', "No ingredients recognised in the photo")
+        return
+    current = split_items(st.session_state.get('ingredient_input', ''))
+    have = set(canonical_ingredients(current))
+    st.session_state.ingredient_input = ", ".join(current + [ing for ing in found if ing not in have])
+    source = "from an earlier photo" if from_cache else f"{upload_size // 1024} KB uploaded"
+    st.session_state.photo_status = ('success', f"Found {len(found)} ingredients ({source})")
+
+# Generation jobs - Gemini calls run on a shared worker pool, never in the script run
+JOB_WORKERS = 4
+JOB_POLL_SECONDS = 0.5
+
+@st.cache_resource(show_spinner=False)
+def get_job_queue():
+    return JobQueue(max_workers=JOB_WORKERS)
 
-# Generate recipes with Gemini - UPDATED
-def generate_recipes_with_gemini(ingredients_list, dietary_prefs, cuisine, meal_type, skill_level, client=None, model_name=None):
+# Process-wide objects a job needs, looked up on the script thread before submitting
+GenerationResources = namedtuple('GenerationResources', 'cache flight usage')
+
+def generation_resources():
+    return GenerationResources(get_recipe_cache(), get_single_flight(), get_token_usage())
+
+# Generate recipes with Gemini - runs inside a job
+def generate_recipes_with_gemini(job, res, ingredients_list, dietary_prefs, cuisine, meal_type, skill_level, client, model_name, force_fresh=False, structured=False):
     """Generate recipes using Gemini text model - NO STATIC RECIPES"""
-    if not client or not model_name:
-        st.sidebar.error("Gemini API not available.")
-        return None
+    cache_key = make_cache_key(ingredients_list, dietary_prefs, cuisine, meal_type, skill_level, model_name)
+    if not force_fresh:
+        cached = lookup_cached_recipes(res.cache, cache_key)
+        if cached:
+            return cached
     
-    try:
-        # STRONG, DIRECT prompt
-        prompt = f"""CREATE A DETAILED RECIPE WITH SPECIFIC INSTRUCTIONS:
-        
-        Ingredients to use: {', '.join(ingredients_list)}
-        
-        CRITICAL RULES:
-        1. Give EXACT cooking steps with specific times and temperatures
-        2. NO generic steps like "prepare ingredients" or "cook as desired"
-        3. Each step must be a specific action
-        4. Include 5-7 detailed steps
-        
-        Example of GOOD steps:
-        1. Heat 2 tbsp oil in a pan over medium heat
-        2. Chop onions and sauté for 3 minutes until translucent
-        3. Add minced garlic and cook for 30 seconds
-        4. Crack eggs into bowl, whisk with milk and salt
-        5. Pour egg mixture into pan, cook for 2-3 minutes while stirring
-        
-        Example of BAD steps:
-        1. Prepare ingredients
-        2. Cook as desired
-        3. Serve and enjoy
-        
-        Now create a recipe with SPECIFIC steps:
-        
-        RECIPE NAME: [Name]
-        DIFFICULTY: Easy/Medium/Hard
-        PREP TIME: [exact time] minutes
-        COOK TIME: [exact time] minutes
-        SERVINGS: [number]
-        CALORIES: [number]
-        INGREDIENTS:
-        - [Specific ingredient with quantity]
-        - [Another ingredient with quantity]
-        STEPS:
-        1. [FIRST SPECIFIC ACTION with time/temperature]
-        2. [SECOND SPECIFIC ACTION with details]
-        3. [THIRD SPECIFIC ACTION with details]
-        4. [FOURTH SPECIFIC ACTION with details]
-        5. [FIFTH SPECIFIC ACTION with details]
-        TIPS: [Practical tip]
-        NUTRITION: [Nutrition info]"""
-        
-        # Generate response
-        response = client.models.generate_content(
-            model=model_name,
-            contents=prompt,
-            config={
-                "temperature": 0.7,
-                "top_p": 0.8,
-                "max_output_tokens": 1000
-            }
+    # Generate response - identical requests from other sessions share one call
+    with metrics.span("gemini_call", model=model_name):
+        response_text = res.flight.do(
+            (cache_key, structured, force_fresh),
+            lambda: generate_recipe_text(
+                client, model_name, ingredients_list, structured=structured,
+                preferences=preferences_dict(dietary_prefs, cuisine, meal_type, skill_level),
+                usage=res.usage
+            )
         )
-        
-        response_text = response.text.strip()
-        
-        # Show raw response for debugging
-        if st.session_state.get('show_debug', False):
-            st.sidebar.text_area("Gemini Raw Response", response_text, height=300, key="raw_response")
-        
-        # Parse the response
-        return parse_gemini_response(response_text)
-            
-    except Exception as e:
-        st.sidebar.error(f"Generation error: {str(e)}")
-        return None
+    job.raw_response = response_text
+    job.check_cancelled()
+    
+    # Parse the response
+    with metrics.span("parse"):
+        if structured:
+            recipes = parse_structured_response(job, response_text)
+        else:
+            recipes = parse_gemini_response(job, response_text)
+    if recipes:
+        cache_recipes(job, res, cache_key, recipes)
+    return recipes
+
+# Several variants at once - requests run concurrently on a thread pool
+def generate_recipe_variants(job, res, ingredients_list, dietary_prefs, cuisine, meal_type, skill_level, client, model_name, count, force_fresh=False, structured=False):
+    """Emit ('variant', recipe) as each variant's request finishes; returns them all"""
+    recipes = []
+    keys = {}
+    for variant in range(count):
+        keys[variant] = make_cache_key(ingredients_list, dietary_prefs, cuisine, meal_type, skill_level, model_name, variant=variant)
+        cached = None if force_fresh else lookup_cached_recipes(res.cache, keys[variant])
+        if cached:
+            del keys[variant]
+            recipes.append(cached[0])
+            job.emit(('variant', cached[0]))
+    
+    preferences = preferences_dict(dietary_prefs, cuisine, meal_type, skill_level)
+    for variant, result in generate_variants(client, model_name, ingredients_list, keys, structured=structured,
+                                             preferences=preferences, usage=res.usage):
+        job.check_cancelled()
+        if isinstance(result, Exception):
+            job.note(f"Generation error (variant {variant + 1}): {str(result)[:100]}")
+            continue
+        recipe = result.to_dict()
+        cache_recipes(job, res, keys[variant], [recipe])
+        recipes.append(recipe)
+        job.emit(('variant', recipe))
+    return recipes
+
+# Meal plan - several recipes per request, chosen for a short combined shopping list
+def generate_meal_plan_with_gemini(job, res, ingredients_list, dietary_prefs, cuisine, meal_type, skill_level, client, model_name, count, force_fresh=False, structured=False):
+    """Emit ('variant', recipe) for every candidate as its batch arrives; returns the chosen plan"""
+    cache_key = make_cache_key(ingredients_list, dietary_prefs, cuisine, meal_type, skill_level, model_name, variant=f"plan-{count}")
+    if not force_fresh:
+        cached = lookup_cached_recipes(res.cache, cache_key)
+        if cached:
+            job.summary = f"✅ Meal plan of {len(cached)} recipes (cached)"
+            return cached
+    
+    def on_recipes(recipes):
+        job.check_cancelled()
+        for recipe in recipes:
+            job.emit(('variant', recipe))
+    
+    with metrics.span("meal_plan", model=model_name):
+        plan = generate_meal_plan(client, model_name, ingredients_list, count, structured=structured,
+                                  preferences=preferences_dict(dietary_prefs, cuisine, meal_type, skill_level),
+                                  usage=res.usage, on_recipes=on_recipes)
+    for note in plan.notes:
+        job.note(note)
+    if plan.recipes:
+        job.summary = (f"✅ Planned {len(plan.recipes)} recipes from {plan.requests} requests: "
+                       f"{plan.items} items to buy ({plan.baseline_items} without optimizing)")
+        cache_recipes(job, res, cache_key, plan.recipes)
+    return plan.recipes
+
+# Streaming generation - emits recipe events as lines complete
+def stream_recipes_with_gemini(job, res, ingredients_list, dietary_prefs, cuisine, meal_type, skill_level, client, model_name, force_fresh=False):
+    """Emit (field, value) events while Gemini streams; returns the parsed recipes"""
+    cache_key = make_cache_key(ingredients_list, dietary_prefs, cuisine, meal_type, skill_level, model_name)
+    if not force_fresh:
+        cached = lookup_cached_recipes(res.cache, cache_key)
+        if cached:
+            return cached
+    
+    parser = IncrementalRecipeParser()
+    chunks = []
+    usage_metadata = None
+    started = time.perf_counter()
+    stream = client.models.generate_content_stream(
+        model=model_name,
+        contents=request_prompt(ingredients_list, preferences_dict(dietary_prefs, cuisine, meal_type, skill_level)),
+        config=request_config()
+    )
+    # Opening the stream returns once the first chunk is in
+    metrics.observe("phase_seconds", time.perf_counter() - started, phase="stream_first_chunk", model=model_name)
+    for chunk in stream:
+        job.check_cancelled()
+        text = chunk.text or ''
+        chunks.append(text)
+        # Only the final chunk carries complete counts
+        usage_metadata = getattr(chunk, 'usage_metadata', None) or usage_metadata
+        for event in parser.feed(text):
+            job.emit(event)
+    for event in parser.close():
+        job.emit(event)
+    metrics.observe("phase_seconds", time.perf_counter() - started, phase="stream_total", model=model_name)
+    res.usage.record(usage_metadata)
+    job.raw_response = ''.join(chunks).strip()
+    
+    # The full result is the source of truth once the stream ends
+    recipes = recipe_result(job, parser.result())
+    if recipes:
+        cache_recipes(job, res, cache_key, recipes)
+    return recipes
 
-def parse_gemini_response(text):
+def cache_recipes(job, res, cache_key, recipes):
+    """Cache a job's recipes, noting any that repeat a recipe generated for another request"""
+    for name, similar, score in res.cache.set(cache_key, recipes):
+        metrics.inc("near_duplicates", where="cache")
+        job.note(f"♻️ {name} is {score:.0%} alike to {similar}, generated earlier")
+
+def parse_gemini_response(job, text):
     """Parse Gemini's response with better step detection"""
+    return recipe_result(job, parse_recipe_text(text))
+
+def parse_structured_response(job, text):
+    """Validate a JSON-schema response, falling back to the text parser"""
     try:
-        recipe = {
-            'recipe_name': 'AI Recipe',
-            'difficulty': 'Easy',
-            'prep_time': '10 minutes',
-            'cook_time': '15 minutes',
-            'servings': 2,
-            'calories': '300',
-            'ingredients': [],
-            'steps': [],
-            'tips': 'Enjoy your meal!',
-            'nutrition': 'Nutritional information'
-        }
-        
-        lines = text.split('\n')
-        current_section = None
-        step_number = 1
-        
-        for i, line in enumerate(lines):
-            line = line.strip()
-            if not line:
-                continue
-            
-            # Check for headers (case insensitive)
-            line_upper = line.upper()
-            
-            if 'RECIPE NAME:' in line_upper:
-                recipe['recipe_name'] = line.split(':', 1)[1].strip()
-            elif 'DIFFICULTY:' in line_upper:
-                recipe['difficulty'] = line.split(':', 1)[1].strip()
-            elif 'PREP TIME:' in line_upper:
-                recipe['prep_time'] = line.split(':', 1)[1].strip()
-            elif 'COOK TIME:' in line_upper:
-                recipe['cook_time'] = line.split(':', 1)[1].strip()
-            elif 'SERVINGS:' in line_upper:
-                recipe['servings'] = line.split(':', 1)[1].strip()
-            elif 'CALORIES:' in line_upper:
-                recipe['calories'] = line.split(':', 1)[1].strip()
-            elif 'TIPS:' in line_upper:
-                recipe['tips'] = line.split(':', 1)[1].strip()
-            elif 'NUTRITION:' in line_upper:
-                recipe['nutrition'] = line.split(':', 1)[1].strip()
-            
-            # Section starts
-            elif 'INGREDIENTS:' in line_upper:
-                current_section = 'ingredients'
-            elif 'STEPS:' in line_upper or 'INSTRUCTIONS:' in line_upper:
-                current_section = 'steps'
-                step_number = 1
-            elif line_upper in ['TIPS:', 'NUTRITION:']:
-                current_section = None
-            
-            # Parse ingredients
-            elif current_section == 'ingredients':
-                # Look for bullet points or numbered lists
-                if line.startswith(('-', '*', '•')) or (line[0].isdigit() and line[1] in '. )'):
-                    # Clean the line
-                    if line.startswith(('-', '*', '•')):
-                        ingredient = line[1:].strip()
-                    elif line[0].isdigit():
-                        if '.' in line:
-                            ingredient = line.split('.', 1)[1].strip()
-                        elif ')' in line:
-                            ingredient = line.split(')', 1)[1].strip()
-                        else:
-                            ingredient = line[2:].strip()
-                    else:
-                        ingredient = line
-                    
-                    if ingredient and len(ingredient) > 2:
-                        recipe['ingredients'].append(ingredient)
-            
-            # Parse steps - be more flexible
-            elif current_section == 'steps':
-                # Check for numbered steps
-                if line and line[0].isdigit() and len(line) > 2:
-                    # Extract step text
-                    if '.' in line:
-                        step_text = line.split('.', 1)[1].strip()
-                    elif ')' in line:
-                        step_text = line.split(')', 1)[1].strip()
-                    else:
-                        step_text = line[2:].strip()
-                    
-                    # Check if this is a real step (not a section header)
-                    if step_text and len(step_text) > 10 and not any(
-                        keyword in step_text.upper() for keyword in 
-                        ['INGREDIENTS', 'STEPS', 'TIPS', 'NUTRITION', 'RECIPE']
-                    ):
-                        recipe['steps'].append(f"Step {step_number}: {step_text}")
-                        step_number += 1
-                
-                # Also accept lines that look like steps but aren't numbered
-                elif len(line) > 20 and current_section == 'steps':
-                    # Check if it looks like a cooking instruction
-                    cooking_keywords = ['heat', 'cook', 'chop', 'mix', 'add', 'stir', 'boil', 'fry', 'bake', 'whisk']
-                    if any(keyword in line.lower() for keyword in cooking_keywords):
-                        recipe['steps'].append(f"Step {step_number}: {line}")
-                        step_number += 1
-        
-        # Check if steps are too generic
-        generic_patterns = ['prepare ingredients', 'cook as desired', 'serve and enjoy', 'follow instructions']
-        has_generic_steps = any(
-            any(pattern in step.lower() for pattern in generic_patterns)
-            for step in recipe['steps']
+        return recipe_result(job, parse_recipe_json(text))
+    except ValueError as e:
+        metrics.inc("parse_fallbacks", reason="invalid_json")
+        job.note(f"⚠️ Structured output rejected, using text parser: {str(e)[:100]}")
+        return parse_gemini_response(job, text)
+
+def recipe_result(job, recipe):
+    """Convert a parsed Recipe into the list stored in session state"""
+    # If still no good steps, flag it for the debug view
+    if len(recipe.steps) < 3:
+        job.note("⚠️ Could not parse detailed steps from Gemini response")
+    
+    return [recipe.to_dict()]
+
+def start_generation_job(detected, dietary_prefs, cuisine, meal_type, skill_level, client, model_name, variant_count, force_fresh, stream_output, structured_output, plan_size=0):
+    """Queue a generation for this session; the recipe area polls it"""
+    res = generation_resources()
+    if variant_count == 1 and not plan_size and not force_fresh:
+        cache_key = make_cache_key(detected, dietary_prefs, cuisine, meal_type, skill_level, model_name)
+        # Often filled by a prefetch, in which case there is nothing to wait for
+        cached = res.cache.get(cache_key) if res.cache.contains(cache_key) else None
+        if cached:
+            metrics.inc("cache_lookups", cache="recipes", result="hit")
+            st.session_state.recipes = cached
+            get_recipe_index().add_many(cached, time.time())
+            st.session_state.generation_status = ('success', "✅ Recipe generated!")
+            return
+        if adopt_prefetch(cache_key):
+            return
+    
+    args = (detected, dietary_prefs, cuisine, meal_type, skill_level, client, model_name)
+    job_key = None
+    if plan_size:
+        work = lambda job: generate_meal_plan_with_gemini(job, res, *args, plan_size, force_fresh=force_fresh, structured=structured_output)
+        variant_count = candidate_count(plan_size)
+    elif variant_count > 1:
+        work = lambda job: generate_recipe_variants(job, res, *args, variant_count, force_fresh=force_fresh, structured=structured_output)
+    elif stream_output and not structured_output:
+        work = lambda job: stream_recipes_with_gemini(job, res, *args, force_fresh=force_fresh)
+        # A stream has no single response to share, so identical requests share the job and its events
+        job_key = ('stream', make_cache_key(detected, dietary_prefs, cuisine, meal_type, skill_level, model_name), force_fresh)
+    else:
+        work = lambda job: generate_recipes_with_gemini(job, res, *args, force_fresh=force_fresh, structured=structured_output)
+    
+    try:
+        job = get_job_queue().submit(work, description=", ".join(detected), key=job_key)
+    except QueueFull:
+        st.warning("Too many recipes are being generated right now. Try again in a moment.")
+        return
+    job.variant_count = variant_count
+    st.session_state.generation_job = job.id
+
+# Speculative prefetch - once the pantry stops changing, generate it in the background
+PREFETCH_DELAY_SECONDS = 2.0
+PREFETCH_BUDGET = 5             # speculative generations per session...
+PREFETCH_WINDOW_SECONDS = 3600  # ...within this window
+
+def update_prefetch(cache_key):
+    """Track the pantry being typed; cancel speculative work for one the user moved away from"""
+    state = st.session_state.get('prefetch')
+    if state and state['key'] != cache_key:
+        if state['job'] and get_job_queue().cancel(state['job']):
+            metrics.inc("prefetch", outcome="cancelled")
+        state = None
+    if state is None and cache_key:
+        state = {'key': cache_key, 'since': time.time(), 'job': None, 'outcome': None}
+    st.session_state.prefetch = state
+    return state
+
+def start_prefetch(state, detected, dietary_prefs, cuisine, meal_type, skill_level, client, model_name, structured_output):
+    """Queue a low-priority generation whose only output is the cache entry"""
+    res = generation_resources()
+    if res.cache.contains(state['key']) or find_local_recipe(detected, dietary_prefs, cuisine, meal_type):
+        state['outcome'] = 'cached'
+        return
+    now = time.time()
+    spent = [t for t in st.session_state.get('prefetch_spent', []) if now - t < PREFETCH_WINDOW_SECONDS]
+    if len(spent) >= PREFETCH_BUDGET:
+        state['outcome'] = 'budget'
+        metrics.inc("prefetch", outcome="over_budget")
+        return
+    
+    args = (detected, dietary_prefs, cuisine, meal_type, skill_level, client, model_name)
+    try:
+        job = get_job_queue().submit(
+            lambda job: generate_recipes_with_gemini(job, res, *args, structured=structured_output),
+            description="prefetch: " + ", ".join(detected), low_priority=True
         )
-        
-        # If steps are generic or we have less than 3 steps, try to parse differently
-        if has_generic_steps or len(recipe['steps']) < 3:
-            # Try alternative parsing: look for paragraphs after STEPS:
-            in_steps = False
-            step_number = 1
-            recipe['steps'] = []
-            
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if 'STEPS:' in line.upper() or 'INSTRUCTIONS:' in line.upper():
-                    in_steps = True
-                    continue
-                elif 'TIPS:' in line.upper() or 'NUTRITION:' in line.upper():
-                    in_steps = False
-                    continue
-                
-                if in_steps and line:
-                    # Skip empty lines and section headers
-                    if len(line) > 15 and not any(
-                        keyword in line.upper() for keyword in 
-                        ['INGREDIENTS', 'STEPS', 'TIPS', 'NUTRITION', 'RECIPE']
-                    ):
-                        # Check if it's already numbered
-                        if line[0].isdigit() and line[1] in '. )':
-                            if '.' in line:
-                                step_text = line.split('.', 1)[1].strip()
-                            elif ')' in line:
-                                step_text = line.split(')', 1)[1].strip()
-                            else:
-                                step_text = line[2:].strip()
-                        else:
-                            step_text = line
-                        
-                        if step_text:
-                            recipe['steps'].append(f"Step {step_number}: {step_text}")
-                            step_number += 1
-        
-        # If still no good steps, show the raw response in debug
-        if len(recipe['steps']) < 3 and st.session_state.get('show_debug', False):
-            st.sidebar.warning("⚠️ Could not parse detailed steps from Gemini response")
-        
-        return [recipe]
-        
-    except Exception as e:
-        st.sidebar.error(f"Parsing error: {str(e)}")
-        return None
+    except QueueFull:
+        # No idle worker; try again after another delay
+        state['since'] = now
+        metrics.inc("prefetch", outcome="busy")
+        return
+    st.session_state.prefetch_spent = spent + [now]
+    state['job'] = job.id
+    metrics.inc("prefetch", outcome="started")
+
+@st.fragment(run_every=PREFETCH_DELAY_SECONDS / 2)
+def prefetch_when_settled(*args):
+    """Waits out the debounce on its own timer, since no input reruns the page meanwhile"""
+    state = st.session_state.get('prefetch')
+    if state and not state['job'] and not state['outcome'] and time.time() - state['since'] >= PREFETCH_DELAY_SECONDS:
+        start_prefetch(state, *args)
+
+def adopt_prefetch(cache_key):
+    """Let Generate wait on a speculative job for the same request instead of starting another"""
+    state = st.session_state.get('prefetch')
+    if not state or state['key'] != cache_key or not state['job']:
+        return False
+    job = get_job_queue().get(state['job'])
+    if job is None or job.status in ('failed', 'cancelled'):
+        return False
+    st.session_state.generation_job = job.id
+    job.variant_count = 1
+    state['job'], state['outcome'] = None, 'used'
+    metrics.inc("prefetch", outcome="used")
+    return True
+
+def cancel_generation_job(job_id):
+    get_job_queue().cancel(job_id)
+    st.session_state.generation_job = None
+    st.session_state.generation_status = ('info', "Generation cancelled")
+
+def finish_generation_job(job):
+    """Move a finished job's result into the session"""
+    st.session_state.generation_job = None
+    st.session_state.last_raw_response = getattr(job, 'raw_response', None)
+    st.session_state.generation_notes = job.notes
+    if job.status == 'done' and job.result:
+        st.session_state.recipes = job.result
+        get_recipe_index().add_many(job.result, time.time())
+        st.session_state.generation_status = ('success', getattr(job, 'summary', None) or "✅ Recipe generated!")
+    elif job.status == 'failed':
+        st.session_state.generation_status = ('error', f"Generation error: {job.error}")
+    elif job.status == 'done':
+        st.session_state.generation_status = ('error', "Failed to generate. Try again.")
+
+def render_job_progress(job):
+    """Partial results so far: variant names, or the streamed name, ingredients and steps"""
+    events = list(job.events)
+    variants = [value for kind, value in events if kind == 'variant']
+    if variants or getattr(job, 'variant_count', 1) > 1:
+        done = "\n".join(f"- ✅ {r.get('recipe_name', 'Recipe')}" for r in variants)
+        st.info(f"Created {len(variants)} of {job.variant_count} recipes\n{done}")
+        return
+    
+    name = next((value for kind, value in reversed(events) if kind == 'recipe_name'), None)
+    if not name:
+        return
+    st.markdown(f"### 📋 {name}")
+    ingredients = [value for kind, value in events if kind == 'ingredient']
+    if ingredients:
+        st.markdown("#### 🥗 Ingredients")
+        for value in ingredients:
+            st.markdown(f'<div class="ingredient-item">{value}</div>', unsafe_allow_html=True)
+    steps = [value for kind, value in events if kind == 'step']
+    if steps:
+        st.markdown("#### 👨‍🍳 Instructions")
+        for value in steps:
+            st.markdown(f'<div class="step-item">{value}</div>', unsafe_allow_html=True)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_generation_job():
+    """Live status of this session's job; reruns on its own until the job ends"""
+    job_id = st.session_state.get('generation_job')
+    job = get_job_queue().get(job_id) if job_id else None
+    if job is None or job.finished:
+        if job is not None:
+            finish_generation_job(job)
+        else:
+            # Finished jobs are pruned after a while; this one is gone
+            st.session_state.generation_job = None
+            st.session_state.generation_status = ('warning', "Generation expired before its result was picked up. Try again.")
+        # A full rerun shows the result and stops polling
+        st.rerun()
+    
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        state = "Waiting for a free worker" if job.status == 'queued' else "Creating recipe"
+        st.caption(f"⏳ {state}... {job.elapsed():.0f}s")
+    with col2:
+        st.button("✖️ Cancel", key=f"cancel_{job.id}", on_click=cancel_generation_job, args=(job.id,))
+    render_job_progress(job)
+
 # Main function
 def main():
     # Initialize session state
     init_session_state()
     
+    start_metrics_server()
+    
     # Initialize Gemini
-    gemini_info = init_gemini()
+    with metrics.span("init_gemini"):
+        gemini_info = init_gemini()
     gemini_client = None
     gemini_model_name = None
     
@@ -448,38 +674,41 @@ def main():
         st.markdown("---")
         
         # Debug
+        structured_output = st.checkbox("🧾 Structured JSON output", key="structured_output")
+        stream_output = st.checkbox("⚡ Stream response", value=True, key="stream_output", disabled=structured_output)
+        force_fresh = st.checkbox("♻️ Force fresh (skip cache)", key="force_fresh")
+        prefetch = st.checkbox("🔮 Prefetch while typing", key="prefetch_enabled",
+                               help="Start generating in the background once the ingredient list stops changing")
         show_debug = st.checkbox("🔧 Show Debug", key="show_debug")
         with st.sidebar:
-            if show_debug and st.session_state.get('raw_response'):
+            if show_debug and st.session_state.get('last_raw_response'):
                 st.markdown("### 🔍 Last Gemini Response")
-                st.text_area("", st.session_state.raw_response, height=200)
+                st.text_area("", st.session_state.last_raw_response, height=200)
+            if st.session_state.get('generation_job') and st.session_state.current_tab != "🧑‍🍳 Generate Recipes":
+                st.caption("⏳ A recipe is being generated in the background")
         
         # Clear buttons
         col1, col2 = st.columns(2)
         with col1:
-            if st.button("🧹 Clear", key="clear_btn"):
-                st.session_state.recipes = None
-                st.rerun()
+            st.button("🧹 Clear", key="clear_btn", on_click=clear_recipes)
         
         with col2:
-            if st.button("🔄 Reset", key="reset_btn"):
-                for key in list(st.session_state.keys()):
-                    del st.session_state[key]
-                st.rerun()
+            st.button("🔄 Reset", key="reset_btn", on_click=reset_session)
         
         st.caption("Built with Gemini AI")
     
     # Render based on tab
-    if st.session_state.current_tab == "🧑‍🍳 Generate Recipes":
-        render_generate_recipes(gemini_client, gemini_model_name, dietary_prefs, cuisine, meal_type, skill_level, show_debug)
-    elif st.session_state.current_tab == "💾 Saved Recipes":
-        render_saved_recipes()
-    elif st.session_state.current_tab == "🛒 Shopping List":
-        render_shopping_list()
-    elif st.session_state.current_tab == "⚙️ Settings":
-        render_settings()
-
-def render_generate_recipes(client, model_name, dietary_prefs, cuisine, meal_type, skill_level, show_debug):
+    with metrics.span("render_page", page=st.session_state.current_tab.split(" ", 1)[-1]):
+        if st.session_state.current_tab == "🧑‍🍳 Generate Recipes":
+            render_generate_recipes(gemini_client, gemini_model_name, dietary_prefs, cuisine, meal_type, skill_level, show_debug, force_fresh, stream_output, structured_output, prefetch)
+        elif st.session_state.current_tab == "💾 Saved Recipes":
+            render_saved_recipes()
+        elif st.session_state.current_tab == "🛒 Shopping List":
+            render_shopping_list()
+        elif st.session_state.current_tab == "⚙️ Settings":
+            render_settings()
+
+def render_generate_recipes(client, model_name, dietary_prefs, cuisine, meal_type, skill_level, show_debug, force_fresh=False, stream_output=False, structured_output=False, prefetch=False):
     """Render the recipe generation page"""
     st.markdown('<h1 class="main-header">🍳 Recipe Doctor</h1>', unsafe_allow_html=True)
     st.markdown('<p style="text-align: center; font-size: 1.2rem; color: #666;">AI Chef that creates recipes from your available ingredients</p>', unsafe_allow_html=True)
@@ -492,15 +721,23 @@ def render_generate_recipes(client, model_name, dietary_prefs, cuisine, meal_typ
     
     with col1:
         ingredient_text = st.text_area(
-            "List ingredients (separate with commas)",
+            "List ingredients (commas, new lines or \"and\")",
             placeholder="eggs, milk, bread, cheese...",
             height=100,
             key="ingredient_input"
         )
+        
+        photo = st.file_uploader("📷 Or upload a photo of your fridge", type=["jpg", "jpeg", "png", "webp"], key="photo_upload")
+        if photo is not None:
+            st.button("🔍 Detect ingredients", key="detect_btn", on_click=detect_photo_ingredients,
+                      args=(client, model_name), disabled=not client)
+        status = st.session_state.pop('photo_status', None)
+        if status:
+            getattr(st, status[0])(status[1])
     
     with col2:
         if ingredient_text:
-            ingredients = [x.strip() for x in ingredient_text.split(',') if x.strip()]
+            ingredients = detect_ingredients_from_text(ingredient_text)
             st.session_state.ingredients = ingredients
             
             st.write("### Your Ingredients")
@@ -514,35 +751,73 @@ def render_generate_recipes(client, model_name, dietary_prefs, cuisine, meal_typ
         st.markdown("---")
         st.subheader("🚀 Generate Recipe")
         
-        if st.button("🧠 Generate with AI", type="primary", use_container_width=True, key="generate_btn"):
-            with st.spinner("Creating recipe..."):
-                detected = detect_ingredients_from_text(ingredient_text)
-                
-                if client:
-                    recipes = generate_recipes_with_gemini(
-                        detected,
-                        dietary_prefs,
-                        cuisine,
-                        meal_type,
-                        skill_level,
-                        client,
-                        model_name
-                    )
-                    
-                    if recipes:
-                        st.session_state.recipes = recipes
-                        st.success("✅ Recipe generated!")
-                    else:
-                        st.error("Failed to generate. Try again.")
-                else:
-                    st.error("API not available. Check settings.")
+        plan_mode = st.toggle("📅 Meal plan", key="plan_mode",
+                              help="Several recipes that share ingredients, for a shorter shopping list")
+        if plan_mode:
+            plan_size = st.number_input("Recipes in the plan", min_value=2, max_value=MAX_PLAN_SIZE, value=7, key="plan_size")
+            variant_count = 1
+        else:
+            plan_size = 0
+            variant_count = st.select_slider(
+                "Recipes to generate",
+                options=list(range(1, len(VARIANTS) + 1)),
+                key="variant_count"
+            )
+        
+        job_active = bool(st.session_state.get('generation_job'))
+        if st.button("🧠 Generate with AI", type="primary", use_container_width=True, key="generate_btn", disabled=job_active):
+            detected = detect_ingredients_from_text(ingredient_text)
+            
+            # A saved or earlier recipe that fits the pantry skips the API call
+            recipes = None if force_fresh or variant_count > 1 or plan_size else find_local_recipe(detected, dietary_prefs, cuisine, meal_type)
+            
+            if recipes:
+                st.session_state.recipes = recipes
+                st.info("📚 Found a matching recipe you already have. Tick \"Force fresh\" for a new one.")
+            elif client:
+                start_generation_job(detected, dietary_prefs, cuisine, meal_type, skill_level, client, model_name,
+                                     variant_count, force_fresh, stream_output, structured_output, plan_size)
+            else:
+                st.error("API not available. Check settings.")
+        
+        # Generation runs in the background; only this part reruns while it does
+        if st.session_state.get('generation_job'):
+            render_generation_job()
+        status = st.session_state.pop('generation_status', None)
+        if status:
+            getattr(st, status[0])(status[1])
+        for note in st.session_state.pop('generation_notes', []):
+            st.warning(note)
+        
+        # Speculative generation for the single-recipe request Generate would make
+        speculate = (prefetch and client and variant_count == 1 and not plan_size and not force_fresh
+                     and not st.session_state.get('generation_job'))
+        detected = st.session_state.ingredients
+        state = update_prefetch(
+            make_cache_key(detected, dietary_prefs, cuisine, meal_type, skill_level, model_name) if speculate else None
+        )
+        if state and not state['job'] and not state['outcome']:
+            prefetch_when_settled(detected, dietary_prefs, cuisine, meal_type, skill_level, client, model_name, structured_output)
+    else:
+        update_prefetch(None)
     
     # Display Recipes
     if st.session_state.recipes:
         st.markdown("---")
-        st.subheader("🍽️ Your Recipe")
+        st.subheader("🍽️ Your Recipe" if len(st.session_state.recipes) == 1 else "🍽️ Your Recipes")
+        if len(st.session_state.recipes) > 1:
+            st.button("🛒 Add all to List", key="shop_all", on_click=add_all_to_shopping_list)
+            status = st.session_state.pop('shop_all_status', None)
+            if status:
+                getattr(st, status[0])(status[1])
+        
+        # Per-serving nutrition for every recipe shown, in one vectorized pass
+        per_serving, coverage = nutrition_batch(st.session_state.recipes)
         
         for idx, recipe in enumerate(st.session_state.recipes):
+            # Ingredient amounts follow the chosen serving count
+            recipe = displayed_recipe(recipe, idx)
+            
             # Recipe card
             st.markdown(f"""
             <div class="recipe-card">
@@ -556,6 +831,8 @@ def render_generate_recipes(client, model_name, dietary_prefs, cuisine, meal_typ
             </div>
             """, unsafe_allow_html=True)
             
+            st.number_input("👥 Servings", min_value=1, max_value=50, value=servings_of(recipe), key=servings_key(recipe, idx))
+            
             # Ingredients
             st.markdown("#### 🥗 Ingredients")
             for ing in recipe.get('ingredients', []):
@@ -573,127 +850,239 @@ def render_generate_recipes(client, model_name, dietary_prefs, cuisine, meal_typ
             with col1:
                 st.info(f"💡 **Tip:** {recipe.get('tips', '')}")
             with col2:
-                st.info(f"📊 **Nutrition:** {recipe.get('nutrition', '')}")
-            
-            # Action buttons - FIXED
-            st.markdown("#### 🛠️ Actions")
-            col_save, col_shop, col_new = st.columns(3)
-            
-            with col_save:
-                if st.button(f"💾 Save", key=f"save_{idx}", use_container_width=True):
-                    if 'saved_recipes' not in st.session_state:
-                        st.session_state.saved_recipes = []
-                    
-                    # Check if already saved
-                    existing = [r.get('recipe_name', '') for r in st.session_state.saved_recipes]
-                    if recipe.get('recipe_name', '') not in existing:
-                        import copy
-                        st.session_state.saved_recipes.append(copy.deepcopy(recipe))
-                        st.success("Saved!")
-                        st.balloons()
-                        time.sleep(0.5)
-                        st.rerun()
-                    else:
-                        st.info("Already saved")
-            
-            with col_shop:
-                if st.button(f"🛒 Add to List", key=f"shop_{idx}", use_container_width=True):
-                    if 'shopping_list' not in st.session_state:
-                        st.session_state.shopping_list = []
-                    
-                    added = 0
-                    for ing in recipe.get('ingredients', []):
-                        if ing not in st.session_state.shopping_list:
-                            st.session_state.shopping_list.append(ing)
-                            added += 1
-                    
-                    if added > 0:
-                        st.success(f"Added {added} items")
-                    else:
-                        st.info("No new items")
-                    
-                    time.sleep(0.5)
-                    st.rerun()
+                facts = as_facts(per_serving[idx], coverage[idx], len(recipe.get('ingredients', [])))
+                # Partial estimates stand out so nobody takes them as the full count
+                show = st.info if facts['coverage'] >= 1 or not facts['coverage'] else st.warning
+                show(f"📊 **Nutrition:** {format_nutrition(facts)}")
             
-            with col_new:
-                if st.button(f"🔄 New", key=f"new_{idx}", use_container_width=True):
-                    st.session_state.recipes = None
-                    st.rerun()
+            # Action buttons - a fragment, so saving or adding to the list reruns only this row
+            render_recipe_actions(recipe, idx)
             
             st.markdown("---")
 
+def servings_key(recipe, idx):
+    return f"servings_{idx}_{recipe.get('recipe_name', '')}"
+
+def displayed_recipe(recipe, idx):
+    """The recipe as shown, with amounts for the chosen serving count"""
+    return scale_recipe(recipe, st.session_state.get(servings_key(recipe, idx), servings_of(recipe)))
+
+# Button callbacks - they run before the rerun they trigger, so nothing needs st.rerun()
+def go_to(tab):
+    """Switch pages; the nav radio reads its new value on the next run"""
+    st.session_state.nav_radio = tab
+
+def clear_recipes():
+    st.session_state.recipes = None
+
+def reset_session():
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+
+def delete_saved_recipe(recipe_id, recipe):
+    get_store().delete_recipe(recipe_id)
+    get_recipe_index().remove(recipe)
+
+def clear_saved_recipes():
+    store = get_store()
+    _, saved = store.search_recipes(limit=max(store.count_recipes(), 1))
+    store.clear_recipes()
+    index = get_recipe_index()
+    for _, recipe in saved:
+        index.remove(recipe)
+
+def save_recipe(recipe, idx):
+    # Near-duplicates count as saved; a different recipe with a taken name gets a numbered one
+    store = get_store()
+    if store.save_recipe(recipe):
+        get_recipe_index().add(recipe)
+        st.session_state[f"action_status_{idx}"] = ('success', "Saved!")
+        st.session_state.celebrate = True
+        return
+    similar = store.find_similar(recipe)
+    if similar and similar[1] != recipe.get('recipe_name'):
+        metrics.inc("near_duplicates", where="saved")
+        st.session_state[f"action_status_{idx}"] = ('info', f"Already saved as {similar[1]} ({similar[2]:.0%} alike)")
+    else:
+        st.session_state[f"action_status_{idx}"] = ('info', "Already saved")
+
+def add_to_shopping_list(recipe, idx):
+    # Amounts of items already on the list are merged, not repeated
+    added, merged = get_store().add_list_items(recipe.get('ingredients', []))
+    if added or merged:
+        st.session_state[f"action_status_{idx}"] = ('success', f"Added {added} items, updated {merged}")
+    else:
+        st.session_state[f"action_status_{idx}"] = ('info', "No new items")
+
+def add_all_to_shopping_list():
+    # One merge for the whole plan, so shared items become a single line
+    lines = [line for idx, recipe in enumerate(st.session_state.recipes)
+             for line in displayed_recipe(recipe, idx).get('ingredients', [])]
+    added, merged = get_store().add_list_items(lines)
+    st.session_state.shop_all_status = ('success', f"Added {added} items, updated {merged}")
+
+def view_saved_recipe(recipe):
+    st.session_state.recipes = [recipe]
+    go_to("🧑‍🍳 Generate Recipes")
+
+def set_page(state_key, page):
+    st.session_state[state_key] = page
+
+def toggle_list_item(item_id):
+    get_store().set_checked(item_id, st.session_state[f"check_{item_id}"])
+
+def rerun_if_navigating():
+    """Fragments only redraw themselves; leaving the page needs a full run"""
+    if st.session_state.get('nav_radio', st.session_state.current_tab) != st.session_state.current_tab:
+        st.rerun()
+
+@st.fragment
+def render_recipe_actions(recipe, idx):
+    """Save / Add to List / New for one recipe"""
+    if not st.session_state.recipes:
+        # "New" cleared the recipes this row belongs to
+        st.rerun()
+    
+    st.markdown("#### 🛠️ Actions")
+    col_save, col_shop, col_new = st.columns(3)
+    
+    with col_save:
+        st.button("💾 Save", key=f"save_{idx}", use_container_width=True, on_click=save_recipe, args=(recipe, idx))
+    
+    with col_shop:
+        st.button("🛒 Add to List", key=f"shop_{idx}", use_container_width=True, on_click=add_to_shopping_list, args=(recipe, idx))
+    
+    with col_new:
+        st.button("🔄 New", key=f"new_{idx}", use_container_width=True, on_click=clear_recipes)
+    
+    status = st.session_state.pop(f"action_status_{idx}", None)
+    if status:
+        getattr(st, status[0])(status[1])
+    if st.session_state.pop('celebrate', False):
+        st.balloons()
+
+SAVED_PAGE_SIZE = 20
+LIST_PAGE_SIZE = 50
+
+def render_pager(total, page_size, state_key):
+    """Prev/next controls; returns the (offset, limit) of the current page"""
+    pages = max(1, -(-total // page_size))
+    page = min(st.session_state.get(state_key, 0), pages - 1)
+    st.session_state[state_key] = page
+    if pages > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("◀ Prev", key=f"{state_key}_prev", disabled=page == 0,
+                      on_click=set_page, args=(state_key, page - 1))
+        with col2:
+            st.caption(f"Page {page + 1} of {pages}")
+        with col3:
+            st.button("Next ▶", key=f"{state_key}_next", disabled=page >= pages - 1,
+                      on_click=set_page, args=(state_key, page + 1))
+    return page * page_size, page_size
+
 def render_saved_recipes():
     """Render saved recipes page"""
     st.markdown('<h1 class="main-header">💾 Saved Recipes</h1>', unsafe_allow_html=True)
+    render_saved_list()
+
+@st.fragment
+def render_saved_list():
+    """Search, paging, View and Delete rerun only this part of the page"""
+    rerun_if_navigating()
+    store = get_store()
+    saved = store.count_recipes()
     
-    if 'saved_recipes' not in st.session_state:
-        st.session_state.saved_recipes = []
-    
-    if st.session_state.saved_recipes:
-        st.write(f"### You have {len(st.session_state.saved_recipes)} saved recipes")
+    if saved:
+        st.write(f"### You have {saved} saved recipes")
+        
+        query = st.text_input("🔍 Search", placeholder="Name, ingredient or technique", key="saved_query")
+        with st.expander("Filters"):
+            col1, col2 = st.columns(2)
+            with col1:
+                include = st.text_input("Must include", placeholder="e.g. eggs, spinach", key="saved_include")
+                max_prep = st.number_input("Max prep time (min, 0 = any)", min_value=0, step=5, key="saved_max_prep")
+            with col2:
+                exclude = st.text_input("Must not include", placeholder="e.g. nuts", key="saved_exclude")
+                max_cook = st.number_input("Max cook time (min, 0 = any)", min_value=0, step=5, key="saved_max_cook")
+        
+        # A new search starts back on the first page
+        search = (query, include, exclude, max_prep, max_cook)
+        if st.session_state.get('saved_search') != search:
+            st.session_state.saved_search = search
+            st.session_state.saved_page = 0
+        
+        def search_page(offset, limit):
+            return store.search_recipes(
+                query, split_list(include), split_list(exclude),
+                max_prep or None, max_cook or None, offset, limit
+            )
         
-        for i, recipe in enumerate(st.session_state.saved_recipes):
+        page = st.session_state.get('saved_page', 0)
+        total, results = search_page(page * SAVED_PAGE_SIZE, SAVED_PAGE_SIZE)
+        if total != saved:
+            st.caption(f"{total} matching recipes")
+        offset, limit = render_pager(total, SAVED_PAGE_SIZE, 'saved_page')
+        if offset != page * SAVED_PAGE_SIZE:
+            # The requested page is past the end, e.g. after deleting
+            total, results = search_page(offset, limit)
+        if not results:
+            st.info("No saved recipes match")
+        
+        for i, (recipe_id, recipe) in enumerate(results, offset):
             with st.expander(f"{i+1}. {recipe.get('recipe_name', 'Recipe')}"):
                 st.write(f"**Difficulty:** {recipe.get('difficulty', 'Easy')}")
                 st.write(f"**Time:** {recipe.get('prep_time', '')} + {recipe.get('cook_time', '')}")
                 
                 col1, col2 = st.columns(2)
                 with col1:
-                    if st.button("View", key=f"view_{i}"):
-                        st.session_state.recipes = [recipe]
-                        st.session_state.current_tab = "🧑‍🍳 Generate Recipes"
-                        st.rerun()
+                    st.button("View", key=f"view_{recipe_id}", on_click=view_saved_recipe, args=(recipe,))
                 with col2:
-                    if st.button("Delete", key=f"delete_{i}"):
-                        st.session_state.saved_recipes.pop(i)
-                        st.rerun()
+                    st.button("Delete", key=f"delete_{recipe_id}", on_click=delete_saved_recipe, args=(recipe_id, recipe))
         
-        if st.button("Clear All", type="secondary"):
-            st.session_state.saved_recipes = []
-            st.rerun()
+        st.button("Clear All", type="secondary", on_click=clear_saved_recipes)
     else:
         st.info("No saved recipes")
-        if st.button("Go Generate Recipes"):
-            st.session_state.current_tab = "🧑‍🍳 Generate Recipes"
-            st.rerun()
+        st.button("Go Generate Recipes", on_click=go_to, args=("🧑‍🍳 Generate Recipes",))
 
 def render_shopping_list():
     """Render shopping list page"""
     st.markdown('<h1 class="main-header">🛒 Shopping List</h1>', unsafe_allow_html=True)
+    render_list_items()
+
+@st.fragment
+def render_list_items():
+    """Ticking, removing and paging rerun only this part of the page"""
+    rerun_if_navigating()
+    store = get_store()
+    total = store.count_list_items()
     
-    if 'shopping_list' not in st.session_state:
-        st.session_state.shopping_list = []
-    
-    if st.session_state.shopping_list:
-        st.write(f"### {len(st.session_state.shopping_list)} items")
+    if total:
+        st.write(f"### {total} items")
         
-        checked = []
-        for i, item in enumerate(st.session_state.shopping_list):
+        offset, limit = render_pager(total, LIST_PAGE_SIZE, 'list_page')
+        current_aisle = None
+        for item_id, item, checked, aisle in store.list_items(offset, limit):
+            if aisle != current_aisle:
+                st.markdown(f"**{aisle}**")
+                current_aisle = aisle
             col1, col2 = st.columns([8, 1])
             with col1:
-                if st.checkbox(f"• {item}", key=f"check_{i}"):
-                    checked.append(i)
+                st.checkbox(f"• {item}", value=checked, key=f"check_{item_id}",
+                            on_change=toggle_list_item, args=(item_id,))
             with col2:
-                if st.button("🗑️", key=f"remove_{i}"):
-                    st.session_state.shopping_list.pop(i)
-                    st.rerun()
+                st.button("🗑️", key=f"remove_{item_id}", on_click=store.remove_list_item, args=(item_id,))
         
         col1, col2 = st.columns(2)
         with col1:
-            if checked and st.button("Remove Checked"):
-                for i in sorted(checked, reverse=True):
-                    st.session_state.shopping_list.pop(i)
-                st.rerun()
+            if store.count_checked():
+                st.button("Remove Checked", on_click=store.remove_checked)
         
         with col2:
-            if st.button("Clear All"):
-                st.session_state.shopping_list = []
-                st.rerun()
+            st.button("Clear All", on_click=store.clear_list)
     else:
         st.info("Shopping list is empty")
-        if st.button("Go Generate Recipes"):
-            st.session_state.current_tab = "🧑‍🍳 Generate Recipes"
-            st.rerun()
+        st.button("Go Generate Recipes", on_click=go_to, args=("🧑‍🍳 Generate Recipes",))
 
 def render_settings():
     """Render settings page"""
@@ -709,9 +1098,82 @@ def render_settings():
     st.write("### Stats")
     col1, col2 = st.columns(2)
     with col1:
-        st.metric("Saved Recipes", len(st.session_state.get('saved_recipes', [])))
+        st.metric("Saved Recipes", get_store().count_recipes())
+    with col2:
+        st.metric("Shopping List", get_store().count_list_items())
+    
+    st.write("### Recipe Cache")
+    cache = get_recipe_cache()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Hits", cache.stats['memory_hits'] + cache.stats['disk_hits'])
+    with col2:
+        st.metric("Misses", cache.stats['misses'])
+    with col3:
+        st.metric("Hit Rate", f"{cache.hit_rate():.0%}")
+    with col4:
+        st.metric("Near-duplicates", cache.stats['near_duplicates'])
+    
+    # Streamed requests coalesce by sharing a job rather than a call
+    shared = get_single_flight().stats['shared'] + get_job_queue().stats['shared']
+    st.metric("API calls saved by coalescing", shared)
+    
+    if st.button("Clear Cache", key="clear_cache_btn"):
+        cache.clear()
+        # Generated recipes go with it; saved ones stay matchable
+        index = get_recipe_index()
+        index.clear()
+        fill_recipe_index(index)
+        st.success("Cache cleared")
+    
+    st.write("### Token Usage")
+    usage = get_token_usage()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Requests", usage.requests)
     with col2:
-        st.metric("Shopping List", len(st.session_state.get('shopping_list', [])))
+        st.metric("Avg Prompt Tokens", f"{usage.average('prompt'):.0f}")
+    with col3:
+        st.metric("Avg Output Tokens", f"{usage.average('output'):.0f}")
+    with col4:
+        st.metric("Total Tokens", usage.totals['total'])
+    
+    render_performance_panel()
+
+def render_performance_panel():
+    """Per-phase latency percentiles and counters from the metrics registry"""
+    st.write("### Performance")
+    rows = [
+        {
+            "Phase": labels.get("phase", ""),
+            "Labels": ", ".join(f"{k}={v}" for k, v in labels.items() if k != "phase"),
+            "Count": count,
+            "Mean (ms)": round(mean * 1000, 1),
+            "p50 (ms)": round(p[0.5] * 1000, 1),
+            "p95 (ms)": round(p[0.95] * 1000, 1),
+            "p99 (ms)": round(p[0.99] * 1000, 1),
+        }
+        for labels, count, mean, p in metrics.REGISTRY.latency_summary()
+    ]
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("No timings recorded yet")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        lookups = metrics.REGISTRY.counter_values("cache_lookups")
+        hits = sum(v for labels, v in lookups.items() if ("result", "hit") in labels)
+        st.metric("Cache Hits", hits, help="Recipe, local index and photo caches")
+    with col2:
+        st.metric("Parse Fallbacks", sum(metrics.REGISTRY.counter_values("parse_fallbacks").values()))
+    with col3:
+        failed = sum(v for labels, v in metrics.REGISTRY.counter_values("gemini_requests").items()
+                     if ("outcome", "ok") not in labels)
+        st.metric("Gemini Errors", failed)
+    
+    with st.expander("Prometheus export"):
+        st.code(metrics.REGISTRY.export_text(), language="text")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
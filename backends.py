@@ -0,0 +1,353 @@
+"""Pluggable Gemini backends: the real client, a local fake, and record/replay cassettes
+
+Every backend returns an object with the same .models.generate_content and
+.models.generate_content_stream calls the app already makes on genai.Client,
+so ModelResolver, ResilientClient and the parsers run unchanged on top of it.
+Pick one with RECIPE_DOCTOR_BACKEND:
+
+    gemini          the real API (default)
+    fake            canned recipes built from the request, no network or key
+    record[:dir]    the real API, saving every response under dir
+    replay[:dir]    responses saved by record, looked up by request hash
+
+The fake reads RECIPE_DOCTOR_FAKE_LATENCY (seconds per call),
+RECIPE_DOCTOR_FAKE_ERROR_RATE (share of calls that fail with a retryable
+503) and RECIPE_DOCTOR_FAKE_SEED. Its responses depend only on the request,
+so the same request always gets the same recipe.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from google import genai
+
+BACKEND_ENV = "RECIPE_DOCTOR_BACKEND"
+DEFAULT_CASSETTE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "cassettes")
+
+# Streamed fake responses are cut into chunks of about this many characters
+FAKE_CHUNK_SIZE = 40
+
+
+class FakeAPIError(Exception):
+    """Injected failure; carries an HTTP code like google.genai's APIError"""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class CassetteMiss(LookupError):
+    """Replay found no recorded response for a request"""
+
+
+class Usage:
+    """Stand-in for response.usage_metadata"""
+
+    def __init__(self, prompt_token_count=0, candidates_token_count=0, total_token_count=0,
+                 cached_content_token_count=None):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = total_token_count
+        self.cached_content_token_count = cached_content_token_count
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class Response:
+    """Stand-in for a GenerateContentResponse: just text and usage"""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class BackendClient:
+    """Anything with a genai-style .models"""
+
+    def __init__(self, models):
+        self.models = models
+
+
+# Request identity shared by the fake and the cassettes
+def _jsonable(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, bytes):
+        return hashlib.sha256(value).hexdigest()
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, 'model_dump'):
+        return _jsonable(value.model_dump(exclude_none=True))
+    return repr(value)
+
+
+def request_key(model, contents, config=None):
+    """Stable hash of a request; the per-attempt HTTP timeout is left out"""
+    if isinstance(config, dict):
+        config = {k: v for k, v in config.items() if k != 'http_options'}
+    payload = json.dumps([model, _jsonable(contents), _jsonable(config)], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _prompt_text(contents):
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(part for part in contents if isinstance(part, str))
+
+
+class FakeModels:
+    """Deterministic recipes built from the prompt, with optional latency and errors"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, chunk_size=FAKE_CHUNK_SIZE, sleep=time.sleep):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self._sleep = sleep
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config=None):
+        self._begin()
+        return Response(*self._respond(model, contents, config))
+
+    def generate_content_stream(self, model, contents, config=None):
+        self._begin()
+        text, usage = self._respond(model, contents, config)
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        # Like the API, only the last chunk carries usage
+        for piece in pieces[:-1]:
+            yield Response(piece)
+        yield Response(pieces[-1], usage)
+
+    def _begin(self):
+        with self._lock:
+            self.calls += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+        if self.latency:
+            self._sleep(self.latency)
+        if failed:
+            raise FakeAPIError(503, "UNAVAILABLE (injected by the fake backend)")
+
+    def _respond(self, model, contents, config):
+        config = config if isinstance(config, dict) else {}
+        prompt = _prompt_text(contents)
+        rng = random.Random(request_key(model, contents, config))
+        schema = config.get('response_schema') or {}
+
+        plan = _requested_count(prompt)
+        if prompt.strip() == "Test":
+            text = "OK"
+        elif schema.get('type') == 'ARRAY' and schema.get('items', {}).get('type') != 'OBJECT':
+            # Photo detection
+            text = json.dumps(rng.sample(_PHOTO_ITEMS, rng.randint(3, 6)))
+        elif plan:
+            recipes = [_fake_recipe(_plan_ingredients(prompt, rng), rng) for _ in range(plan)]
+            if config.get('response_mime_type') == "application/json":
+                text = json.dumps(recipes)
+            else:
+                text = "\n\n".join(_recipe_text(recipe) for recipe in recipes)
+        elif config.get('response_mime_type') == "application/json":
+            text = json.dumps(_fake_recipe(_requested_ingredients(prompt), rng))
+        else:
+            text = _recipe_text(_fake_recipe(_requested_ingredients(prompt), rng))
+
+        prompt_tokens = len(prompt) // 4 + len(str(config.get('system_instruction', ''))) // 4
+        output_tokens = len(text) // 4
+        return text, Usage(prompt_tokens, output_tokens, prompt_tokens + output_tokens)
+
+
+_PHOTO_ITEMS = [
+    "eggs", "milk", "butter", "cheddar cheese", "tomato", "spinach", "carrot", "onion",
+    "bell pepper", "chicken breast", "yogurt", "lemon", "apple", "broccoli", "mushroom",
+]
+_PLAN_EXTRAS = [
+    "zucchini", "chickpeas", "feta cheese", "cilantro", "ginger", "sweet potato", "cabbage",
+    "lentils", "corn", "yogurt", "basil", "cucumber", "ground beef", "shrimp", "avocado",
+]
+_QUANTITIES = ["1 cup", "2 cups", "1/2 cup", "200 g", "2"]
+_DISHES = ["Skillet", "Stir-Fry", "Bake", "Bowl", "Hash", "Frittata", "Soup", "Wraps"]
+
+
+def _requested_ingredients(prompt):
+    match = re.search(r"^Ingredients:\s*(.+)$", prompt, re.MULTILINE)
+    names = [name.strip() for name in match.group(1).split(",")] if match else []
+    return [name for name in names if name] or ["eggs"]
+
+
+def _requested_count(prompt):
+    """Recipes asked for by a meal-plan request, or 0"""
+    match = re.search(r"^Recipes:\s*(\d+)", prompt, re.MULTILINE)
+    return int(match.group(1)) if match else 0
+
+
+def _plan_ingredients(prompt, rng):
+    """Part of the pantry plus a few extras, taken from the preferred ones when given"""
+    pantry = _requested_ingredients(prompt)
+    match = re.search(r"^Prefer these ingredients:\s*(.+)$", prompt, re.MULTILINE)
+    preferred = [name.strip() for name in match.group(1).split(",")] if match else []
+    extras = preferred or _PLAN_EXTRAS
+    return (rng.sample(pantry, rng.randint(1, len(pantry)))
+            + rng.sample(extras, min(len(extras), rng.randint(1, 3))))
+
+
+def _fake_recipe(ingredients, rng):
+    main = ingredients[0]
+    others = ingredients[1:] or ["onion"]
+    prep, cook = rng.choice([5, 10, 15]), rng.choice([10, 15, 20, 25])
+    steps = [
+        f"Chop the {main} into bite-sized pieces, about 2 minutes",
+        "Heat 2 tbsp oil in a large pan over medium heat for 1 minute",
+        f"Add the {main} and cook for {rng.randint(4, 8)} minutes, stirring occasionally",
+        f"Stir in the {', '.join(others)} and cook for {rng.randint(3, 6)} more minutes",
+        "Season with salt and pepper and cook 1 minute until fragrant",
+        "Rest for 2 minutes off the heat before serving",
+    ]
+    return {
+        "recipe_name": f"{main.title()} {rng.choice(_DISHES)}",
+        "difficulty": rng.choice(["Easy", "Medium"]),
+        "prep_time_minutes": prep,
+        "cook_time_minutes": cook,
+        "servings": rng.choice([2, 4]),
+        "ingredients": [{"quantity": rng.choice(_QUANTITIES), "item": name} for name in ingredients]
+                       + [{"quantity": "2 tbsp", "item": "oil"}],
+        "steps": steps,
+        "tips": f"Pat the {main} dry first so it browns instead of steaming.",
+    }
+
+
+def _recipe_text(recipe):
+    """The same recipe in the layout TEXT_SYSTEM_INSTRUCTION asks for"""
+    lines = [
+        f"RECIPE NAME: {recipe['recipe_name']}",
+        f"DIFFICULTY: {recipe['difficulty']}",
+        f"PREP TIME: {recipe['prep_time_minutes']} minutes",
+        f"COOK TIME: {recipe['cook_time_minutes']} minutes",
+        f"SERVINGS: {recipe['servings']}",
+        "INGREDIENTS:",
+    ]
+    lines += [f"- {item['quantity']} {item['item']}" for item in recipe['ingredients']]
+    lines.append("STEPS:")
+    lines += [f"{i}. {step}" for i, step in enumerate(recipe['steps'], 1)]
+    lines.append(f"TIPS: {recipe['tips']}")
+    return "\n".join(lines)
+
+
+class Cassette:
+    """Recorded responses, one JSON file per request hash"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def save(self, key, model, chunks):
+        entry = {
+            "model": model,
+            "chunks": [
+                {"text": chunk.text, "usage": _usage_dict(getattr(chunk, 'usage_metadata', None))}
+                for chunk in chunks
+            ],
+        }
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    def load(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            raise CassetteMiss(f"no recorded response for request {key[:12]}") from None
+        return [
+            Response(chunk["text"], Usage(**chunk["usage"]) if chunk["usage"] else None)
+            for chunk in entry["chunks"]
+        ]
+
+
+def _usage_dict(usage):
+    if usage is None:
+        return None
+    return {field: getattr(usage, field, None) for field in (
+        "prompt_token_count", "candidates_token_count", "total_token_count", "cached_content_token_count"
+    )}
+
+
+class RecordingModels:
+    """Passes calls through and saves each complete response"""
+
+    def __init__(self, models, cassette):
+        self._models = models
+        self.cassette = cassette
+
+    def generate_content(self, model, contents, config=None):
+        response = self._models.generate_content(model=model, contents=contents, config=config)
+        self.cassette.save(request_key(model, contents, config), model, [response])
+        return response
+
+    def generate_content_stream(self, model, contents, config=None):
+        chunks = []
+        for chunk in self._models.generate_content_stream(model=model, contents=contents, config=config):
+            chunks.append(chunk)
+            yield chunk
+        # Only streams that ran to the end are worth replaying
+        self.cassette.save(request_key(model, contents, config), model, chunks)
+
+
+class ReplayModels:
+    """Answers from a cassette; unknown requests raise CassetteMiss"""
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    def generate_content(self, model, contents, config=None):
+        chunks = self.cassette.load(request_key(model, contents, config))
+        if len(chunks) == 1:
+            return chunks[0]
+        # Recorded as a stream: join it back into one response
+        return Response("".join(chunk.text or "" for chunk in chunks), chunks[-1].usage_metadata)
+
+    def generate_content_stream(self, model, contents, config=None):
+        yield from self.cassette.load(request_key(model, contents, config))
+
+
+def backend_spec(spec=None):
+    """(name, argument) from a spec like "replay:fixtures/cassettes" or the environment"""
+    spec = spec or os.environ.get(BACKEND_ENV) or "gemini"
+    name, _, argument = spec.partition(":")
+    name = name.strip().lower()
+    if name not in ("gemini", "fake", "record", "replay"):
+        raise ValueError(f"unknown {BACKEND_ENV} backend {name!r}")
+    return name, argument.strip()
+
+
+def needs_api_key(spec=None):
+    return backend_spec(spec)[0] in ("gemini", "record")
+
+
+def create_client(api_key=None, spec=None):
+    """A genai-compatible client for the configured backend"""
+    name, argument = backend_spec(spec)
+    if name == "gemini":
+        return genai.Client(api_key=api_key)
+    if name == "fake":
+        return BackendClient(FakeModels(
+            latency=float(os.environ.get("RECIPE_DOCTOR_FAKE_LATENCY", 0)),
+            error_rate=float(os.environ.get("RECIPE_DOCTOR_FAKE_ERROR_RATE", 0)),
+            seed=int(os.environ.get("RECIPE_DOCTOR_FAKE_SEED", 0)),
+        ))
+    cassette = Cassette(argument or DEFAULT_CASSETTE_DIR)
+    if name == "record":
+        return BackendClient(RecordingModels(genai.Client(api_key=api_key).models, cassette))
+    return BackendClient(ReplayModels(cassette))
@@ -0,0 +1,267 @@
+"""Headless batch recipe generation
+
+Reads a JSONL file of pantry requests, one per line:
+
+    {"ingredients": ["eggs", "milk", "bread"], "cuisine": "Italian", "meal_type": "Breakfast"}
+
+and writes parsed recipes to JSONL or SQLite (chosen by the output extension).
+Completed requests are read back from the output on start-up, so an
+interrupted run picks up where it stopped without paying for them again.
+
+Usage:
+    python batch_generate.py pantry.jsonl -o recipes.jsonl --workers 8 --rpm 60
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from backends import create_client, needs_api_key
+from gemini_client import ModelResolver, ResilientClient
+from prompts import TokenUsage
+from recipe_cache import RecipeCache, make_cache_key
+from recipe_generator import generate_recipe
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+
+class RateLimiter:
+    """Spaces request starts evenly so no more than rpm begin per minute"""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def parse_ingredients(value):
+    """Accept a list or a comma-separated string"""
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(x).strip() for x in value or [] if str(x).strip()]
+
+
+def request_key(item, model_name):
+    return make_cache_key(
+        parse_ingredients(item.get('ingredients')),
+        item.get('dietary_prefs', []),
+        item.get('cuisine', 'Any'),
+        item.get('meal_type', 'Any'),
+        item.get('skill_level', 'Beginner'),
+        model_name
+    )
+
+
+def _drop_partial_line(path, chunk_size=4096):
+    """Cut an unfinished last line left by an interrupted run, so new records start on their own line"""
+    try:
+        f = open(path, 'rb+')
+    except FileNotFoundError:
+        return
+    with f:
+        end = pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            start = max(0, pos - chunk_size)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            if pos == end and chunk.endswith(b'\n'):
+                return
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                f.truncate(start + newline + 1)
+                return
+            pos = start
+        f.truncate(0)
+
+
+class JsonlSink:
+    """Append-only JSONL output that doubles as the checkpoint"""
+
+    def __init__(self, path):
+        self.path = path
+        _drop_partial_line(path)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def completed_keys(self):
+        done = set()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['key'])
+                except (ValueError, KeyError):
+                    continue  # not a record, e.g. a stray line edited in by hand
+        return done
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SqliteSink:
+    """SQLite output keyed by request, so completed rows are the checkpoint"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS batch_recipes ("
+            " key TEXT PRIMARY KEY,"
+            " input TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " recipe TEXT NOT NULL,"
+            " generated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def completed_keys(self):
+        return {row[0] for row in self._conn.execute("SELECT key FROM batch_recipes")}
+
+    def write(self, record):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO batch_recipes (key, input, model, recipe, generated_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (record['key'], json.dumps(record['input']), record['model'],
+             json.dumps(record['recipe']), record['generated_at'])
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def open_sink(path):
+    if path.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteSink(path)
+    return JsonlSink(path)
+
+
+def read_requests(path):
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                print(f"line {line_number}: skipped, invalid JSON ({e})", file=sys.stderr)
+                continue
+            if not parse_ingredients(item.get('ingredients')):
+                print(f"line {line_number}: skipped, no ingredients", file=sys.stderr)
+                continue
+            yield item
+
+
+def run_batch(client, model_name, requests, sink, workers=4, rpm=60, structured=False, cache=None):
+    """Generate every request not already in the sink; returns a stats dict"""
+    limiter = RateLimiter(rpm)
+    usage = TokenUsage()
+    done = sink.completed_keys()
+    stats = {'skipped': 0, 'generated': 0, 'failed': 0}
+
+    def work(item):
+        limiter.acquire()
+        recipe = generate_recipe(
+            client, model_name, parse_ingredients(item['ingredients']), structured,
+            preferences=item, usage=usage
+        )
+        return recipe.to_dict()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        for item in requests:
+            key = request_key(item, model_name)
+            if key in done:
+                stats['skipped'] += 1
+                continue
+            done.add(key)  # also drops duplicate lines within this run
+
+            # Keep the queue bounded so huge inputs are not all loaded at once
+            while len(in_flight) >= workers * 2:
+                _collect(wait(in_flight, return_when=FIRST_COMPLETED).done, in_flight, sink, model_name, stats, cache)
+            in_flight[pool.submit(work, item)] = (key, item)
+
+        while in_flight:
+            _collect(wait(in_flight, return_when=FIRST_COMPLETED).done, in_flight, sink, model_name, stats, cache)
+    stats['tokens'] = dict(usage.totals)
+    return stats
+
+
+def _collect(finished, in_flight, sink, model_name, stats, cache):
+    for future in finished:
+        key, item = in_flight.pop(future)
+        try:
+            recipe = future.result()
+        except Exception as e:
+            stats['failed'] += 1
+            print(f"failed {item.get('ingredients')}: {str(e)[:200]}", file=sys.stderr)
+            continue
+        sink.write({
+            'key': key,
+            'input': item,
+            'model': model_name,
+            'recipe': recipe,
+            'generated_at': time.time(),
+        })
+        if cache is not None:
+            cache.set(key, [recipe])
+        stats['generated'] += 1
+        total = stats['generated'] + stats['failed']
+        if total % 50 == 0:
+            print(f"{stats['generated']} generated, {stats['failed']} failed", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate recipes for a JSONL file of pantry requests")
+    parser.add_argument("input", help="JSONL file of requests")
+    parser.add_argument("-o", "--output", required=True, help="output .jsonl or .db/.sqlite/.sqlite3 file")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent requests (default 4)")
+    parser.add_argument("--rpm", type=float, default=60, help="request starts per minute, 0 for no limit (default 60)")
+    parser.add_argument("--model", help="model name; probed from the candidates list when omitted")
+    parser.add_argument("--structured", action="store_true", help="use structured JSON output")
+    parser.add_argument("--cache", help="also fill the app's recipe cache at this SQLite path")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"), help="defaults to $GEMINI_API_KEY")
+    args = parser.parse_args(argv)
+
+    if not args.api_key and needs_api_key():
+        parser.error("no API key: pass --api-key or set GEMINI_API_KEY")
+
+    if args.model:
+        client, model_name = ResilientClient(create_client(args.api_key)), args.model
+    else:
+        resolver = ModelResolver(args.api_key)
+        client, model_name = resolver.resilient_client, resolver.resolve()
+    cache = RecipeCache(args.cache) if args.cache else None
+    sink = open_sink(args.output)
+    try:
+        stats = run_batch(
+            client, model_name, read_requests(args.input), sink,
+            workers=args.workers, rpm=args.rpm, structured=args.structured, cache=cache
+        )
+    finally:
+        sink.close()
+
+    print(f"model {model_name}: {stats['generated']} generated, {stats['skipped']} already done, "
+          f"{stats['failed']} failed, {stats['tokens']['total']} tokens", file=sys.stderr)
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""End-to-end benchmark: scripted sessions against app.py on the fake backend
+
+Usage:
+    python benchmarks/app_benchmark.py [--sizes 0,200,2000] [--concurrency 1,4,8]
+                                       [--sessions 8] [--latency 0.05] [--json]
+
+Drives app.py through Streamlit's headless AppTest harness with
+RECIPE_DOCTOR_BACKEND=fake, in a throwaway data directory. Three measurements:
+
+* pages: rerun time of each page with the saved recipes and shopping list
+  seeded to every --sizes value.
+* sessions: concurrent scripted sessions (type ingredients, generate, save,
+  add to list, tick items, browse) for every --concurrency value, giving
+  p50/p99 per action and reruns per second.
+* memory: traced Python memory per idle session.
+
+AppTest always reruns the whole script, so fragment-scoped interactions are
+timed as full reruns here; in the browser they cost less. render_seconds are
+the app's own render_page spans, without the harness overhead.
+
+AppTest installs a process-wide mock runtime for every run, so concurrent
+sessions take turns running their script. Reruns are CPU-bound under the GIL
+anyway; the time spent waiting for a turn is included in each rerun, and
+model latency still overlaps on the app's job pool.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import metrics  # noqa: E402
+from backends import FakeModels  # noqa: E402
+from recipe_parser import parse_recipe_text  # noqa: E402
+from storage import RecipeStore  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "app.py")
+
+PAGES = {
+    "generate": "🧑‍🍳 Generate Recipes",
+    "saved": "💾 Saved Recipes",
+    "shopping_list": "🛒 Shopping List",
+}
+
+PANTRY = [
+    "eggs", "milk", "bread", "cheese", "rice", "chicken", "spinach", "tomato", "onion",
+    "garlic", "pasta", "beans", "potato", "carrot", "tofu", "mushroom", "bell pepper", "lemon",
+]
+
+POLL_SECONDS = 0.01
+
+# One script run at a time, see above
+RUN_LOCK = threading.Lock()
+
+
+def use_data_dir(path, latency):
+    """Point the app at an empty data directory and the fake backend"""
+    os.environ["RECIPE_DOCTOR_BACKEND"] = "fake"
+    os.environ["RECIPE_DOCTOR_FAKE_LATENCY"] = str(latency)
+    os.environ["RECIPE_DOCTOR_DB"] = os.path.join(path, "recipe_doctor.sqlite3")
+    os.environ["RECIPE_DOCTOR_CACHE_DIR"] = os.path.join(path, "cache")
+    # Drop the store, caches and job queue built for the previous data directory
+    st.cache_resource.clear()
+    metrics.REGISTRY.reset()
+
+
+def seed_store(path, recipes, items):
+    store = RecipeStore(path)
+    fake = FakeModels()
+    rng = random.Random(recipes)
+    for i in range(recipes):
+        pantry = rng.sample(PANTRY, 3)
+        text = fake.generate_content("bench", f"Ingredients: {', '.join(pantry)}").text
+        recipe = parse_recipe_text(text).to_dict()
+        recipe['recipe_name'] = f"{recipe['recipe_name']} {i}"
+        # Fake recipes share one template, so near-duplicate merging would drop most of them
+        store.save_recipe(recipe, merge_similar=False)
+    store.add_list_items([f"{i % 5 + 1} bench item {i}" for i in range(items)])
+
+
+def new_session():
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    with RUN_LOCK:
+        at.run()
+    return at
+
+
+def timed(timings, action, fn):
+    start = time.perf_counter()
+    with RUN_LOCK:
+        fn()
+    timings.append((action, time.perf_counter() - start))
+
+
+def wait_for_generation(at, timings):
+    start = time.perf_counter()
+    while at.session_state["generation_job"] if "generation_job" in at.session_state else False:
+        time.sleep(POLL_SECONDS)
+        timed(timings, "poll", at.run)
+    timings.append(("generate_total", time.perf_counter() - start))
+
+
+def scripted_session(seed, timings):
+    """One user: type a pantry, generate, save, add to the list, tick items, browse"""
+    rng = random.Random(seed)
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    timed(timings, "first_load", at.run)
+
+    pantry = ", ".join(rng.sample(PANTRY, rng.randint(2, 5)))
+    timed(timings, "type_ingredients", at.text_area(key="ingredient_input").input(pantry).run)
+    timed(timings, "generate", at.button(key="generate_btn").click().run)
+    wait_for_generation(at, timings)
+    if not at.session_state["recipes"]:
+        raise RuntimeError(f"session {seed} generated nothing")
+
+    timed(timings, "save", at.button(key="save_0").click().run)
+    timed(timings, "add_to_list", at.button(key="shop_0").click().run)
+
+    timed(timings, "open_list", at.radio(key="nav_radio").set_value(PAGES["shopping_list"]).run)
+    boxes = [box for box in at.checkbox if box.key and box.key.startswith("check_")]
+    for box in boxes[:3]:
+        timed(timings, "tick_item", box.check().run)
+
+    timed(timings, "open_saved", at.radio(key="nav_radio").set_value(PAGES["saved"]).run)
+    timed(timings, "search_saved", at.text_input(key="saved_query").input(pantry.split(",")[0]).run)
+    return at
+
+
+def summarize(timings):
+    """{action: {count, p50_ms, p99_ms}} from (action, seconds) pairs"""
+    histograms = {}
+    for action, seconds in timings:
+        histograms.setdefault(action, metrics.Histogram()).observe(seconds)
+    return {
+        action: {
+            "count": h.count,
+            "p50_ms": h.percentiles((0.5,))[0.5] * 1000,
+            "p99_ms": h.percentiles((0.99,))[0.99] * 1000,
+        }
+        for action, h in sorted(histograms.items())
+    }
+
+
+def render_seconds():
+    """The app's own render_page spans, in ms"""
+    return {
+        labels.get("page"): {"count": count, "p50_ms": p[0.5] * 1000, "p99_ms": p[0.99] * 1000}
+        for labels, count, mean, p in metrics.REGISTRY.latency_summary()
+        if labels.get("phase") == "render_page"
+    }
+
+
+def bench_pages(sizes, repeat, latency):
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            use_data_dir(tmp, latency)
+            seed_store(os.environ["RECIPE_DOCTOR_DB"], size, size)
+            at = new_session()
+            metrics.REGISTRY.reset()
+            timings = []
+            for name, tab in PAGES.items():
+                at.radio(key="nav_radio").set_value(tab).run()
+                for _ in range(repeat):
+                    timed(timings, name, at.run)
+            render = render_seconds()
+            results.append({
+                "size": size,
+                "reruns": summarize(timings),
+                "render": {name: render.get(tab.split(" ", 1)[-1]) for name, tab in PAGES.items()},
+            })
+    return results
+
+
+def bench_sessions(levels, sessions, latency):
+    results = []
+    for workers in levels:
+        with tempfile.TemporaryDirectory() as tmp:
+            use_data_dir(tmp, latency)
+            timings = []
+            lock = threading.Lock()
+
+            def one(seed):
+                local = []
+                scripted_session(seed, local)
+                with lock:
+                    timings.extend(local)
+
+            count = max(sessions, workers)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(one, range(count)))
+            wall = time.perf_counter() - start
+            results.append({
+                "concurrency": workers,
+                "sessions": count,
+                "wall_seconds": wall,
+                "reruns_per_sec": len([t for t in timings if t[0] != "generate_total"]) / wall,
+                "sessions_per_sec": count / wall,
+                "actions": summarize(timings),
+            })
+    return results
+
+
+def bench_memory(count, latency):
+    """Traced memory per session after each has loaded and generated once"""
+    with tempfile.TemporaryDirectory() as tmp:
+        use_data_dir(tmp, latency)
+        new_session()  # build the shared resources outside the measurement
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            alive = []
+            for seed in range(count):
+                at = new_session()
+                at.text_area(key="ingredient_input").input(", ".join(PANTRY[seed % 5:seed % 5 + 3])).run()
+                at.button(key="generate_btn").click().run()
+                wait_for_generation(at, [])
+                alive.append(at)
+            used = tracemalloc.get_traced_memory()[0] - baseline
+        finally:
+            tracemalloc.stop()
+    return {"sessions": count, "kb_per_session": used / count / 1024}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def int_list(text):
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int_list, default=[0, 200, 2000], help="saved recipes and list items")
+    parser.add_argument("--repeat", type=int, default=20, help="reruns per page and size")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4, 8])
+    parser.add_argument("--sessions", type=int, default=8, help="scripted sessions per concurrency level")
+    parser.add_argument("--memory-sessions", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency in seconds")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "latency": args.latency,
+        "pages": bench_pages(args.sizes, args.repeat, args.latency),
+        "sessions": bench_sessions(args.concurrency, args.sessions, args.latency),
+        "memory": bench_memory(args.memory_sessions, args.latency),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"commit {results['commit']}, fake latency {args.latency * 1000:.0f} ms")
+    print(f"\n{'size':>6} {'page':<14} {'rerun p50':>10} {'p99':>8} {'render p50':>11}")
+    for point in results["pages"]:
+        for page, r in point["reruns"].items():
+            render = point["render"].get(page)
+            render_p50 = f"{render['p50_ms']:.1f}" if render else "-"
+            print(f"{point['size']:>6} {page:<14} {r['p50_ms']:>10.1f} {r['p99_ms']:>8.1f} {render_p50:>11}")
+
+    print(f"\n{'workers':>7} {'sessions':>8} {'reruns/s':>9} {'generate p50':>13} {'p99':>8} {'tick p99':>9}")
+    for level in results["sessions"]:
+        generate = level["actions"].get("generate_total", {})
+        tick = level["actions"].get("tick_item", {})
+        print(f"{level['concurrency']:>7} {level['sessions']:>8} {level['reruns_per_sec']:>9.1f} "
+              f"{generate.get('p50_ms', 0):>13.1f} {generate.get('p99_ms', 0):>8.1f} {tick.get('p99_ms', 0):>9.1f}")
+
+    print(f"\nmemory: {results['memory']['kb_per_session']:.0f} KB per session "
+          f"({results['memory']['sessions']} sessions)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Frozen copy of the original two-pass parse_gemini_response from app.py
+
+Kept only as the baseline for parser_benchmark.py; the Streamlit sidebar
+calls are removed so it can run headless.
+"""
+
+
+def legacy_parse(text):
+    """Parse Gemini's response with better step detection"""
+    try:
+        recipe = {
+            'recipe_name': 'AI Recipe',
+            'difficulty': 'Easy',
+            'prep_time': '10 minutes',
+            'cook_time': '15 minutes',
+            'servings': 2,
+            'calories': '300',
+            'ingredients': [],
+            'steps': [],
+            'tips': 'Enjoy your meal!',
+            'nutrition': 'Nutritional information'
+        }
+        
+        lines = text.split('\n')
+        current_section = None
+        step_number = 1
+        
+        for i, line in enumerate(lines):
+            line = line.strip()
+            if not line:
+                continue
+            
+            # Check for headers (case insensitive)
+            line_upper = line.upper()
+            
+            if 'RECIPE NAME:' in line_upper:
+                recipe['recipe_name'] = line.split(':', 1)[1].strip()
+            elif 'DIFFICULTY:' in line_upper:
+                recipe['difficulty'] = line.split(':', 1)[1].strip()
+            elif 'PREP TIME:' in line_upper:
+                recipe['prep_time'] = line.split(':', 1)[1].strip()
+            elif 'COOK TIME:' in line_upper:
+                recipe['cook_time'] = line.split(':', 1)[1].strip()
+            elif 'SERVINGS:' in line_upper:
+                recipe['servings'] = line.split(':', 1)[1].strip()
+            elif 'CALORIES:' in line_upper:
+                recipe['calories'] = line.split(':', 1)[1].strip()
+            elif 'TIPS:' in line_upper:
+                recipe['tips'] = line.split(':', 1)[1].strip()
+            elif 'NUTRITION:' in line_upper:
+                recipe['nutrition'] = line.split(':', 1)[1].strip()
+            
+            # Section starts
+            elif 'INGREDIENTS:' in line_upper:
+                current_section = 'ingredients'
+            elif 'STEPS:' in line_upper or 'INSTRUCTIONS:' in line_upper:
+                current_section = 'steps'
+                step_number = 1
+            elif line_upper in ['TIPS:', 'NUTRITION:']:
+                current_section = None
+            
+            # Parse ingredients
+            elif current_section == 'ingredients':
+                # Look for bullet points or numbered lists
+                if line.startswith(('-', '*', '•')) or (line[0].isdigit() and line[1] in '. )'):
+                    # Clean the line
+                    if line.startswith(('-', '*', '•')):
+                        ingredient = line[1:].strip()
+                    elif line[0].isdigit():
+                        if '.' in line:
+                            ingredient = line.split('.', 1)[1].strip()
+                        elif ')' in line:
+                            ingredient = line.split(')', 1)[1].strip()
+                        else:
+                            ingredient = line[2:].strip()
+                    else:
+                        ingredient = line
+                    
+                    if ingredient and len(ingredient) > 2:
+                        recipe['ingredients'].append(ingredient)
+            
+            # Parse steps - be more flexible
+            elif current_section == 'steps':
+                # Check for numbered steps
+                if line and line[0].isdigit() and len(line) > 2:
+                    # Extract step text
+                    if '.' in line:
+                        step_text = line.split('.', 1)[1].strip()
+                    elif ')' in line:
+                        step_text = line.split(')', 1)[1].strip()
+                    else:
+                        step_text = line[2:].strip()
+                    
+                    # Check if this is a real step (not a section header)
+                    if step_text and len(step_text) > 10 and not any(
+                        keyword in step_text.upper() for keyword in 
+                        ['INGREDIENTS', 'STEPS', 'TIPS', 'NUTRITION', 'RECIPE']
+                    ):
+                        recipe['steps'].append(f"Step {step_number}: {step_text}")
+                        step_number += 1
+                
+                # Also accept lines that look like steps but aren't numbered
+                elif len(line) > 20 and current_section == 'steps':
+                    # Check if it looks like a cooking instruction
+                    cooking_keywords = ['heat', 'cook', 'chop', 'mix', 'add', 'stir', 'boil', 'fry', 'bake', 'whisk']
+                    if any(keyword in line.lower() for keyword in cooking_keywords):
+                        recipe['steps'].append(f"Step {step_number}: {line}")
+                        step_number += 1
+        
+        # Check if steps are too generic
+        generic_patterns = ['prepare ingredients', 'cook as desired', 'serve and enjoy', 'follow instructions']
+        has_generic_steps = any(
+            any(pattern in step.lower() for pattern in generic_patterns)
+            for step in recipe['steps']
+        )
+        
+        # If steps are generic or we have less than 3 steps, try to parse differently
+        if has_generic_steps or len(recipe['steps']) < 3:
+            # Try alternative parsing: look for paragraphs after STEPS:
+            in_steps = False
+            step_number = 1
+            recipe['steps'] = []
+            
+            for i, line in enumerate(lines):
+                line = line.strip()
+                if 'STEPS:' in line.upper() or 'INSTRUCTIONS:' in line.upper():
+                    in_steps = True
+                    continue
+                elif 'TIPS:' in line.upper() or 'NUTRITION:' in line.upper():
+                    in_steps = False
+                    continue
+                
+                if in_steps and line:
+                    # Skip empty lines and section headers
+                    if len(line) > 15 and not any(
+                        keyword in line.upper() for keyword in 
+                        ['INGREDIENTS', 'STEPS', 'TIPS', 'NUTRITION', 'RECIPE']
+                    ):
+                        # Check if it's already numbered
+                        if line[0].isdigit() and line[1] in '. )':
+                            if '.' in line:
+                                step_text = line.split('.', 1)[1].strip()
+                            elif ')' in line:
+                                step_text = line.split(')', 1)[1].strip()
+                            else:
+                                step_text = line[2:].strip()
+                        else:
+                            step_text = line
+                        
+                        if step_text:
+                            recipe['steps'].append(f"Step {step_number}: {step_text}")
+                            step_number += 1
+        
+        return [recipe]
+        
+    except Exception:
+        return None
@@ -0,0 +1,119 @@
+"""Micro-benchmark: single-pass recipe_parser vs the original two-pass parser
+
+Usage:
+    python benchmarks/parser_benchmark.py [--repeat 200] [--rounds 5] [--json]
+
+Reports parse throughput and field accuracy over parser_corpus.jsonl.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from legacy_parser import legacy_parse  # noqa: E402
+from recipe_parser import parse_recipe_text  # noqa: E402
+
+CORPUS_PATH = os.path.join(HERE, "parser_corpus.jsonl")
+_STEP_PREFIX_RE = re.compile(r'^Step \d+: ')
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parse_single_pass(text):
+    return parse_recipe_text(text).to_dict()
+
+
+def parse_legacy(text):
+    recipes = legacy_parse(text)
+    return recipes[0] if recipes else None
+
+
+PARSERS = {
+    "legacy": parse_legacy,
+    "single_pass": parse_single_pass,
+}
+
+
+def score(recipe, expected):
+    """Return (matched, checked) field counts for one case"""
+    if recipe is None:
+        return 0, len(expected)
+    matched = 0
+    for field, want in expected.items():
+        got = recipe.get(field)
+        if field == 'steps':
+            got = [_STEP_PREFIX_RE.sub('', step) for step in got]
+        elif field != 'ingredients':
+            got = str(got)
+        matched += got == want
+    return matched, len(expected)
+
+
+def run(corpus, repeat, rounds=5):
+    results = {}
+    total_bytes = sum(len(case["text"].encode("utf-8")) for case in corpus)
+    for name, parse in PARSERS.items():
+        matched = checked = 0
+        failures = []
+        for case in corpus:
+            m, c = score(parse(case["text"]), case["expected"])
+            matched += m
+            checked += c
+            if m < c:
+                failures.append(case["name"])
+
+        # Best of several rounds, like timeit, to damp scheduler noise
+        elapsed = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for case in corpus:
+                    parse(case["text"])
+            elapsed = min(elapsed, time.perf_counter() - start)
+
+        parses = repeat * len(corpus)
+        results[name] = {
+            "accuracy": matched / checked if checked else 0.0,
+            "parses_per_sec": parses / elapsed,
+            "mb_per_sec": repeat * total_bytes / elapsed / 1e6,
+            "us_per_parse": elapsed / parses * 1e6,
+            "failed_cases": failures,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    results = run(corpus, args.repeat, args.rounds)
+
+    if args.json:
+        print(json.dumps({"cases": len(corpus), "repeat": args.repeat, "results": results}, indent=2))
+        return
+
+    print(f"{len(corpus)} cases x {args.repeat} repeats")
+    print(f"{'parser':<12} {'accuracy':>9} {'parses/s':>10} {'us/parse':>9} {'MB/s':>7}")
+    for name, r in results.items():
+        print(f"{name:<12} {r['accuracy']:>9.1%} {r['parses_per_sec']:>10.0f} "
+              f"{r['us_per_parse']:>9.1f} {r['mb_per_sec']:>7.2f}")
+    for name, r in results.items():
+        if r["failed_cases"]:
+            print(f"{name} missed: {', '.join(r['failed_cases'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Gemini client, model selection and the resilient call layer shared by every session"""
+import random
+import threading
+import time
+
+import metrics
+from backends import create_client
+
+# Preferred model first, then fallbacks in order
+MODEL_CANDIDATES = ["gemini-3-flash-preview", "gemini-2.5-flash", "gemini-1.5-flash"]
+
+# How long a probe result is trusted before it is re-checked in the background
+PROBE_TTL_SECONDS = 600
+
+
+class ModelResolver:
+    """One client per API key plus a cached model availability probe
+
+    The client comes from the backend chosen by RECIPE_DOCTOR_BACKEND (see
+    backends.py), so the probe and every call also work against the fake.
+    """
+
+    def __init__(self, api_key, candidates=None, ttl=PROBE_TTL_SECONDS):
+        self.client = create_client(api_key)
+        self.candidates = list(candidates or MODEL_CANDIDATES)
+        # What the app generates with: same client behind retries and failover
+        self.resilient_client = ResilientClient(self.client, self.candidates)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._model_name = None
+        self._probe_errors = {}
+        self._checked_at = 0.0
+        self._refreshing = False
+        self.probe()
+
+    def _probe_model(self, model_name):
+        self.client.models.generate_content(
+            model=model_name,
+            contents="Test",
+            config={"max_output_tokens": 10}
+        )
+
+    def probe(self):
+        """Try each candidate in order and remember the first one that answers"""
+        chosen = None
+        probe_errors = {}
+        for model_name in self.candidates:
+            try:
+                self._probe_model(model_name)
+                chosen = model_name
+                break
+            except Exception as e:
+                probe_errors[model_name] = str(e)[:100]
+
+        with self._lock:
+            self._model_name = chosen
+            self._probe_errors = probe_errors
+            self._checked_at = time.monotonic()
+            self._refreshing = False
+        return chosen
+
+    def _refresh_if_stale(self):
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._checked_at < self.ttl:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.probe, name="gemini-probe", daemon=True).start()
+
+    def resolve(self):
+        """Return the model to use from the cached probe without touching the network"""
+        self._refresh_if_stale()
+        with self._lock:
+            if self._model_name:
+                return self._model_name
+        # Nothing answered the probe: fall back to the first alternative
+        return self.candidates[min(1, len(self.candidates) - 1)]
+
+    @property
+    def probe_errors(self):
+        with self._lock:
+            return dict(self._probe_errors)
+
+
+# Call layer: retries, per-model circuit breakers, model failover and a deadline
+MAX_ATTEMPTS_PER_MODEL = 3
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+REQUEST_DEADLINE_SECONDS = 45.0
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+
+
+class DeadlineExceeded(TimeoutError):
+    """The per-request deadline ran out before any model answered"""
+
+
+class AllModelsUnavailable(RuntimeError):
+    """Every model in the fallback chain failed or has an open circuit"""
+
+
+def _error_code(exc):
+    code = getattr(exc, 'code', None)
+    return code if isinstance(code, int) else None
+
+
+def classify_error(exc):
+    """'retry' for throttling/server/network errors, 'failover' for a missing model, else 'fatal'"""
+    code = _error_code(exc)
+    if code is not None:
+        if code == 429 or code >= 500:
+            return 'retry'
+        if code == 404:
+            return 'failover'
+        return 'fatal'
+    if isinstance(exc, OSError):  # connection resets, timeouts
+        return 'retry'
+    # httpx transport errors do not share a stdlib base class
+    if type(exc).__module__.startswith('httpx'):
+        return 'retry'
+    return 'fatal'
+
+
+def retry_after_seconds(exc):
+    """Server-suggested wait from a Retry-After header or a google.rpc.RetryInfo detail"""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    details = getattr(exc, 'details', None)
+    if isinstance(details, dict):
+        for detail in (details.get('error') or {}).get('details') or []:
+            delay = detail.get('retryDelay') if isinstance(detail, dict) else None
+            if isinstance(delay, str) and delay.endswith('s'):
+                try:
+                    return float(delay[:-1])
+                except ValueError:
+                    pass
+    return None
+
+
+def backoff_delay(attempt, exc=None):
+    """Full-jitter exponential backoff, never shorter than a retry-after hint"""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    hint = retry_after_seconds(exc) if exc is not None else None
+    return max(delay, hint) if hint else delay
+
+
+class CircuitBreaker:
+    """Opens after repeated failures, then lets one trial call through after a cool-down"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class ResilientModels:
+    """Drop-in for client.models: generate_content(_stream) with retries and failover
+
+    The model passed by the caller is tried first, followed by the remaining
+    fallback models in order.
+    """
+
+    def __init__(self, models, fallback_models, deadline=REQUEST_DEADLINE_SECONDS, sleep=time.sleep):
+        self._models = models
+        self.fallback_models = list(fallback_models)
+        self.deadline = deadline
+        self.breakers = {name: CircuitBreaker() for name in self.fallback_models}
+        self._breakers_lock = threading.Lock()
+        self._sleep = sleep
+
+    def breaker(self, model_name):
+        with self._breakers_lock:
+            if model_name not in self.breakers:
+                self.breakers[model_name] = CircuitBreaker()
+            return self.breakers[model_name]
+
+    def model_chain(self, model):
+        return [model] + [name for name in self.fallback_models if name != model]
+
+    def generate_content(self, model, contents, config=None, deadline=None):
+        return self._call(self._models.generate_content, model, contents, config, deadline)
+
+    def generate_content_stream(self, model, contents, config=None, deadline=None):
+        """Retries apply until the first chunk arrives; later failures propagate"""
+        def open_stream(model, contents, config):
+            stream = iter(self._models.generate_content_stream(model=model, contents=contents, config=config))
+            first = next(stream, None)
+            return first, stream
+
+        first, stream = self._call(open_stream, model, contents, config, deadline)
+
+        def chunks():
+            if first is not None:
+                yield first
+            yield from stream
+        return chunks()
+
+    def _call(self, fn, model, contents, config, deadline):
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        last_error = None
+
+        for model_name in self.model_chain(model):
+            breaker = self.breaker(model_name)
+            if not breaker.allow():
+                continue
+
+            for attempt in range(MAX_ATTEMPTS_PER_MODEL):
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"no answer within {deadline or self.deadline:.0f}s") from last_error
+                started = time.perf_counter()
+                try:
+                    result = fn(model=model_name, contents=contents, config=_with_timeout(config, remaining))
+                except Exception as e:
+                    last_error = e
+                    kind = classify_error(e)
+                    metrics.observe("gemini_request_seconds", time.perf_counter() - started, model=model_name)
+                    metrics.inc("gemini_requests", model=model_name, outcome=kind)
+                    if kind == 'fatal':
+                        breaker.record_success()  # the model answered; the request itself is bad
+                        raise
+                    breaker.record_failure()
+                    if kind == 'failover' or attempt == MAX_ATTEMPTS_PER_MODEL - 1 or not breaker.allow():
+                        break
+                    delay = backoff_delay(attempt, e)
+                    if time.monotonic() + delay >= deadline_at:
+                        break
+                    self._sleep(delay)
+                    continue
+                metrics.observe("gemini_request_seconds", time.perf_counter() - started, model=model_name)
+                metrics.inc("gemini_requests", model=model_name, outcome='ok')
+                breaker.record_success()
+                return result
+
+        if last_error is None:
+            raise AllModelsUnavailable("all models have an open circuit breaker")
+        raise AllModelsUnavailable(f"all models failed, last error: {str(last_error)[:200]}") from last_error
+
+
+def _with_timeout(config, remaining):
+    """Cap the HTTP timeout of one attempt at the time left before the deadline"""
+    if config is None:
+        config = {}
+    if not isinstance(config, dict):
+        return config
+    config = dict(config)
+    http_options = dict(config.get('http_options') or {})
+    http_options['timeout'] = max(1, int(remaining * 1000))
+    config['http_options'] = http_options
+    return config
+
+
+class ResilientClient:
+    """Wraps a genai.Client so every call goes through ResilientModels"""
+
+    def __init__(self, client, fallback_models=None, deadline=REQUEST_DEADLINE_SECONDS):
+        self.client = client
+        self.models = ResilientModels(client.models, fallback_models or MODEL_CANDIDATES, deadline)
@@ -0,0 +1,266 @@
+"""Ingredient extraction from free-form pantry text
+
+A built-in vocabulary of canonical ingredients and their synonyms is
+compiled once into a word-level trie. The input is tokenized in one pass,
+each token is folded to its singular form, and the trie is walked for the
+longest match at each position. Phrases are at most a few words long, so
+extraction is linear in the length of the text. Commas, semicolons, newlines,
+"and", "or" and "&" separate items, unless they are part of a known phrase
+such as "half and half". Quantities, units and descriptive words are
+skipped. An item with words the vocabulary does not know is kept whole as
+a cleaned-up phrase, so "lemon juice" stays "lemon juice" instead of
+becoming "lemon".
+
+    >>> extract_ingredients("2 eggs and some milk\\nBread, Eggs")
+    ['egg', 'milk', 'bread']
+
+The canonical names are lossy on purpose: they key caches and the local
+recipe index. Prompts get the user's own wording from split_items(), which
+splits the text the same way and keeps each item as written.
+"""
+import re
+
+from shopping_list import COUNT_UNITS, DESCRIPTORS, UNITS, singular
+
+# Canonical ingredient names, grouped loosely by aisle
+VOCABULARY = (
+    # Produce
+    'onion', 'red onion', 'green onion', 'shallot', 'garlic', 'ginger', 'leek', 'tomato',
+    'cherry tomato', 'potato', 'sweet potato', 'carrot', 'celery', 'bell pepper', 'red bell pepper',
+    'green bell pepper', 'jalapeno', 'chili pepper', 'lettuce', 'romaine', 'spinach', 'kale',
+    'arugula', 'cabbage', 'red cabbage', 'broccoli', 'cauliflower', 'zucchini', 'cucumber',
+    'mushroom', 'portobello mushroom', 'shiitake mushroom', 'avocado', 'lemon', 'lime', 'orange',
+    'apple', 'banana', 'strawberry', 'blueberry', 'raspberry', 'blackberry', 'grape', 'mango',
+    'pineapple', 'pear', 'peach', 'plum', 'cherry', 'watermelon', 'melon', 'kiwi', 'pomegranate',
+    'coconut', 'eggplant', 'corn', 'pea', 'green bean', 'snap pea', 'asparagus', 'artichoke',
+    'beet', 'radish', 'turnip', 'parsnip', 'squash', 'butternut squash', 'pumpkin', 'okra',
+    'bok choy', 'brussels sprout', 'fennel', 'parsley', 'cilantro', 'basil', 'mint', 'dill',
+    'chive', 'thyme', 'rosemary', 'sage', 'oregano', 'tarragon', 'lemongrass', 'bean sprout',
+    'watercress', 'date', 'fig', 'raisin', 'cranberry', 'apricot',
+    # Meat and seafood
+    'chicken', 'chicken breast', 'chicken thigh', 'chicken wing', 'ground chicken', 'turkey',
+    'ground turkey', 'beef', 'ground beef', 'steak', 'pork', 'pork chop', 'pork belly',
+    'ground pork', 'lamb', 'bacon', 'ham', 'sausage', 'chorizo', 'salami', 'pepperoni',
+    'prosciutto', 'duck', 'fish', 'salmon', 'tuna', 'cod', 'tilapia', 'trout', 'sardine',
+    'anchovy', 'shrimp', 'crab', 'lobster', 'scallop', 'mussel', 'clam', 'squid', 'tofu',
+    'tempeh', 'seitan',
+    # Dairy and eggs
+    'egg', 'egg white', 'egg yolk', 'milk', 'butter', 'cream', 'heavy cream', 'sour cream', 'half and half',
+    'cream cheese', 'yogurt', 'greek yogurt', 'cheese', 'cheddar', 'mozzarella', 'parmesan',
+    'feta', 'goat cheese', 'ricotta', 'swiss cheese', 'blue cheese', 'cottage cheese', 'halloumi',
+    'paneer', 'ghee', 'buttermilk', 'almond milk', 'oat milk', 'soy milk', 'coconut milk',
+    # Bakery
+    'bread', 'sourdough', 'baguette', 'bun', 'roll', 'tortilla', 'pita', 'naan', 'bagel',
+    'croissant', 'english muffin', 'breadcrumb', 'panko', 'cracker',
+    # Pantry
+    'rice', 'brown rice', 'basmati rice', 'jasmine rice', 'arborio rice', 'pasta', 'spaghetti',
+    'penne', 'macaroni', 'fusilli', 'lasagna', 'noodle', 'egg noodle', 'rice noodle', 'ramen',
+    'couscous', 'quinoa', 'oats', 'barley', 'bulgur', 'polenta', 'flour', 'whole wheat flour',
+    'cornstarch', 'cornmeal', 'sugar', 'brown sugar', 'powdered sugar', 'honey', 'maple syrup',
+    'molasses', 'baking powder', 'baking soda', 'yeast', 'vanilla', 'cocoa powder', 'chocolate',
+    'chocolate chip', 'olive oil', 'vegetable oil', 'sesame oil', 'coconut oil', 'oil',
+    'vinegar', 'balsamic vinegar', 'apple cider vinegar', 'rice vinegar', 'soy sauce',
+    'fish sauce', 'oyster sauce', 'hoisin sauce', 'worcestershire sauce', 'hot sauce',
+    'sriracha', 'ketchup', 'mustard', 'dijon mustard', 'mayonnaise', 'pesto', 'salsa',
+    'tomato sauce', 'tomato paste', 'canned tomato', 'chicken stock', 'beef stock',
+    'vegetable stock', 'stock', 'broth', 'peanut butter', 'tahini', 'jam', 'bean', 'black bean',
+    'kidney bean', 'pinto bean', 'white bean', 'chickpea', 'lentil', 'red lentil', 'almond',
+    'walnut', 'pecan', 'cashew', 'peanut', 'pistachio', 'hazelnut', 'pine nut', 'sesame seed',
+    'chia seed', 'flaxseed', 'sunflower seed', 'pumpkin seed', 'olive', 'caper', 'pickle',
+    'sun dried tomato', 'coconut cream', 'wine', 'red wine', 'white wine', 'beer',
+    # Spices and seasonings
+    'salt', 'pepper', 'black pepper', 'paprika', 'smoked paprika', 'cumin', 'coriander',
+    'turmeric', 'cinnamon', 'nutmeg', 'cardamom', 'chili powder', 'chili flake',
+    'cayenne', 'curry powder', 'garam masala', 'bay leaf', 'garlic powder', 'onion powder',
+    'italian seasoning', 'five spice', 'star anise', 'saffron', 'allspice', 'mustard seed',
+    'fennel seed',
+    # Frozen and other
+    'frozen pea', 'frozen corn', 'frozen spinach', 'ice cream', 'water',
+)
+
+# Other names for vocabulary entries
+SYNONYMS = {
+    'scallion': 'green onion', 'spring onion': 'green onion', 'green onions': 'green onion',
+    'coriander leaf': 'cilantro', 'fresh coriander': 'cilantro',
+    'garbanzo': 'chickpea', 'garbanzo bean': 'chickpea', 'chick pea': 'chickpea',
+    'aubergine': 'eggplant', 'courgette': 'zucchini', 'capsicum': 'bell pepper',
+    'sweet pepper': 'bell pepper', 'prawn': 'shrimp', 'king prawn': 'shrimp',
+    'minced beef': 'ground beef', 'beef mince': 'ground beef', 'hamburger meat': 'ground beef',
+    'minced pork': 'ground pork', 'pork mince': 'ground pork', 'minced chicken': 'ground chicken',
+    'caster sugar': 'sugar', 'granulated sugar': 'sugar', 'white sugar': 'sugar',
+    'icing sugar': 'powdered sugar', 'confectioners sugar': 'powdered sugar',
+    'all purpose flour': 'flour', 'plain flour': 'flour', 'self raising flour': 'flour',
+    'corn starch': 'cornstarch', 'cornflour': 'cornstarch',
+    'double cream': 'heavy cream', 'whipping cream': 'heavy cream', 'single cream': 'cream',
+    'natural yogurt': 'yogurt', 'yoghurt': 'yogurt', 'greek yoghurt': 'greek yogurt',
+    'parmigiano': 'parmesan', 'parmigiano reggiano': 'parmesan', 'cheddar cheese': 'cheddar',
+    'mozzarella cheese': 'mozzarella', 'parmesan cheese': 'parmesan', 'feta cheese': 'feta',
+    'ricotta cheese': 'ricotta', 'chevre': 'goat cheese',
+    'rocket': 'arugula', 'beetroot': 'beet', 'swede': 'turnip', 'pak choi': 'bok choy',
+    'mangetout': 'snap pea', 'snow pea': 'snap pea', 'french bean': 'green bean',
+    'string bean': 'green bean', 'maize': 'corn', 'sweetcorn': 'corn', 'sweet corn': 'corn',
+    'chilli': 'chili pepper', 'chili': 'chili pepper', 'red chili': 'chili pepper',
+    'green chili': 'chili pepper', 'chilli flake': 'chili flake', 'red pepper flake': 'chili flake',
+    'crushed red pepper': 'chili flake', 'chilli powder': 'chili powder',
+    'bacon rasher': 'bacon', 'streaky bacon': 'bacon', 'gammon': 'ham',
+    'anchovies': 'anchovy', 'tinned tomato': 'canned tomato', 'chopped tomato': 'canned tomato',
+    'passata': 'tomato sauce', 'marinara': 'tomato sauce', 'tomato puree': 'tomato paste',
+    'chicken broth': 'chicken stock', 'beef broth': 'beef stock', 'vegetable broth': 'vegetable stock',
+    'stock cube': 'stock', 'bouillon': 'stock', 'mayo': 'mayonnaise', 'soya sauce': 'soy sauce',
+    'tamari': 'soy sauce', 'evoo': 'olive oil', 'extra virgin olive oil': 'olive oil',
+    'canola oil': 'vegetable oil', 'sunflower oil': 'vegetable oil', 'rapeseed oil': 'vegetable oil',
+    'cooking oil': 'vegetable oil', 'rolled oats': 'oats', 'porridge oats': 'oats', 'oatmeal': 'oats',
+    'spaghetti noodle': 'spaghetti', 'bread crumb': 'breadcrumb', 'vanilla extract': 'vanilla',
+    'vanilla essence': 'vanilla', 'bicarbonate of soda': 'baking soda', 'bicarb': 'baking soda',
+    'dried yeast': 'yeast', 'instant yeast': 'yeast', 'hen egg': 'egg',
+    'whole milk': 'milk', 'skim milk': 'milk', 'semi skimmed milk': 'milk', 'dairy milk': 'milk',
+    'unsalted butter': 'butter', 'salted butter': 'butter', 'sea salt': 'salt', 'kosher salt': 'salt',
+    'table salt': 'salt', 'ground black pepper': 'black pepper', 'peppercorn': 'black pepper',
+    'ground cumin': 'cumin', 'ground cinnamon': 'cinnamon', 'ground ginger': 'ginger',
+    'ground turmeric': 'turmeric', 'ground coriander': 'coriander', 'bay': 'bay leaf',
+    # "cloves" on its own is a unit of garlic
+    'ground clove': 'clove', 'whole clove': 'clove',
+    'white bread': 'bread', 'brown bread': 'bread', 'wholemeal bread': 'bread', 'toast': 'bread',
+    'sandwich bread': 'bread', 'loaf': 'bread', 'wrap': 'tortilla', 'flatbread': 'pita',
+    'tofu block': 'tofu', 'firm tofu': 'tofu', 'silken tofu': 'tofu',
+}
+
+# Words that separate one ingredient from the next
+SEPARATOR_WORDS = frozenset(('and', 'or', 'with', 'plus'))
+
+# Words that say how much or what state, never which ingredient
+FILLER_WORDS = (
+    DESCRIPTORS | set(UNITS) | set(COUNT_UNITS) | frozenset((
+        'a', 'an', 'the', 'of', 'some', 'few', 'couple', 'bit', 'little', 'lot', 'lots', 'bunch',
+        'handful', 'dozen', 'half', 'for', 'garnish', 'serving', 'leftover', 'left', 'over',
+        'i', 'have', 'got', 'we', 'my', 'in', 'fridge', 'pantry', 'can', 'also', 'any', 'more',
+        'tin', 'jar', 'bag', 'box', 'bottle', 'carton', 'container', 'x', 'approx', 'roughly', 'leaf',
+    ))
+)
+FILLER_WORDS = frozenset(word.lower() for word in FILLER_WORDS)
+
+_TOKEN_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?|\d+(?:[./]\d+)?|[½⅓⅔¼¾⅛]|[,;\n&+/]")
+_SEPARATOR_CHARS = frozenset(',;\n&+/')
+_ITEM_STRIP = ' \t-*•'
+
+_END = None  # trie key holding the canonical name at the end of a phrase
+
+
+def _fold(token):
+    return singular(token.lower())
+
+
+def _phrase_tokens(phrase):
+    return tuple(_fold(token) for token in re.findall(r"[^\W\d_]+", phrase.lower()))
+
+
+def build_trie(vocabulary=VOCABULARY, synonyms=SYNONYMS):
+    """Word-level trie of folded phrase tokens -> canonical name"""
+    trie = {}
+    entries = [(name, name) for name in vocabulary] + list(synonyms.items())
+    for phrase, canonical in entries:
+        node = trie
+        for token in _phrase_tokens(phrase):
+            node = node.setdefault(token, {})
+        node[_END] = canonical
+    return trie
+
+
+_TRIE = build_trie()
+
+
+def _tokens(text):
+    """(folded word, start, end) tokens, with None for separator characters; numbers are dropped"""
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        if token in _SEPARATOR_CHARS:
+            yield None, match.start(), match.end()
+        elif token[0].isdigit() or token in '½⅓⅔¼¾⅛':
+            continue
+        else:
+            yield _fold(token), match.start(), match.end()
+
+
+def _segments(text, trie):
+    """One (start, end, names) per item: the text span between separators and what it names"""
+    tokens = list(_tokens(text))
+    matches = []
+    words = []  # the segment's non-filler words, matched or not
+    unknown = False
+    start = 0
+
+    def names():
+        # Unknown words qualify the item ("gruyere cheese"), so keep it whole
+        if unknown:
+            while words[-1] in FILLER_WORDS:
+                words.pop()
+            return [' '.join(words)]
+        return matches
+
+    i, n = 0, len(tokens)
+    while i < n:
+        token, token_start, token_end = tokens[i]
+        if token is None:
+            yield start, token_start, names()
+            matches, words, unknown, start = [], [], False, token_end
+            i += 1
+            continue
+
+        # Longest vocabulary phrase starting here; it may span "and" ("half and half")
+        node, j, match, match_end = trie, i, None, i
+        while j < n and tokens[j][0] is not None and tokens[j][0] in node:
+            node = node[tokens[j][0]]
+            j += 1
+            if _END in node:
+                match, match_end = node[_END], j
+        if match is not None:
+            matches.append(match)
+            words.extend(token for token, _, _ in tokens[i:match_end])
+            i = match_end
+            continue
+
+        # After the phrase check, so "half and half" is not split
+        if token in SEPARATOR_WORDS:
+            yield start, token_start, names()
+            matches, words, unknown, start = [], [], False, token_end
+        elif token not in FILLER_WORDS:
+            words.append(token)
+            unknown = True
+        elif words:
+            # Inner filler stays part of a kept phrase ("cream of mushroom soup")
+            words.append(token)
+        i += 1
+    yield start, len(text), names()
+
+
+def extract_ingredients(text, trie=None):
+    """Canonical ingredient names found in free-form text, in order, without duplicates"""
+    found = {}  # dict keeps first-seen order
+    for _, _, names in _segments(str(text or ''), _TRIE if trie is None else trie):
+        for name in names:
+            found.setdefault(name, None)
+    return list(found)
+
+
+def split_items(text, trie=None):
+    """The user's own wording for each item, split where extract_ingredients() splits
+
+    Items naming the same ingredients count once, in the first wording
+    used; items that name nothing ("to taste") are dropped.
+    """
+    text = str(text or '')
+    items = {}
+    for start, end, names in _segments(text, _TRIE if trie is None else trie):
+        item = ' '.join(text[start:end].strip(_ITEM_STRIP).split())
+        if item and names:
+            items.setdefault(tuple(names), item)
+    return list(items.values())
+
+
+def canonical_ingredients(ingredients_list):
+    """Extract from each entry of a list and merge, keeping first-seen order"""
+    found = {}
+    for entry in ingredients_list or []:
+        for name in extract_ingredients(entry):
+            found.setdefault(name, None)
+    return list(found)
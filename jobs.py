@@ -0,0 +1,179 @@
+"""Background jobs on a bounded worker pool
+
+A job function receives its Job and can publish partial results through
+job.emit() and job.note() while it runs. Cancellation is cooperative:
+a queued job never starts, and a running job stops at its next
+job.check_cancelled(). A call that is already in flight when the job is
+cancelled still finishes, but its result is thrown away. Finished jobs are
+kept for a while, so a session can pick up the result on its next poll.
+
+Low-priority jobs are only accepted while a worker is idle, so speculative
+work never makes a user-initiated job wait behind it.
+
+A job submitted with a key is shared: while it is unfinished, submitting
+the same key again returns it instead of starting another, so identical
+requests from several sessions follow one job and its events. A shared job
+is only cancelled once every session holding it has cancelled.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUED = 16
+KEEP_FINISHED_SECONDS = 600
+
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+class QueueFull(RuntimeError):
+    """Too many jobs are already waiting for a worker"""
+
+
+class JobCancelled(Exception):
+    """Raised by Job.check_cancelled() to unwind a cancelled job"""
+
+
+class Job:
+    def __init__(self, description='', low_priority=False, key=None):
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.low_priority = low_priority
+        self.key = key
+        self.holders = 1  # sessions following the job; see JobQueue.submit(key=...)
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.events = []  # partial results, in order
+        self.notes = []   # warnings worth showing alongside the result
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def elapsed(self):
+        start = self.started_at or self.created_at
+        return (self.finished_at or time.time()) - start
+
+    def emit(self, event):
+        self.events.append(event)
+
+    def note(self, message):
+        self.notes.append(message)
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+
+class JobQueue:
+    """submit(fn) runs fn(job) on a shared pool and returns the Job right away"""
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_queued=DEFAULT_MAX_QUEUED, keep_seconds=KEEP_FINISHED_SECONDS):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.keep_seconds = keep_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._keyed = {}  # key -> unfinished job
+        self._lock = threading.Lock()
+        self.stats = {"shared": 0}
+
+    def submit(self, fn, description='', low_priority=False, key=None):
+        """Queue fn(job); with a key, an unfinished job for the same key is returned instead"""
+        job = Job(description, low_priority, key)
+        with self._lock:
+            self._prune()
+            leader = self._keyed.get(key) if key is not None else None
+            if leader is not None and not leader.finished and not leader.cancelled:
+                leader.holders += 1
+                self.stats["shared"] += 1
+                metrics.inc("jobs_shared")
+                return leader
+            unfinished = sum(not j.finished for j in self._jobs.values())
+            limit = self.max_workers if low_priority else self.max_workers + self.max_queued
+            if unfinished >= limit:
+                raise QueueFull(f"{unfinished} jobs already queued or running")
+            self._jobs[job.id] = job
+            if key is not None:
+                self._keyed[key] = job
+        job.future = self._pool.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Ask a job to stop; returns False if it is unknown or already finished
+
+        A shared job keeps running for the sessions still holding it.
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        with self._lock:
+            job.holders -= 1
+            if job.holders > 0:
+                return True
+            # Under the lock, so submit() never hands out a job about to stop
+            job._cancel.set()
+        if job.future is not None and job.future.cancel():
+            # Never started, so nothing else will mark it
+            self._finish(job, 'cancelled')
+        return True
+
+    def counts(self):
+        with self._lock:
+            counts = dict.fromkeys(('queued', 'running') + FINISHED, 0)
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def _run(self, job, fn):
+        if job.cancelled:
+            self._finish(job, 'cancelled')
+            return
+        job.started_at = time.time()
+        job.status = 'running'
+        metrics.observe("phase_seconds", job.started_at - job.created_at, phase="job_queue_wait")
+        try:
+            result = fn(job)
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, 'failed')
+        else:
+            if job.cancelled:
+                self._finish(job, 'cancelled')
+            else:
+                job.result = result
+                self._finish(job, 'done')
+
+    def _finish(self, job, status):
+        with self._lock:
+            if job.key is not None and self._keyed.get(job.key) is job:
+                del self._keyed[job.key]
+        job.finished_at = time.time()
+        job.status = status
+        metrics.inc("jobs", status=status)
+        if job.started_at is not None:
+            metrics.observe("phase_seconds", job.finished_at - job.started_at, phase="job", status=status)
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self._jobs[job_id]
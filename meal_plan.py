@@ -0,0 +1,173 @@
+"""Meal plans: several recipes per request, chosen for a short combined shopping list
+
+generate_meal_plan() asks for a few more candidates than the plan needs,
+PLAN_BATCH_SIZE recipes per request with the batches running concurrently.
+select_plan() then keeps the recipes with the fewest distinct items to buy:
+every candidate becomes a row of a boolean recipe x item matrix, a greedy
+pass adds whichever recipe brings in the fewest new items, and a swap pass
+trades chosen recipes for unused ones while that shrinks the list. A recipe
+left needing more than MAX_UNIQUE_ITEMS items nothing else in the plan uses
+is regenerated once, with the plan's other items in the prompt, and the
+selection runs again.
+"""
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, NamedTuple
+
+import numpy as np
+
+from recipe_generator import MAX_VARIANT_WORKERS, PLAN_BATCH_SIZE, generate_plan_batch
+from recipe_index import ingredient_set, recipe_identity
+
+MAX_PLAN_SIZE = 21
+# Candidates generated per recipe in the plan
+CANDIDATE_FACTOR = 1.5
+# Items only one recipe in the plan needs before that recipe is regenerated
+MAX_UNIQUE_ITEMS = 3
+MAX_SWAP_ROUNDS = 10
+
+
+class MealPlan(NamedTuple):
+    recipes: List[dict]     # in plan order
+    requests: int           # generation requests made
+    candidates: int         # recipes generated to choose from
+    items: int              # distinct items to buy for the plan
+    baseline_items: int     # the same for the first recipes generated, before selection
+    shared: List[str]       # items more than one recipe in the plan uses
+    notes: List[str]
+
+
+def candidate_count(count):
+    return math.ceil(count * CANDIDATE_FACTOR)
+
+
+def batch_sizes(total):
+    """Split total recipes into requests of at most PLAN_BATCH_SIZE"""
+    return [min(PLAN_BATCH_SIZE, total - start) for start in range(0, total, PLAN_BATCH_SIZE)]
+
+
+def incidence(recipes, pantry=()):
+    """Boolean recipes x items matrix of what each recipe needs beyond the pantry, and the item names"""
+    have = ingredient_set(pantry)
+    needs = [ingredient_set(recipe.get('ingredients', [])) - have for recipe in recipes]
+    vocabulary = sorted(set().union(*needs))
+    column = {name: i for i, name in enumerate(vocabulary)}
+    matrix = np.zeros((len(recipes), len(vocabulary)), dtype=bool)
+    for row, names in enumerate(needs):
+        matrix[row, [column[name] for name in names]] = True
+    return matrix, vocabulary
+
+
+def items_to_buy(recipes, pantry=()):
+    return int(incidence(recipes, pantry)[0].any(axis=0).sum())
+
+
+def select_plan(recipes, count, pantry=()):
+    """Indices of count recipes with a short combined shopping list, greedy then swaps"""
+    matrix, _ = incidence(recipes, pantry)
+    have = ingredient_set(pantry)
+    pantry_used = np.array([len(ingredient_set(recipe.get('ingredients', [])) & have) for recipe in recipes])
+    free = np.ones(len(recipes), dtype=bool)
+    covered = np.zeros(matrix.shape[1], dtype=bool)
+    chosen = []
+
+    for _ in range(min(count, len(recipes))):
+        rows = np.flatnonzero(free)
+        new = (matrix[rows] & ~covered).sum(axis=1)
+        reused = (matrix[rows] & covered).sum(axis=1) + pantry_used[rows]
+        # Fewest new items, then the most reuse of the pantry and the plan so far
+        best = rows[np.lexsort((-reused, new))[0]]
+        chosen.append(best)
+        free[best] = False
+        covered |= matrix[best]
+
+    for _ in range(MAX_SWAP_ROUNDS):
+        improved = False
+        for slot, row in enumerate(chosen):
+            unused = np.flatnonzero(free)
+            if not len(unused):
+                break
+            rest = matrix[chosen[:slot] + chosen[slot + 1:]].any(axis=0)
+            added = (matrix[unused] & ~rest).sum(axis=1)
+            if added.min() < (matrix[row] & ~rest).sum():
+                best = unused[added.argmin()]
+                free[row], free[best] = True, False
+                chosen[slot] = best
+                improved = True
+        if not improved:
+            break
+    return [int(row) for row in chosen]
+
+
+def weak_slots(recipes, chosen, pantry=()):
+    """Chosen indices whose recipe needs more than MAX_UNIQUE_ITEMS items no other chosen recipe uses"""
+    matrix, _ = incidence([recipes[i] for i in chosen], pantry)
+    unique = (matrix & (matrix.sum(axis=0) == 1)).sum(axis=1)
+    return [chosen[i] for i in np.flatnonzero(unique > MAX_UNIQUE_ITEMS)]
+
+
+def generate_meal_plan(client, model_name, pantry, count, structured=False, preferences=None, usage=None,
+                       on_recipes=None, max_workers=MAX_VARIANT_WORKERS):
+    """Generate candidates in batches, choose the plan and regenerate its poorest fits once
+
+    on_recipes(recipes) is called with each batch's new recipe dicts as it
+    arrives; raising from it stops the plan.
+    """
+    count = max(1, min(count, MAX_PLAN_SIZE))
+    candidates, batches, notes = [], {}, []
+    seen = set()
+
+    def collect(batch, recipes):
+        fresh = []
+        for recipe in recipes:
+            recipe = recipe.to_dict()
+            identity = recipe_identity(recipe, ingredient_set(recipe['ingredients']))
+            if identity not in seen:
+                seen.add(identity)
+                fresh.append(recipe)
+        candidates.extend(fresh)
+        batches[batch] = fresh
+        if on_recipes is not None:
+            on_recipes(fresh)
+
+    sizes = batch_sizes(candidate_count(count))
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(sizes))) as pool:
+        futures = {
+            pool.submit(generate_plan_batch, client, model_name, pantry, size, structured, batch,
+                        preferences, usage=usage): batch
+            for batch, size in enumerate(sizes)
+        }
+        for future in as_completed(futures):
+            try:
+                recipes = future.result()
+            except Exception as e:
+                notes.append(f"Generation error (batch {futures[future] + 1}): {str(e)[:100]}")
+                continue
+            collect(futures[future], recipes)
+    requests = len(sizes)
+    baseline = [recipe for batch in sorted(batches) for recipe in batches[batch]][:count]
+
+    chosen = select_plan(candidates, count, pantry)
+    weak = weak_slots(candidates, chosen, pantry)
+    redo = min(len(weak) + count - len(chosen), PLAN_BATCH_SIZE)
+    if redo and candidates:
+        keep = [candidates[i] for i in chosen if i not in weak]
+        matrix, vocabulary = incidence(keep, pantry)
+        buying = [vocabulary[i] for i in np.flatnonzero(matrix.any(axis=0))]
+        requests += 1
+        try:
+            recipes = generate_plan_batch(client, model_name, pantry, redo, structured, len(sizes),
+                                          preferences, shared=buying, usage=usage)
+        except Exception as e:
+            notes.append(f"Generation error (replacements): {str(e)[:100]}")
+        else:
+            collect(len(sizes), recipes)
+            chosen = select_plan(candidates, count, pantry)
+
+    plan = [candidates[i] for i in chosen]
+    matrix, vocabulary = incidence(plan, pantry)
+    shared = [vocabulary[i] for i in np.flatnonzero(matrix.sum(axis=0) > 1)]
+    if plan and len(plan) < count:
+        notes.append(f"Only {len(plan)} of {count} recipes could be generated")
+    return MealPlan(plan, requests, len(candidates), int(matrix.any(axis=0).sum()),
+                    items_to_buy(baseline, pantry), shared, notes)
@@ -0,0 +1,184 @@
+"""Process-wide timing spans, histograms and counters
+
+    with metrics.span("gemini_call", model=model_name):
+        ...
+    metrics.inc("cache_lookups", result="hit")
+
+Spans record into the phase_seconds histogram, labelled by phase plus any
+extra labels. A span that raises also counts into errors_total. Each
+histogram series keeps Prometheus buckets for the text export and a bounded
+window of recent samples for the p50/p95/p99 shown in the app.
+Set RECIPE_DOCTOR_METRICS_PORT to also serve the export at /metrics.
+"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAMESPACE = "recipe_doctor"
+
+# Seconds; covers cache hits through slow multi-variant generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Recent samples kept per histogram series for percentiles
+WINDOW_SIZE = 2048
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=WINDOW_SIZE):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99)):
+        samples = sorted(self.recent)
+        if not samples:
+            return {q: None for q in quantiles}
+        last = len(samples) - 1
+        return {q: samples[min(last, int(round(q * last)))] for q in quantiles}
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+class Registry:
+    """Counters and histograms keyed by (name, sorted labels)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, phase, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.inc("errors", phase=phase, error=type(e).__name__, **labels)
+            raise
+        finally:
+            self.observe("phase_seconds", time.perf_counter() - start, phase=phase, **labels)
+
+    def counter_values(self, name):
+        """{sorted label pairs: value} for one counter"""
+        with self._lock:
+            return {labels: value for (n, labels), value in self.counters.items() if n == name}
+
+    def latency_summary(self, name="phase_seconds"):
+        """Rows of labels, count, mean and p50/p95/p99 for one histogram, slowest p95 first"""
+        with self._lock:
+            rows = [
+                (dict(labels), histogram.count, histogram.sum / histogram.count, histogram.percentiles())
+                for (n, labels), histogram in self.histograms.items() if n == name and histogram.count
+            ]
+        return sorted(rows, key=lambda row: -row[3][0.95])
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def export_text(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, (h.buckets, list(h.counts), h.count, h.sum)) for key, h in self.histograms.items()
+            )
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{NAMESPACE}_{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            metric = f"{NAMESPACE}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _format_value(bound)
+                lines.append(f"{metric}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+span = REGISTRY.span
+
+
+def serve(port, registry=REGISTRY, host="0.0.0.0"):
+    """Serve the text export at /metrics from a daemon thread; returns the server"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.export_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # scrapes would flood the Streamlit log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def serve_from_env(var="RECIPE_DOCTOR_METRICS_PORT"):
+    """Start the /metrics server if the port variable is set; returns the server or None"""
+    port = os.environ.get(var)
+    return serve(int(port)) if port else None
@@ -0,0 +1,148 @@
+"""Local nutrition estimates and serving scaling
+
+Ingredient lines are parsed with shopping_list.parse_item, matched to the
+bundled nutrients.csv table and converted to grams. The table is loaded
+once into NumPy arrays, so per-serving calories and macros for any number
+of recipes come out of a handful of array operations rather than another
+Gemini call. Quantities rescale to any serving count the same way.
+"""
+import csv
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from ingredient_extractor import extract_ingredients
+from shopping_list import parse_item, scale_line
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nutrients.csv")
+MACROS = ("calories", "protein_g", "carbs_g", "fat_g")
+DEFAULT_SERVINGS = 2
+
+# Weight of one count unit; None means the food's own piece weight ("2 cloves garlic")
+COUNT_UNIT_GRAMS = {
+    'clove': None, 'piece': None, 'slice': 30.0, 'can': 400.0, 'pinch': 0.4, 'dash': 0.6,
+    'bunch': 100.0, 'head': 500.0, 'stalk': 40.0, 'sprig': 1.0, 'package': 250.0, 'handful': 30.0,
+    'leaf': 0.5,
+}
+
+_MASS, _VOLUME, _COUNT = 0, 1, 2
+
+
+def load_table(path=TABLE_PATH):
+    """(names, per-100 g macros, g per ml, g per piece) from the bundled CSV"""
+    with open(path, encoding="utf-8") as f:
+        rows = list(csv.DictReader(line for line in f if not line.startswith('#')))
+    names = [row['name'] for row in rows]
+    per_100g = np.array([[float(row[c]) for c in ('kcal', 'protein_g', 'carbs_g', 'fat_g')] for row in rows])
+    density = np.array([float(row['g_per_ml']) for row in rows])
+    grams_each = np.array([float(row['g_each']) for row in rows])
+    return names, per_100g, density, grams_each
+
+
+NAMES, PER_100G, DENSITY, GRAMS_EACH = load_table()
+_INDEX = {name: i for i, name in enumerate(NAMES)}
+
+
+def food_index(name):
+    """Table row for an ingredient, falling back to its generic tail ("ground beef" -> "beef"); -1 if unknown"""
+    for candidate in extract_ingredients(name)[:1] + [name]:
+        words = candidate.split()
+        for start in range(len(words)):
+            row = _INDEX.get(' '.join(words[start:]))
+            if row is not None:
+                return row
+    return -1
+
+
+@lru_cache(maxsize=4096)
+def _parse_line(line):
+    """(food row, quantity, kind, grams per unit or NaN) for one ingredient line"""
+    item = parse_item(line)
+    food = food_index(item.name)
+    if food < 0 or item.quantity is None:
+        # Unknown foods and "salt to taste" add nothing
+        return food, 0.0, _MASS, np.nan
+    if item.dimension == 'mass':
+        return food, item.quantity, _MASS, np.nan
+    if item.dimension == 'volume':
+        return food, item.quantity, _VOLUME, np.nan
+    unit_grams = COUNT_UNIT_GRAMS.get(item.dimension)
+    return food, item.quantity, _COUNT, np.nan if unit_grams is None else unit_grams
+
+
+def servings_of(recipe, default=DEFAULT_SERVINGS):
+    match = re.search(r'\d+', str(recipe.get('servings', '')))
+    return int(match.group()) if match and int(match.group()) > 0 else default
+
+
+def nutrition_batch(recipes):
+    """Per-serving (calories, protein, carbs, fat) rows and the share of lines matched, one per recipe"""
+    recipe_ids, parsed = [], []
+    lines_per_recipe = np.zeros(len(recipes))
+    for i, recipe in enumerate(recipes):
+        lines = recipe.get('ingredients', [])
+        lines_per_recipe[i] = len(lines)
+        recipe_ids.extend([i] * len(lines))
+        parsed.extend(_parse_line(str(line)) for line in lines)
+    totals = np.zeros((len(recipes), len(MACROS)))
+    servings = np.array([servings_of(recipe) for recipe in recipes], dtype=float)
+    if not parsed:
+        return totals, np.zeros(len(recipes))
+
+    recipe_ids = np.array(recipe_ids)
+    food, quantity, kind, unit_grams = (np.array(column) for column in zip(*parsed))
+    known = food >= 0
+    food = np.where(known, food, 0)
+
+    # Everything to grams: mass as is, volume by density, counts by unit or piece weight
+    piece = np.where(np.isnan(unit_grams), GRAMS_EACH[food], unit_grams)
+    grams = np.select([kind == _MASS, kind == _VOLUME], [quantity, quantity * DENSITY[food]], quantity * piece)
+    grams = np.where(known, grams, 0.0)
+
+    per_line = PER_100G[food] * (grams / 100.0)[:, None]
+    np.add.at(totals, recipe_ids, per_line)
+    matched = np.bincount(recipe_ids, weights=known, minlength=len(recipes))
+    coverage = np.divide(matched, lines_per_recipe, out=np.zeros(len(recipes)), where=lines_per_recipe > 0)
+    return totals / servings[:, None], coverage
+
+
+def as_facts(row, coverage, lines=0):
+    """One nutrition_batch row as a dict of MACROS plus coverage and the recipe's ingredient line count"""
+    facts = {name: round(float(value)) for name, value in zip(MACROS, row)}
+    facts['coverage'] = float(coverage)
+    facts['lines'] = int(lines)
+    return facts
+
+
+def nutrition_facts(recipe):
+    """Per-serving estimate for one recipe"""
+    rows, coverage = nutrition_batch([recipe])
+    return as_facts(rows[0], coverage[0], len(recipe.get('ingredients', [])))
+
+
+def format_nutrition(facts):
+    if not facts['coverage']:
+        return "Not enough known ingredients to estimate"
+    text = (f"{facts['calories']} kcal · {facts['protein_g']} g protein · "
+            f"{facts['carbs_g']} g carbs · {facts['fat_g']} g fat per serving")
+    if facts['coverage'] < 1:
+        # Unknown ingredients add nothing, so a partial estimate runs low
+        lines = facts.get('lines', 0)
+        share = (f"{round(facts['coverage'] * lines)} of {lines} ingredients" if lines
+                 else f"{facts['coverage']:.0%} of the ingredients")
+        text += f" (based on {share}, so likely low)"
+    return text
+
+
+def scale_recipe(recipe, servings):
+    """Copy of a recipe with ingredient amounts rescaled to a new serving count"""
+    current = servings_of(recipe)
+    if servings == current:
+        return recipe
+    factor = servings / current
+    scaled = dict(recipe)
+    scaled['ingredients'] = [scale_line(str(line), factor) for line in recipe.get('ingredients', [])]
+    scaled['servings'] = str(servings)
+    return scaled
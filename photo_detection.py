@@ -0,0 +1,163 @@
+"""Ingredient detection from fridge and pantry photos
+
+Photos are downscaled and recompressed with Pillow before upload, so a
+12 MP phone picture goes out as a JPEG of a few hundred KB at most.
+Detection results are cached by a 64-bit difference hash (dHash) of the
+image. Repeat shots of the same shelf differ by only a few bits, so they
+are answered from the cache without another Gemini call.
+"""
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from google.genai import types
+from PIL import Image, ImageOps
+
+from ingredient_extractor import canonical_ingredients
+
+MAX_IMAGE_SIDE = 1024
+JPEG_QUALITY = 80
+
+# Photos whose hashes differ in at most this many of 64 bits count as the same
+MAX_HASH_DISTANCE = 6
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+DETECTION_PROMPT = (
+    "List every food ingredient you can identify in this photo. "
+    "Use short generic names like \"eggs\" or \"cheddar cheese\" and leave out brands, "
+    "containers and non-food items."
+)
+
+DETECTION_CONFIG = {
+    "temperature": 0.2,
+    "max_output_tokens": 400,
+    "response_mime_type": "application/json",
+    "response_schema": {"type": "ARRAY", "items": {"type": "STRING"}},
+}
+
+
+def prepare_image(data, max_side=MAX_IMAGE_SIDE, quality=JPEG_QUALITY):
+    """Downscale and recompress image bytes; returns (jpeg_bytes, PIL image)"""
+    image = Image.open(io.BytesIO(data))
+    # Phone photos are often stored sideways with an EXIF rotation flag
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue(), image
+
+
+def dhash(image, size=8):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy"""
+    small = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hash_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class PhotoCache:
+    """Detected ingredients keyed by image hash, looked up by Hamming distance"""
+
+    def __init__(self, path, ttl=DEFAULT_TTL_SECONDS, max_distance=MAX_HASH_DISTANCE):
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS photo_detections ("
+            " hash INTEGER PRIMARY KEY,"
+            " ingredients TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM photo_detections WHERE created_at <= ?", (time.time() - ttl,))
+        self._conn.commit()
+        # Hashes are few and small, so near-duplicate lookups scan them in memory
+        self._entries = {
+            _unsigned(h): (json.loads(ingredients), created_at)
+            for h, ingredients, created_at in self._conn.execute("SELECT * FROM photo_detections")
+        }
+
+    def get(self, image_hash):
+        """Ingredients for the closest cached photo within max_distance, or None"""
+        now = time.time()
+        with self._lock:
+            best, best_distance = None, self.max_distance + 1
+            for cached_hash, (ingredients, created_at) in self._entries.items():
+                if now - created_at >= self.ttl:
+                    continue
+                distance = hash_distance(image_hash, cached_hash)
+                if distance < best_distance:
+                    best, best_distance = ingredients, distance
+            self.stats["hits" if best is not None else "misses"] += 1
+            return best
+
+    def set(self, image_hash, ingredients):
+        now = time.time()
+        with self._lock:
+            self._entries[image_hash] = (list(ingredients), now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO photo_detections (hash, ingredients, created_at) VALUES (?, ?, ?)",
+                (_signed(image_hash), json.dumps(list(ingredients)), now)
+            )
+            self._conn.commit()
+
+
+# SQLite integers are signed 64-bit
+def _signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def detect_ingredients_in_photo(client, model_name, jpeg_bytes, usage=None):
+    """Ask Gemini which ingredients are in a prepared JPEG; returns canonical names"""
+    response = client.models.generate_content(
+        model=model_name,
+        contents=[types.Part.from_bytes(data=jpeg_bytes, mime_type="image/jpeg"), DETECTION_PROMPT],
+        config=DETECTION_CONFIG
+    )
+    if usage is not None:
+        usage.record(getattr(response, 'usage_metadata', None))
+    try:
+        names = json.loads(response.text or "[]")
+    except ValueError:
+        # Fall back to treating the reply as a plain list
+        names = [response.text or ""]
+    if not isinstance(names, list):
+        names = [names]
+    return canonical_ingredients(str(name) for name in names)
+
+
+def detect_ingredients(client, model_name, data, cache=None, usage=None):
+    """Ingredients in an uploaded photo, from the cache when a near-identical one was seen
+
+    Returns (ingredients, from_cache, upload_size).
+    """
+    jpeg_bytes, image = prepare_image(data)
+    image_hash = dhash(image)
+    if cache is not None:
+        cached = cache.get(image_hash)
+        if cached is not None:
+            return cached, True, 0
+    ingredients = detect_ingredients_in_photo(client, model_name, jpeg_bytes, usage)
+    if cache is not None and ingredients:
+        cache.set(image_hash, ingredients)
+    return ingredients, False, len(jpeg_bytes)
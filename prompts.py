@@ -0,0 +1,136 @@
+"""Prompt building and token accounting for recipe generation
+
+The static rules and examples live in a system instruction that is identical
+for every request, so the per-request prompt only carries the ingredients
+and preferences. Keeping the stable part first and byte-identical also lets
+Gemini's implicit prefix caching apply to it.
+"""
+import threading
+
+import metrics
+
+_RULES = """You are a chef who writes recipes with specific, actionable instructions.
+
+CRITICAL RULES:
+1. Give EXACT cooking steps with specific times and temperatures
+2. NO generic steps like "prepare ingredients" or "cook as desired"
+3. Each step must be a specific action
+4. Include 5-7 detailed steps
+5. Respect every dietary restriction, cuisine, meal type and skill level given
+
+Example of GOOD steps:
+1. Heat 2 tbsp oil in a pan over medium heat
+2. Chop onions and sauté for 3 minutes until translucent
+3. Add minced garlic and cook for 30 seconds
+4. Crack eggs into bowl, whisk with milk and salt
+5. Pour egg mixture into pan, cook for 2-3 minutes while stirring
+
+Example of BAD steps:
+1. Prepare ingredients
+2. Cook as desired
+3. Serve and enjoy
+"""
+
+TEXT_SYSTEM_INSTRUCTION = _RULES + """
+Reply in exactly this layout:
+RECIPE NAME: [Name]
+DIFFICULTY: Easy/Medium/Hard
+PREP TIME: [exact time] minutes
+COOK TIME: [exact time] minutes
+SERVINGS: [number]
+INGREDIENTS:
+- [Quantity with unit] [specific ingredient]
+STEPS:
+1. [SPECIFIC ACTION with time/temperature]
+TIPS: [Practical tip]"""
+
+STRUCTURED_SYSTEM_INSTRUCTION = _RULES + """
+Reply with JSON only. Give times in minutes and keep each ingredient's quantity separate from the item."""
+
+BASE_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.8,
+    "max_output_tokens": 1000
+}
+
+
+def generation_config(structured=False, temperature=None, response_schema=None):
+    """Config dict for generate_content with the matching system instruction"""
+    config = dict(BASE_GENERATION_CONFIG)
+    if temperature is not None:
+        config["temperature"] = temperature
+    if structured:
+        config["system_instruction"] = STRUCTURED_SYSTEM_INSTRUCTION
+        config["response_mime_type"] = "application/json"
+        if response_schema is not None:
+            config["response_schema"] = response_schema
+    else:
+        config["system_instruction"] = TEXT_SYSTEM_INSTRUCTION
+    return config
+
+
+def build_request_prompt(ingredients_list, preferences=None, twist=None):
+    """The small per-request part: ingredients, preferences and an optional variation"""
+    preferences = preferences or {}
+    lines = [f"Ingredients: {', '.join(ingredients_list)}"]
+
+    dietary_prefs = preferences.get("dietary_prefs")
+    if dietary_prefs:
+        lines.append(f"Dietary restrictions: {', '.join(dietary_prefs)}")
+    for key, label in (("cuisine", "Cuisine"), ("meal_type", "Meal type"), ("skill_level", "Cook skill level")):
+        value = preferences.get(key)
+        if value and value != "Any":
+            lines.append(f"{label}: {value}")
+    if twist:
+        lines.append(f"Variation: {twist}")
+    return "\n".join(lines)
+
+
+def build_plan_prompt(ingredients_list, count, preferences=None, twist=None, shared=None, structured=False):
+    """Request for several recipes in one reply that share as many ingredients as possible"""
+    lines = [build_request_prompt(ingredients_list, preferences, twist), f"Recipes: {count}"]
+    if shared:
+        lines.append(f"Prefer these ingredients: {', '.join(shared)}")
+    layout = ("Reply with a JSON array of the recipes." if structured else
+              "Use the layout for every recipe, starting each one with its own RECIPE NAME line.")
+    lines.append(
+        f"Plan: write {count} different recipes that reuse each other's ingredients, so one short "
+        f"shopping list covers them all. {layout}"
+    )
+    return "\n".join(lines)
+
+
+class TokenUsage:
+    """Running token totals from response.usage_metadata"""
+
+    FIELDS = ("prompt", "output", "total", "cached")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+        self.last = None
+
+    def record(self, usage_metadata):
+        """Add one response's counts; returns them as a dict (or None if absent)"""
+        if usage_metadata is None:
+            return None
+        counts = {
+            "prompt": getattr(usage_metadata, "prompt_token_count", None) or 0,
+            "output": getattr(usage_metadata, "candidates_token_count", None) or 0,
+            "total": getattr(usage_metadata, "total_token_count", None) or 0,
+            "cached": getattr(usage_metadata, "cached_content_token_count", None) or 0,
+        }
+        with self._lock:
+            self.requests += 1
+            for field in self.FIELDS:
+                self.totals[field] += counts[field]
+            self.last = counts
+        for field in self.FIELDS:
+            if counts[field]:
+                metrics.inc("tokens", counts[field], kind=field)
+        return counts
+
+    def average(self, field):
+        with self._lock:
+            return self.totals[field] / self.requests if self.requests else 0.0
@@ -0,0 +1,243 @@
+"""Two-tier response cache for generated recipes (in-memory LRU + SQLite)
+
+Cached recipes also get LSH band keys (see similarity.py), so set() can flag
+a new recipe that nearly duplicates one cached for a different request.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from ingredient_extractor import canonical_ingredients
+from similarity import DUPLICATE_THRESHOLD, band_keys, signature, similarities, to_blob
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MEMORY_ITEMS = 256
+DEFAULT_DISK_ITEMS = 10000
+
+
+def normalize_ingredients(ingredients_list):
+    """Canonical ingredient names without duplicates; order, case and plurals do not matter"""
+    return sorted(canonical_ingredients(str(ing) for ing in ingredients_list or []))
+
+
+def make_cache_key(ingredients_list, dietary_prefs, cuisine, meal_type, skill_level, model_name, variant=0):
+    """Stable key for one generation request"""
+    payload = {
+        "ingredients": normalize_ingredients(ingredients_list),
+        "dietary_prefs": sorted(dietary_prefs or []),
+        "cuisine": cuisine or "",
+        "meal_type": meal_type or "",
+        "skill_level": skill_level or "",
+        "model": model_name or "",
+    }
+    if variant:
+        payload["variant"] = variant
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RecipeCache:
+    """LRU in front of an on-disk SQLite store, both with TTL and size limits"""
+
+    def __init__(self, path, ttl=DEFAULT_TTL_SECONDS, max_memory_items=DEFAULT_MEMORY_ITEMS,
+                 max_disk_items=DEFAULT_DISK_ITEMS):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "near_duplicates": 0}
+        self._memory = OrderedDict()
+        # key -> last memory hit not yet written to accessed_at; flushed before eviction
+        self._touched = {}
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS recipe_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_recipe_cache_accessed ON recipe_cache(accessed_at)"
+        )
+        # Signature and one row per LSH band of each cached recipe; position is its index in the value list
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS recipe_cache_minhash ("
+            " key TEXT NOT NULL REFERENCES recipe_cache(key) ON DELETE CASCADE,"
+            " position INTEGER NOT NULL,"
+            " minhash BLOB NOT NULL,"
+            " PRIMARY KEY (key, position))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS recipe_cache_bands ("
+            " key TEXT NOT NULL REFERENCES recipe_cache(key) ON DELETE CASCADE,"
+            " position INTEGER NOT NULL,"
+            " bucket INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_recipe_cache_bands_bucket ON recipe_cache_bands(bucket)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_recipe_cache_bands_key ON recipe_cache_bands(key)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        """Return the cached recipes for key, or None on a miss or expired entry"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._touched[key] = now
+                    self.stats["memory_hits"] += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, created_at FROM recipe_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM recipe_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.stats["misses"] += 1
+                return None
+
+            value, created_at = row
+            self._touched[key] = now
+            self._flush_touched()
+            self._conn.commit()
+            self._remember(key, created_at, value)
+            self.stats["disk_hits"] += 1
+            return json.loads(value)
+
+    def set(self, key, recipes):
+        """Store recipes in both tiers and evict whatever is over the limits
+
+        Returns (recipe name, similar cached recipe name, similarity) for
+        every recipe that nearly duplicates one cached under another key.
+        """
+        now = time.time()
+        value = json.dumps(recipes)
+        signatures = [signature(recipe) for recipe in recipes]
+        duplicates = []
+        with self._lock:
+            self._remember(key, now, value)
+            self._touched.pop(key, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO recipe_cache (key, value, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._conn.execute("DELETE FROM recipe_cache_bands WHERE key = ?", (key,))
+            self._conn.execute("DELETE FROM recipe_cache_minhash WHERE key = ?", (key,))
+            for position, sig in enumerate(signatures):
+                if sig is None:
+                    continue
+                buckets = band_keys(sig)
+                match = self._find_similar(key, sig, buckets, now)
+                if match:
+                    duplicates.append((recipes[position].get('recipe_name'), *match))
+                self._conn.execute(
+                    "INSERT INTO recipe_cache_minhash (key, position, minhash) VALUES (?, ?, ?)",
+                    (key, position, to_blob(sig))
+                )
+                self._conn.executemany(
+                    "INSERT INTO recipe_cache_bands (key, position, bucket) VALUES (?, ?, ?)",
+                    [(key, position, bucket) for bucket in buckets]
+                )
+            # Memory hits count as use too, or the hottest keys would be evicted first
+            self._flush_touched()
+            self._evict_disk(now)
+            self._conn.commit()
+            self.stats["writes"] += 1
+            self.stats["near_duplicates"] += len(duplicates)
+        return duplicates
+
+    def _find_similar(self, key, sig, buckets, now):
+        """(name, similarity) of the closest recipe cached under another key, if a near-duplicate"""
+        rows = self._conn.execute(
+            "SELECT m.key, m.position, m.minhash FROM recipe_cache_minhash m"
+            " JOIN recipe_cache c ON c.key = m.key WHERE (m.key, m.position) IN"
+            f" (SELECT key, position FROM recipe_cache_bands WHERE bucket IN ({', '.join('?' * len(buckets))}))"
+            " AND m.key != ? AND c.created_at > ?",
+            (*buckets, key, now - self.ttl)
+        ).fetchall()
+        scores = similarities(sig, [blob for _, _, blob in rows])
+        if not len(scores) or scores.max() < DUPLICATE_THRESHOLD:
+            return None
+        other, position, _ = rows[int(scores.argmax())]
+        value = self._conn.execute("SELECT value FROM recipe_cache WHERE key = ?", (other,)).fetchone()[0]
+        return json.loads(value)[position].get('recipe_name'), float(scores.max())
+
+    def contains(self, key):
+        """Whether key has an unexpired entry, without touching hit stats or recency"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                return time.time() - entry[0] < self.ttl
+            row = self._conn.execute(
+                "SELECT created_at FROM recipe_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] < self.ttl
+
+    def iter_recipes(self):
+        """Every unexpired cached recipe as (created_at, recipe), without touching hit stats or recency"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT value, created_at FROM recipe_cache WHERE created_at > ? ORDER BY created_at",
+                (time.time() - self.ttl,)
+            ).fetchall()
+        for value, created_at in rows:
+            for recipe in json.loads(value):
+                yield created_at, recipe
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self._conn.execute("DELETE FROM recipe_cache")
+            self._conn.commit()
+
+    def _remember(self, key, created_at, value):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        """Write pending hit times to accessed_at in one batch"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE recipe_cache SET accessed_at = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict_disk(self, now):
+        self._conn.execute("DELETE FROM recipe_cache WHERE created_at <= ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM recipe_cache").fetchone()[0]
+        if count > self.max_disk_items:
+            # Drop the least recently used rows
+            self._conn.execute(
+                "DELETE FROM recipe_cache WHERE key IN ("
+                " SELECT key FROM recipe_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_disk_items,)
+            )
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
@@ -0,0 +1,118 @@
+"""Streamlit-free recipe generation on top of a genai client"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from prompts import build_plan_prompt, build_request_prompt, generation_config
+from recipe_parser import (PLAN_SCHEMA, RECIPE_SCHEMA, parse_recipe_json, parse_recipe_text, parse_recipe_texts,
+                           parse_recipes_json)
+
+# Variant 0 is the plain request; the others nudge temperature and style
+VARIANTS = [
+    (0.7, None),
+    (0.9, "Use a different main cooking method than the most obvious one"),
+    (1.0, "Give it a bolder flavor profile with a twist from another cuisine"),
+    (0.8, "Make a quicker, simpler version with as few steps as possible"),
+]
+MAX_VARIANT_WORKERS = 4
+
+# Recipes per meal-plan request, and output tokens allowed for each of them
+PLAN_BATCH_SIZE = 7
+PLAN_TOKENS_PER_RECIPE = 700
+
+
+def request_config(structured=False, variant=0):
+    """Generation config for a variant, with the system instruction and schema"""
+    temperature = VARIANTS[variant % len(VARIANTS)][0]
+    return generation_config(structured, temperature, RECIPE_SCHEMA if structured else None)
+
+
+def request_prompt(ingredients_list, preferences=None, variant=0):
+    return build_request_prompt(ingredients_list, preferences, VARIANTS[variant % len(VARIANTS)][1])
+
+
+def generate_recipe_text(client, model_name, ingredients_list, structured=False, variant=0,
+                         preferences=None, usage=None):
+    """Send one generation request and return the raw response text
+
+    preferences is a dict with any of dietary_prefs, cuisine, meal_type and
+    skill_level; usage is an optional prompts.TokenUsage to record into.
+    """
+    response = client.models.generate_content(
+        model=model_name,
+        contents=request_prompt(ingredients_list, preferences, variant),
+        config=request_config(structured, variant)
+    )
+    if usage is not None:
+        usage.record(getattr(response, 'usage_metadata', None))
+    return (response.text or '').strip()
+
+
+def parse_response(text, structured=False):
+    """Parse a response into a Recipe, using the text parser if JSON validation fails"""
+    if structured:
+        try:
+            return parse_recipe_json(text)
+        except ValueError:
+            metrics.inc("parse_fallbacks", reason='invalid_json')
+    return parse_recipe_text(text)
+
+
+def generate_recipe(client, model_name, ingredients_list, structured=False, variant=0,
+                    preferences=None, usage=None):
+    """Generate and parse one recipe"""
+    text = generate_recipe_text(client, model_name, ingredients_list, structured, variant, preferences, usage)
+    return parse_response(text, structured)
+
+
+def generate_variants(client, model_name, ingredients_list, variants, structured=False,
+                      preferences=None, usage=None, max_workers=MAX_VARIANT_WORKERS):
+    """Run several variant requests concurrently
+
+    Yields (variant, Recipe) pairs in completion order; a failed request
+    yields (variant, exception) instead of stopping the others.
+    """
+    variants = list(variants)
+    if not variants:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(variants))) as pool:
+        futures = {
+            pool.submit(generate_recipe, client, model_name, ingredients_list, structured, variant,
+                        preferences, usage): variant
+            for variant in variants
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+
+def plan_config(count, structured=False, batch=0):
+    """Like request_config, with room in the reply for count recipes"""
+    temperature = VARIANTS[batch % len(VARIANTS)][0]
+    config = generation_config(structured, temperature, PLAN_SCHEMA if structured else None)
+    config["max_output_tokens"] = max(config["max_output_tokens"], PLAN_TOKENS_PER_RECIPE * count)
+    return config
+
+
+def generate_plan_batch(client, model_name, ingredients_list, count, structured=False, batch=0,
+                        preferences=None, shared=None, usage=None):
+    """One request for count recipes; returns the parsed Recipes (possibly fewer than asked)
+
+    batch picks the variation, so concurrent batches for the same pantry differ.
+    """
+    response = client.models.generate_content(
+        model=model_name,
+        contents=build_plan_prompt(ingredients_list, count, preferences, VARIANTS[batch % len(VARIANTS)][1],
+                                   shared, structured),
+        config=plan_config(count, structured, batch)
+    )
+    if usage is not None:
+        usage.record(getattr(response, 'usage_metadata', None))
+    text = (response.text or '').strip()
+    if structured:
+        try:
+            return parse_recipes_json(text)
+        except ValueError:
+            metrics.inc("parse_fallbacks", reason='invalid_json')
+    return parse_recipe_texts(text)
@@ -0,0 +1,213 @@
+"""Local index of known recipes, matched against a pantry before calling Gemini
+
+Every recipe is reduced to a set of canonical ingredients (see
+ingredient_extractor) and stored as sparse vectors: one posting array
+of recipe ids per ingredient. Scoring a pantry only touches the postings of
+the ingredients in it, and np.bincount turns them into per-recipe overlap
+counts in one vectorized pass, so a lookup stays well under a millisecond
+with hundreds of thousands of recipes.
+
+Saved recipes stay until they are removed. Recipes from the response cache
+are added with their creation time and follow the cache's limits: they stop
+matching after ttl seconds and only the newest max_cached are kept.
+Removed and expired recipes are skipped by match() and dropped for good
+when enough of them pile up.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from ingredient_extractor import canonical_ingredients
+
+# Share of the pantry a recipe must use, and share of the recipe the pantry must cover
+MIN_COVERAGE = 0.8
+MIN_FIT = 0.5
+
+# Assumed to be in every kitchen, so they neither count for nor against a match
+STAPLES = frozenset((
+    'salt', 'pepper', 'black pepper', 'water', 'oil', 'olive oil', 'vegetable oil',
+    'cooking spray', 'ice',
+))
+
+_INITIAL_CAPACITY = 1024
+
+
+def ingredient_set(ingredients):
+    """Canonical, staple-free ingredient names for a recipe or a pantry"""
+    return set(canonical_ingredients(ingredients)) - STAPLES
+
+
+def recipe_identity(recipe, names):
+    """Recipes with the same name and ingredients are only indexed once"""
+    return " ".join(str(recipe.get('recipe_name', '')).lower().split()), frozenset(names)
+
+
+class RecipeIndex:
+    """Sparse ingredient vectors over every recipe the app has seen"""
+
+    def __init__(self, ttl=None, max_cached=None):
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.vocabulary = {}   # canonical ingredient -> column
+        self._postings = []    # column -> int32 buffer of recipe ids
+        self._lengths = []     # column -> used length of that buffer
+        self._sizes = np.zeros(_INITIAL_CAPACITY, dtype=np.int32)
+        # recipe id -> time it stops matching; inf for saved recipes, -inf once removed
+        self._expires = np.full(_INITIAL_CAPACITY, -np.inf)
+        self._recipes = []
+        self._ids = {}                # identity -> recipe id
+        self._cached = OrderedDict()  # ids of cache-sourced recipes, oldest first
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._recipes) - self._dead
+
+    def add(self, recipe, created_at=None):
+        """Index one recipe dict; returns False if it was already indexed or has no ingredients
+
+        created_at marks a recipe from the response cache, which expires and
+        counts against max_cached; without it the recipe stays until removed.
+        """
+        names = ingredient_set(recipe.get('ingredients', []))
+        if not names:
+            return False
+        identity = recipe_identity(recipe, names)
+        cached = created_at is not None
+        expires = created_at + self.ttl if cached and self.ttl is not None else np.inf
+        with self._lock:
+            recipe_id = self._ids.get(identity)
+            if recipe_id is None:
+                self._insert(recipe, names, identity, expires)
+                added = True
+            else:
+                added = self._expires[recipe_id] <= time.time()
+                if self._expires[recipe_id] == -np.inf:
+                    self._dead -= 1
+                # A saved recipe stays saved when it also comes back from the cache
+                if not cached or self._expires[recipe_id] != np.inf:
+                    self._expires[recipe_id] = max(self._expires[recipe_id], expires) if cached else np.inf
+                if not cached:
+                    self._cached.pop(recipe_id, None)
+            recipe_id = self._ids[identity]
+            if cached and self._expires[recipe_id] != np.inf:
+                self._cached[recipe_id] = None
+                self._cached.move_to_end(recipe_id)
+            self._evict()
+        return added
+
+    def add_many(self, recipes, created_at=None):
+        return sum(self.add(recipe, created_at) for recipe in recipes)
+
+    def remove(self, recipe):
+        """Stop matching a recipe, e.g. after it was deleted; returns False if it was not indexed"""
+        names = ingredient_set(recipe.get('ingredients', []))
+        with self._lock:
+            recipe_id = self._ids.get(recipe_identity(recipe, names))
+            if recipe_id is None or self._expires[recipe_id] == -np.inf:
+                return False
+            self._kill(recipe_id)
+            self._compact()
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def _insert(self, recipe, names, identity, expires):
+        recipe_id = self._ids[identity] = len(self._recipes)
+        self._recipes.append(recipe)
+        if recipe_id == len(self._sizes):
+            self._sizes = np.concatenate([self._sizes, np.zeros_like(self._sizes)])
+            self._expires = np.concatenate([self._expires, np.full(len(self._expires), -np.inf)])
+        self._sizes[recipe_id] = len(names)
+        self._expires[recipe_id] = expires
+
+        for name in names:
+            column = self.vocabulary.get(name)
+            if column is None:
+                column = self.vocabulary[name] = len(self._postings)
+                self._postings.append(np.empty(8, dtype=np.int32))
+                self._lengths.append(0)
+            postings, length = self._postings[column], self._lengths[column]
+            if length == len(postings):
+                # Grow by doubling; readers holding the old buffer still see a valid prefix
+                postings = self._postings[column] = np.concatenate([postings, np.empty_like(postings)])
+            postings[length] = recipe_id
+            self._lengths[column] = length + 1
+
+    def _kill(self, recipe_id):
+        self._cached.pop(recipe_id, None)
+        self._expires[recipe_id] = -np.inf
+        self._dead += 1
+
+    def _evict(self):
+        """Drop cache-sourced recipes past their ttl or beyond max_cached, oldest first"""
+        now = time.time()
+        while self._cached:
+            oldest = next(iter(self._cached))
+            if self._expires[oldest] > now and (self.max_cached is None or len(self._cached) <= self.max_cached):
+                break
+            self._kill(oldest)
+        self._compact()
+
+    def _compact(self):
+        """Re-index the live recipes once dead ones make up most of the index"""
+        if self._dead < _INITIAL_CAPACITY or self._dead * 2 < len(self._recipes):
+            return
+        now = time.time()
+        order = {recipe_id: rank for rank, recipe_id in enumerate(self._cached)}
+        live = sorted((i for i in range(len(self._recipes)) if self._expires[i] > now),
+                      key=lambda i: order.get(i, -1))  # saved first, then cached oldest first
+        entries = [(self._recipes[i], self._expires[i], i in order) for i in live]
+        self._reset()
+        for recipe, expires, cached in entries:
+            names = ingredient_set(recipe.get('ingredients', []))
+            identity = recipe_identity(recipe, names)
+            self._insert(recipe, names, identity, expires)
+            if cached:
+                self._cached[self._ids[identity]] = None
+
+    def match(self, pantry, limit=1, min_coverage=MIN_COVERAGE, min_fit=MIN_FIT):
+        """Best indexed recipes for a pantry as (score, recipe) pairs, best first
+
+        coverage is the share of the pantry a recipe uses and fit the share
+        of the recipe the pantry provides; the score is their product.
+        """
+        wanted = ingredient_set(pantry)
+        if not wanted:
+            return []
+        with self._lock:
+            count = len(self._recipes)
+            columns = [self.vocabulary[name] for name in wanted if name in self.vocabulary]
+            postings = [self._postings[c][:self._lengths[c]] for c in columns]
+            sizes = self._sizes[:count]
+            # Copied, since removals and expiry write to it in place
+            expires = self._expires[:count].copy()
+            recipes = self._recipes
+        if not postings:
+            return []
+
+        overlap = np.bincount(np.concatenate(postings), minlength=count)
+        candidates = np.flatnonzero(overlap >= min_coverage * len(wanted))
+        if not candidates.size:
+            return []
+        shared = overlap[candidates]
+        coverage = shared / len(wanted)
+        fit = shared / sizes[candidates]
+        keep = (fit >= min_fit) & (expires[candidates] > time.time())
+        candidates, scores = candidates[keep], (coverage * fit)[keep]
+        if not candidates.size:
+            return []
+
+        if candidates.size > limit:
+            best = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            best = np.arange(candidates.size)
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(float(scores[i]), recipes[candidates[i]]) for i in best]
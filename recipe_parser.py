@@ -0,0 +1,341 @@
+"""Streamlit-free parsing of Gemini recipe responses
+
+The parser is a single-pass line state machine. Headers are matched through
+a lookup table built at import time instead of a chain of substring checks,
+and the fallback step candidates are collected during the same pass instead
+of rescanning the text. Structured (JSON schema) responses are validated by
+parse_recipe_json(). Meal-plan replies carry several recipes; they are split
+at each RECIPE NAME header (parse_recipe_texts) or validated as a JSON array
+(parse_recipes_json).
+"""
+import json
+import re
+from typing import NamedTuple, Tuple, Union
+
+import metrics
+
+# Header label (lowercased, markdown stripped) -> recipe field or section
+_HEADERS = {
+    'recipe name': 'recipe_name',
+    'difficulty': 'difficulty',
+    'prep time': 'prep_time',
+    'cook time': 'cook_time',
+    'servings': 'servings',
+    'calories': 'calories',
+    'tips': 'tips',
+    'nutrition': 'nutrition',
+    'ingredients': 'ingredients',
+    'steps': 'steps',
+    'instructions': 'steps',
+    'directions': 'steps',
+    'method': 'steps',
+}
+_SECTIONS = {'ingredients', 'steps'}
+_MAX_HEADER_LEN = max(len(label) for label in _HEADERS) + 8
+_HEADER_STRIP = ' \t#>*•-'
+_BULLETS = '-*•'
+_NUMBER_STARTS = '0123456789*Ss'
+_HEADING_STARTS = 'IiSsTtNnRr'
+_SECTION_WORDS = ('INGREDIENTS', 'STEPS', 'TIPS', 'NUTRITION', 'RECIPE')
+# "1. ", "2) ", "Step 3: ", "**4.** " - but not quantities such as "1.5 cups" or "2 eggs"
+_NUMBER_RE = re.compile(r'(?:\*\*)?(?:[Ss]tep )?\d+[.):](?:\*\*)?(?:\s+|$)')
+_COOKING_RE = re.compile(r'heat|cook|chop|mix|add|stir|boil|fry|bake|whisk', re.IGNORECASE)
+_GENERIC_STEPS = ('prepare ingredients', 'cook as desired', 'serve and enjoy', 'follow instructions')
+
+
+class Recipe(NamedTuple):
+    """A parsed recipe; to_dict() gives the shape stored in session state"""
+    recipe_name: str = 'AI Recipe'
+    difficulty: str = 'Easy'
+    prep_time: str = '10 minutes'
+    cook_time: str = '15 minutes'
+    servings: Union[int, str] = 2
+    calories: str = '300'
+    ingredients: Tuple[str, ...] = ()
+    steps: Tuple[str, ...] = ()
+    tips: str = 'Enjoy your meal!'
+    nutrition: str = 'Nutritional information'
+
+    def to_dict(self):
+        recipe = self._asdict()
+        recipe['ingredients'] = list(self.ingredients)
+        recipe['steps'] = list(self.steps)
+        return recipe
+
+
+class RecipeParser:
+    """Line state machine; feed_lines() returns the events the lines produced
+
+    Events are (kind, value) pairs where kind is a recipe field name
+    (e.g. 'recipe_name'), 'ingredient' or 'step'. The per-line work is kept
+    in one loop over local variables because this is the hot path.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.ingredients = []
+        self.steps = []
+        # Looser candidates used when the strict steps look generic or too few
+        self.fallback_steps = []
+        self.numbered_steps = 0
+        self._section = None
+
+    def feed_lines(self, lines):
+        events = []
+        emit = events.append
+        fields = self.fields
+        ingredients = self.ingredients
+        steps = self.steps
+        fallback_steps = self.fallback_steps
+        section = self._section
+        numbered_steps = self.numbered_steps
+        number_match = _NUMBER_RE.match
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            label, colon, value = line.partition(':')
+            if colon and len(label) <= _MAX_HEADER_LEN:
+                target = _HEADERS.get(label.strip(_HEADER_STRIP).lower())
+                if target:
+                    if target in _SECTIONS:
+                        section = target
+                    else:
+                        if target == 'tips' or target == 'nutrition':
+                            section = None
+                        value = value.strip(' \t*')
+                        fields[target] = value
+                        emit((target, value))
+                    continue
+            elif len(line) <= _MAX_HEADER_LEN:
+                # Bare markdown headings such as "### Ingredients" or "**Instructions**"
+                target = _HEADERS.get(line.strip(_HEADER_STRIP).lower())
+                if target in _SECTIONS:
+                    section = target
+                    continue
+
+            if section is None:
+                continue
+
+            numbered = number_match(line) if line[0] in _NUMBER_STARTS else None
+            if numbered:
+                text = line[numbered.end():]
+            elif line[0] in _BULLETS and line[:2] != '**':
+                text = line[1:].lstrip()
+            else:
+                text = line
+
+            if section == 'ingredients':
+                if len(text) > 2:
+                    ingredients.append(text)
+                    emit(('ingredient', text))
+                continue
+
+            is_heading = text[:1] in _HEADING_STARTS and text[:11].upper().startswith(_SECTION_WORDS)
+            if len(line) > 15 and not is_heading:
+                fallback_steps.append(text)
+            if numbered:
+                numbered_steps += 1
+                if len(text) <= 10 or is_heading:
+                    continue
+            elif len(line) <= 20 or not _COOKING_RE.search(line):
+                continue
+            step = f"Step {len(steps) + 1}: {text}"
+            steps.append(step)
+            emit(('step', step))
+
+        self._section = section
+        self.numbered_steps = numbered_steps
+        return events
+
+    def result(self):
+        steps = self.steps
+        # Paragraph-style steps, generic steps or too few: use the looser candidates
+        if self.numbered_steps == 0:
+            fallback = 'unnumbered'
+        elif len(steps) < 3:
+            fallback = 'too_few_steps'
+        else:
+            joined = '\n'.join(steps).lower()
+            fallback = 'generic_steps' if any(pattern in joined for pattern in _GENERIC_STEPS) else None
+        if fallback and self.fallback_steps:
+            metrics.inc("parse_fallbacks", reason=fallback)
+            steps = [f"Step {i}: {text}" for i, text in enumerate(self.fallback_steps, 1)]
+        return Recipe(ingredients=tuple(self.ingredients), steps=tuple(steps), **self.fields)
+
+
+def parse_recipe_text(text):
+    """Parse a complete response into a Recipe in one pass"""
+    parser = RecipeParser()
+    parser.feed_lines(text.splitlines())
+    return parser.result()
+
+
+def _is_name_header(line):
+    label, colon, _ = line.strip().partition(':')
+    if not colon or len(label) > _MAX_HEADER_LEN:
+        return False
+    return _HEADERS.get(label.strip(_HEADER_STRIP).lower()) == 'recipe_name'
+
+
+def parse_recipe_texts(text):
+    """Parse a reply with several recipes, each starting at its own RECIPE NAME line
+
+    Parts without ingredients (a preamble, a truncated last recipe) are dropped.
+    """
+    lines = text.splitlines()
+    starts = [i for i, line in enumerate(lines) if _is_name_header(line)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    recipes = []
+    for start, end in zip(starts, starts[1:] + [len(lines)]):
+        parser = RecipeParser()
+        parser.feed_lines(lines[start:end])
+        recipe = parser.result()
+        if recipe.ingredients:
+            recipes.append(recipe)
+    return recipes
+
+
+class IncrementalRecipeParser:
+    """Turn streamed text chunks into recipe events as soon as each line is complete"""
+
+    def __init__(self):
+        self._buffer = ''
+        self._parser = RecipeParser()
+
+    def feed(self, chunk):
+        self._buffer += chunk or ''
+        if '\n' not in self._buffer:
+            return []
+        *lines, self._buffer = self._buffer.split('\n')
+        return self._parser.feed_lines(lines)
+
+    def close(self):
+        line, self._buffer = self._buffer, ''
+        return self._parser.feed_lines((line,))
+
+    def result(self):
+        return self._parser.result()
+
+
+# Response schema for structured (JSON) generation; nutrition is computed locally (nutrition.py)
+RECIPE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'recipe_name': {'type': 'STRING'},
+        'difficulty': {'type': 'STRING', 'enum': ['Easy', 'Medium', 'Hard']},
+        'prep_time_minutes': {'type': 'INTEGER'},
+        'cook_time_minutes': {'type': 'INTEGER'},
+        'servings': {'type': 'INTEGER'},
+        'ingredients': {
+            'type': 'ARRAY',
+            'items': {
+                'type': 'OBJECT',
+                'properties': {
+                    'quantity': {'type': 'STRING'},
+                    'item': {'type': 'STRING'},
+                },
+                'required': ['item'],
+            },
+        },
+        'steps': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'tips': {'type': 'STRING'},
+    },
+    'required': ['recipe_name', 'ingredients', 'steps'],
+    'propertyOrdering': [
+        'recipe_name', 'difficulty', 'prep_time_minutes', 'cook_time_minutes', 'servings',
+        'ingredients', 'steps', 'tips',
+    ],
+}
+
+# A meal plan in one structured reply
+PLAN_SCHEMA = {'type': 'ARRAY', 'items': RECIPE_SCHEMA}
+
+
+def _minutes(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise ValueError(f"expected a number of minutes, got {value!r}")
+    return f"{int(value)} minutes"
+
+
+def _load_json(text):
+    try:
+        return json.loads(text)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"response is not JSON: {e}") from e
+
+
+def parse_recipe_json(text):
+    """Validate a RECIPE_SCHEMA response into a Recipe; raises ValueError if it does not fit"""
+    return recipe_from_json(_load_json(text))
+
+
+def parse_recipes_json(text):
+    """Validate a PLAN_SCHEMA response into a list of Recipes, skipping entries that do not fit
+
+    Raises ValueError if the reply is not an array or no entry is usable.
+    """
+    data = _load_json(text)
+    if not isinstance(data, list):
+        raise ValueError("response is not a JSON array")
+    recipes = []
+    for entry in data:
+        try:
+            recipes.append(recipe_from_json(entry))
+        except ValueError:
+            metrics.inc("parse_fallbacks", reason='invalid_plan_entry')
+    if not recipes:
+        raise ValueError("no usable recipe in the array")
+    return recipes
+
+
+def recipe_from_json(data):
+    """One decoded RECIPE_SCHEMA object as a Recipe"""
+    if not isinstance(data, dict):
+        raise ValueError("response is not a JSON object")
+
+    name = data.get('recipe_name')
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("missing recipe_name")
+
+    ingredients = []
+    for entry in data.get('ingredients') or []:
+        if isinstance(entry, dict):
+            entry = f"{entry.get('quantity') or ''} {entry.get('item') or ''}"
+        if not isinstance(entry, str):
+            raise ValueError(f"bad ingredient {entry!r}")
+        entry = ' '.join(entry.split())
+        if entry:
+            ingredients.append(entry)
+
+    steps = []
+    for entry in data.get('steps') or []:
+        if not isinstance(entry, str):
+            raise ValueError(f"bad step {entry!r}")
+        numbered = _NUMBER_RE.match(entry.strip())
+        entry = entry.strip()[numbered.end():] if numbered else entry.strip()
+        if entry:
+            steps.append(f"Step {len(steps) + 1}: {entry}")
+
+    if not ingredients or not steps:
+        raise ValueError("recipe has no ingredients or no steps")
+
+    fields = {}
+    if data.get('difficulty'):
+        fields['difficulty'] = str(data['difficulty'])
+    if data.get('prep_time_minutes') is not None:
+        fields['prep_time'] = _minutes(data['prep_time_minutes'])
+    if data.get('cook_time_minutes') is not None:
+        fields['cook_time'] = _minutes(data['cook_time_minutes'])
+    if data.get('servings') is not None:
+        fields['servings'] = data['servings']
+    if data.get('calories') is not None:
+        fields['calories'] = str(data['calories'])
+    for key in ('tips', 'nutrition'):
+        if data.get(key):
+            fields[key] = str(data[key])
+
+    return Recipe(recipe_name=name.strip(), ingredients=tuple(ingredients), steps=tuple(steps), **fields)
@@ -0,0 +1,66 @@
+"""Query building for full-text search over saved recipes
+
+Saved recipes are indexed in an SQLite FTS5 table (an inverted index kept
+up to date by RecipeStore on save and delete) and ranked with BM25. These
+helpers turn what the user typed into FTS5 match expressions and pull the
+searchable fields out of a recipe dict.
+"""
+import re
+
+# bm25() weights for the name, ingredients and steps columns
+COLUMN_WEIGHTS = (10.0, 4.0, 1.0)
+
+_TERM_RE = re.compile(r"\w+")
+_RANGE_RE = re.compile(r"\d+(?:\.\d+)?\s*(?:-|–|to)\s*(?=\d)")
+_MINUTES_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(h(?:ou)?rs?|h\b|m(?:in(?:ute)?s?)?\b)?", re.IGNORECASE)
+
+
+def terms(text):
+    return _TERM_RE.findall(str(text).lower())
+
+
+def _phrase(words):
+    # Double quotes keep FTS5 operators typed by the user from being interpreted
+    return '"' + ' '.join(words) + '"'
+
+
+def match_query(text):
+    """Every word must appear somewhere in the recipe; None for an empty query"""
+    words = terms(text)
+    return ' AND '.join(_phrase([word]) for word in words) or None
+
+
+def ingredient_query(ingredients, any_of=False):
+    """Match recipes listing the ingredients; multi-word ones are matched as phrases"""
+    phrases = [_phrase(words) for words in map(terms, ingredients) if words]
+    if not phrases:
+        return None
+    return 'ingredients : (' + (' OR ' if any_of else ' AND ').join(phrases) + ')'
+
+
+def split_list(text):
+    """Comma-separated filter input into a list of ingredients"""
+    return [part.strip() for part in str(text or '').split(',') if part.strip()]
+
+
+def parse_minutes(value):
+    """Minutes from "15 minutes", "1 hour 10 mins" or a number; None when there is none"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    total = 0.0
+    found = False
+    # "5-10 minutes" counts as the upper bound
+    text = _RANGE_RE.sub('', str(value or ''))
+    for number, unit in _MINUTES_RE.findall(text):
+        found = True
+        total += float(number) * (60 if unit and unit[0].lower() == 'h' else 1)
+    return int(total) if found else None
+
+
+def search_document(recipe):
+    """The (name, ingredients, steps) text indexed for a recipe"""
+    return (
+        recipe.get('recipe_name', '') or '',
+        '\n'.join(recipe.get('ingredients', []) or []),
+        '\n'.join(recipe.get('steps', []) or []),
+    )
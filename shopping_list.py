@@ -0,0 +1,367 @@
+"""Quantity-aware shopping list entries
+
+Ingredient lines are parsed into quantity, unit and item, amounts in
+compatible units are converted to a common base (ml, g or a count) and
+entries for the same item are merged through a dict keyed by the
+canonical item name, so adding recipe after recipe stays linear.
+"""
+import re
+from fractions import Fraction
+from typing import NamedTuple, Optional
+
+# alias -> (unit shown on the list, dimension, size in the dimension's base unit)
+UNITS = {}
+for _unit, _dimension, _size, _aliases in (
+    ('tsp', 'volume', 4.92892, ('tsp', 'teaspoon', 'teaspoons', 't')),
+    ('tbsp', 'volume', 14.7868, ('tbsp', 'tablespoon', 'tablespoons', 'tbs', 'tbl', 'T')),
+    ('fl oz', 'volume', 29.5735, ('fl oz', 'fluid ounce', 'fluid ounces')),
+    ('cup', 'volume', 236.588, ('cup', 'cups', 'c')),
+    ('pint', 'volume', 473.176, ('pint', 'pints', 'pt')),
+    ('quart', 'volume', 946.353, ('quart', 'quarts', 'qt')),
+    ('ml', 'volume', 1.0, ('ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres')),
+    ('l', 'volume', 1000.0, ('l', 'liter', 'liters', 'litre', 'litres')),
+    ('g', 'mass', 1.0, ('g', 'gram', 'grams', 'gr')),
+    ('kg', 'mass', 1000.0, ('kg', 'kilogram', 'kilograms')),
+    ('oz', 'mass', 28.3495, ('oz', 'ounce', 'ounces')),
+    ('lb', 'mass', 453.592, ('lb', 'lbs', 'pound', 'pounds')),
+):
+    for _alias in _aliases:
+        UNITS[_alias] = (_unit, _dimension, _size)
+
+# Units that only add up with themselves ("2 cloves" + "1 clove")
+COUNT_UNITS = {}
+for _unit, _aliases in (
+    ('clove', ('clove', 'cloves')),
+    ('slice', ('slice', 'slices')),
+    ('can', ('can', 'cans', 'tin', 'tins')),
+    ('pinch', ('pinch', 'pinches')),
+    ('dash', ('dash', 'dashes')),
+    ('bunch', ('bunch', 'bunches')),
+    ('head', ('head', 'heads')),
+    ('stalk', ('stalk', 'stalks')),
+    ('sprig', ('sprig', 'sprigs')),
+    ('piece', ('piece', 'pieces')),
+    ('package', ('package', 'packages', 'pack', 'packs', 'packet', 'packets')),
+    ('handful', ('handful', 'handfuls')),
+    ('leaf', ('leaf', 'leaves')),
+):
+    for _alias in _aliases:
+        COUNT_UNITS[_alias] = _unit
+
+# Words that describe the ingredient rather than name it
+DESCRIPTORS = frozenset((
+    'large', 'medium', 'small', 'big', 'fresh', 'freshly', 'chopped', 'diced', 'minced',
+    'sliced', 'grated', 'shredded', 'crushed', 'peeled', 'finely', 'roughly', 'thinly',
+    'cubed', 'melted', 'softened', 'beaten', 'whole', 'ripe', 'cold', 'warm', 'room',
+    'temperature', 'optional', 'to', 'taste', 'about', 'approximately', 'extra', 'heaping',
+    'level', 'packed', 'cooked', 'uncooked', 'raw', 'boneless', 'skinless', 'halved',
+    'quartered', 'rinsed', 'drained', 'trimmed',
+))
+
+# Words that end in "s" but are not plurals
+SINGULAR_S = frozenset((
+    'molasses', 'hummus', 'couscous', 'asparagus', 'swiss', 'citrus', 'grits', 'oats',
+    'brussels', 'lemongrass', 'watercress', 'anchovies',
+))
+
+# Nouns bought by amount, never counted: "2 spinach" stays as written, not "2 spinaches"
+MASS_NOUNS = frozenset((
+    'rice', 'flour', 'sugar', 'salt', 'spinach', 'kale', 'lettuce', 'arugula', 'broccoli', 'cauliflower',
+    'celery', 'asparagus', 'corn', 'garlic', 'ginger', 'basil', 'parsley', 'cilantro', 'mint', 'dill',
+    'thyme', 'rosemary', 'oregano', 'milk', 'cream', 'butter', 'cheese', 'yogurt', 'water', 'oil',
+    'vinegar', 'honey', 'syrup', 'sauce', 'stock', 'broth', 'pasta', 'spaghetti', 'quinoa', 'couscous',
+    'oats', 'bread', 'tofu', 'beef', 'pork', 'lamb', 'chicken', 'turkey', 'fish', 'salmon', 'tuna',
+    'cod', 'shrimp', 'bacon', 'ham', 'mince', 'seasoning', 'paprika', 'cumin', 'cinnamon', 'pepper',
+))
+
+# Plurals the suffix rules in plural() get wrong
+_IRREGULAR_PLURALS = {'leaf': 'leaves', 'loaf': 'loaves', 'half': 'halves'}
+
+AISLES = ("Produce", "Meat & Seafood", "Dairy & Eggs", "Bakery", "Pantry", "Spices & Seasonings", "Frozen", "Other")
+
+_AISLE_WORDS = {}
+for _aisle, _words in (
+    ("Produce", (
+        'onion', 'garlic', 'tomato', 'potato', 'carrot', 'celery', 'pepper', 'lettuce', 'spinach',
+        'kale', 'cabbage', 'broccoli', 'cauliflower', 'zucchini', 'cucumber', 'mushroom', 'avocado',
+        'lemon', 'lime', 'orange', 'apple', 'banana', 'berry', 'strawberry', 'blueberry', 'ginger',
+        'scallion', 'shallot', 'leek', 'herb', 'parsley', 'cilantro', 'basil', 'mint', 'dill',
+        'chive', 'eggplant', 'corn', 'pea', 'bean sprout', 'squash', 'pumpkin', 'asparagus', 'jalapeno',
+        'chili', 'chilli', 'grape', 'mango', 'pear', 'peach', 'sweet potato', 'arugula',
+    )),
+    ("Meat & Seafood", (
+        'chicken', 'beef', 'pork', 'lamb', 'turkey', 'bacon', 'sausage', 'ham', 'steak', 'mince',
+        'fish', 'salmon', 'tuna', 'cod', 'shrimp', 'prawn', 'crab', 'tilapia', 'anchovies', 'chorizo',
+    )),
+    ("Dairy & Eggs", (
+        'egg', 'milk', 'butter', 'cheese', 'cheddar', 'mozzarella', 'parmesan', 'feta', 'yogurt',
+        'yoghurt', 'cream', 'sour cream', 'ricotta', 'ghee',
+    )),
+    ("Bakery", ('bread', 'bun', 'roll', 'tortilla', 'pita', 'bagel', 'baguette', 'naan', 'croissant')),
+    ("Pantry", (
+        'rice', 'pasta', 'spaghetti', 'noodle', 'flour', 'sugar', 'oil', 'vinegar', 'soy sauce',
+        'sauce', 'stock', 'broth', 'honey', 'syrup', 'bean', 'lentil', 'chickpea', 'oats', 'quinoa',
+        'couscous', 'breadcrumb', 'nut', 'almond', 'peanut', 'walnut', 'tahini', 'mustard',
+        'ketchup', 'mayonnaise', 'baking powder', 'baking soda', 'yeast', 'cornstarch', 'coconut milk',
+        'tomato paste', 'canned tomato', 'molasses', 'chocolate', 'vanilla',
+    )),
+    ("Spices & Seasonings", (
+        'salt', 'black pepper', 'paprika', 'cumin', 'oregano', 'thyme', 'rosemary', 'cinnamon',
+        'nutmeg', 'turmeric', 'curry', 'chili powder', 'chili flakes', 'bay leaf', 'seasoning',
+        'spice', 'garam masala', 'cayenne', 'coriander',
+    )),
+    ("Frozen", ('frozen', 'ice cream')),
+):
+    for _word in _words:
+        _AISLE_WORDS[_word] = _aisle
+
+_UNICODE_FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4', '⅛': '1/8'}
+_NUMBER = r'\d+/\d+|\d+(?:\.\d+)?(?:\s+\d+/\d+)?'
+_QUANTITY_RE = re.compile(rf'^({_NUMBER})(?:\s*(?:-|–|to)\s*({_NUMBER}))?\s*')
+_PAREN_RE = re.compile(r'\(([^)]*)\)')
+_BULLET_STRIP = ' \t-*•'
+
+
+class ShoppingItem(NamedTuple):
+    name: str                  # item as written, e.g. "eggs"
+    canonical: str             # merge key, e.g. "egg"
+    quantity: Optional[float]  # in the dimension's base unit; None if not given
+    unit: Optional[str]        # unit to show, e.g. "cup"
+    dimension: str             # 'volume', 'mass', 'count', a count unit like 'clove', or '' without a quantity
+
+    @property
+    def key(self):
+        return f"{self.canonical}|{self.dimension}"
+
+    @property
+    def aisle(self):
+        return aisle_for(self.canonical)
+
+    def __str__(self):
+        return format_item(self.name, self.quantity, self.unit, self.dimension)
+
+
+def _to_number(text):
+    text = text.strip()
+    if ' ' in text:
+        whole, frac = text.split(None, 1)
+        return float(whole) + float(Fraction(frac))
+    return float(Fraction(text))
+
+
+def singular(word):
+    if word in SINGULAR_S or len(word) < 4 or not word.endswith('s') or word.endswith('ss'):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'ches', 'shes', 'xes')):
+        return word[:-2]
+    if word.endswith('ves') and word not in ('olives', 'chives', 'cloves'):
+        return word[:-3] + 'f'
+    return word[:-1]
+
+
+def plural(word):
+    if word in _IRREGULAR_PLURALS:
+        return _IRREGULAR_PLURALS[word]
+    if word.endswith('s'):
+        return word
+    if word.endswith('y') and word[-2:-1] not in 'aeiou':
+        return word[:-1] + 'ies'
+    if word.endswith(('o', 'ch', 'sh', 'x')):
+        return word + 'es'
+    return word + 's'
+
+
+def aisle_for(canonical):
+    """Aisle for a canonical item name: longest matching phrase wins, else "Other" """
+    words = canonical.split()
+    # Two-word phrases first so "sour cream" beats "cream" and "black pepper" beats "pepper"
+    for i in range(len(words) - 1):
+        aisle = _AISLE_WORDS.get(f"{words[i]} {words[i + 1]}")
+        if aisle:
+            return aisle
+    for word in reversed(words):
+        aisle = _AISLE_WORDS.get(word)
+        if aisle:
+            return aisle
+    return "Other"
+
+
+def parse_item(line):
+    """Split one ingredient line into a ShoppingItem"""
+    text = line.strip().strip(_BULLET_STRIP)
+    for symbol, fraction in _UNICODE_FRACTIONS.items():
+        if symbol in text:
+            text = re.sub(rf'(\d)\s*{symbol}', rf'\1 {fraction}', text).replace(symbol, fraction)
+
+    # "eggs (4)": a bare number in brackets is the quantity; other bracketed notes are dropped
+    quantity_text = None
+    for note in _PAREN_RE.findall(text):
+        if quantity_text is None and _QUANTITY_RE.match(note.strip()):
+            quantity_text = note.strip()
+    text = _PAREN_RE.sub(' ', text)
+    # "onion, diced": what follows the comma is preparation
+    text = text.split(',', 1)[0].strip()
+
+    quantity = None
+    match = _QUANTITY_RE.match(text)
+    if match:
+        text = text[match.end():]
+    elif quantity_text:
+        match = _QUANTITY_RE.match(quantity_text)
+    elif text[:2].lower() == 'a ' or text[:3].lower() == 'an ':
+        text = text.split(None, 1)[1] if ' ' in text else ''
+        quantity = 1.0
+    if match:
+        # For a range like "2-3" buy the upper amount
+        quantity = _to_number(match.group(2) or match.group(1))
+
+    words = text.split()
+    unit = None
+    dimension = 'count' if quantity is not None else ''
+    size = 1.0
+    if words and quantity is not None:
+        first = words[0].rstrip('.')
+        two = f"{first} {words[1].rstrip('.')}".lower() if len(words) > 1 else None
+        if two in UNITS:
+            unit, dimension, size = UNITS[two]
+            words = words[2:]
+        elif first in UNITS or first.lower() in UNITS:
+            # Case matters only for "T" (tbsp) versus "t" (tsp)
+            unit, dimension, size = UNITS.get(first) or UNITS[first.lower()]
+            words = words[1:]
+        elif first.lower() in COUNT_UNITS:
+            unit = dimension = COUNT_UNITS[first.lower()]
+            words = words[1:]
+    if words and words[0].lower() == 'of':
+        words = words[1:]
+
+    kept = [w for w in (w.lower().strip('.;:') for w in words) if w and w not in DESCRIPTORS]
+    name = ' '.join(kept) or line.strip().strip(_BULLET_STRIP).lower()
+    canonical = ' '.join(singular(w) for w in name.split())
+    if quantity is not None:
+        quantity *= size
+    return ShoppingItem(name, canonical, quantity, unit, dimension)
+
+
+# Units written differently for one and for several
+_PLURAL_UNITS = {'cup', 'pint', 'quart'} | set(COUNT_UNITS.values())
+
+
+def scale_line(line, factor):
+    """Multiply the amount at the start of an ingredient line, keeping the rest as written"""
+    text = line.strip().strip(_BULLET_STRIP)
+    for symbol, fraction in _UNICODE_FRACTIONS.items():
+        if symbol in text:
+            text = re.sub(rf'(\d)\s*{symbol}', rf'\1 {fraction}', text).replace(symbol, fraction)
+
+    match = _QUANTITY_RE.match(text)
+    if match:
+        low, high = match.group(1), match.group(2)
+        amount = _to_number(high or low) * factor
+        scaled = _format_number(_to_number(low) * factor)
+        if high:
+            scaled = f"{scaled}-{_format_number(amount)}"
+        rest = text[match.end():]
+    elif text[:2].lower() == 'a ' or text[:3].lower() == 'an ':
+        amount = factor
+        scaled = _format_number(factor)
+        rest = text.split(None, 1)[1]
+    else:
+        return line
+
+    words = rest.split(' ', 1)
+    unit = singular(words[0].lower())
+    if unit in _PLURAL_UNITS:
+        words[0] = plural(unit) if amount > 1 else unit
+    elif words[0].lower().rstrip('.') not in UNITS and words[0].rstrip('.') not in UNITS:
+        # No unit, so the item itself is counted: "1 egg" <-> "2 eggs"
+        return f"{scaled} {_count_noun(rest, amount)}"
+    return f"{scaled} {' '.join(words)}"
+
+
+def _inflect(word, amount):
+    """A counted noun in the number amount calls for; mass nouns and non-words stay as written"""
+    core = word.rstrip('.;:')
+    lower = core.lower()
+    one = singular(lower)
+    if not lower.isalpha() or lower in MASS_NOUNS or one in MASS_NOUNS:
+        return word
+    inflected = plural(one) if amount > 1 else one
+    if core[:1].isupper():
+        inflected = inflected.capitalize()
+    return inflected + word[len(core):]
+
+
+def _count_noun(text, amount):
+    """Inflect the item's head noun, the last word before any ", notes" or "(notes)" """
+    cut = min((i for i in (text.find(','), text.find('(')) if i >= 0), default=len(text))
+    head, tail = text[:cut], text[cut:]
+    words = head.rstrip().split(' ')
+    if words[-1]:
+        words[-1] = _inflect(words[-1], amount)
+    return ' '.join(words) + head[len(head.rstrip()):] + tail
+
+
+def merge(a, b):
+    """Combine two items with the same key; the first one's wording and unit are kept"""
+    if a.quantity is None:
+        return b._replace(name=a.name) if b.quantity is not None else a
+    if b.quantity is None:
+        return a
+    return a._replace(quantity=a.quantity + b.quantity)
+
+
+def aggregate(lines, items=None):
+    """Merge ingredient lines into a dict of key -> ShoppingItem (updated in place if given)
+
+    A line without a quantity is folded into any quantified entry for the
+    same item, since "salt" adds nothing to "1 tsp salt".
+    """
+    items = {} if items is None else items
+    quantified = {item.canonical for item in items.values() if item.quantity is not None}
+    for line in lines:
+        item = parse_item(line)
+        if not item.canonical:
+            continue
+        if item.quantity is None:
+            if item.canonical in quantified:
+                continue
+        else:
+            bare = items.pop(f"{item.canonical}|", None)
+            if bare is not None:
+                item = merge(bare, item)
+            quantified.add(item.canonical)
+        existing = items.get(item.key)
+        items[item.key] = merge(existing, item) if existing else item
+    return items
+
+
+def _format_number(value):
+    if abs(value - round(value)) < 0.01:
+        return str(int(round(value)))
+    fraction = Fraction(value).limit_denominator(8)
+    if abs(float(fraction) - value) < 0.01 and fraction.denominator in (2, 3, 4, 8):
+        whole, rest = divmod(fraction.numerator, fraction.denominator)
+        rest = f"{rest}/{fraction.denominator}"
+        return f"{whole} {rest}" if whole else rest
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+
+def format_item(name, quantity, unit, dimension):
+    """Human-readable list entry, e.g. "1 1/2 cup milk" or "5 eggs" """
+    if quantity is None:
+        return name
+    if dimension in ('volume', 'mass'):
+        amount = quantity / UNITS[unit][2]
+        if unit in ('cup', 'pint', 'quart') and amount > 1:
+            unit = plural(unit)
+        return f"{_format_number(amount)} {unit} {name}"
+    amount = _format_number(quantity)
+    if dimension == 'count':
+        words = name.split()
+        if words:
+            words[-1] = _inflect(words[-1], quantity)
+        return f"{amount} {' '.join(words)}"
+    return f"{amount} {plural(unit) if quantity > 1 else unit} {name}"
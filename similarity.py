@@ -0,0 +1,94 @@
+"""MinHash signatures and LSH band keys for near-duplicate recipes
+
+A recipe's features are its canonical ingredients (see recipe_index) plus
+the word pairs of its steps, with numbers dropped so "cook 3 minutes" and
+"cook 4 minutes" agree. Ingredients are weighted by repeating them, so two
+recipes with the same ingredients and reworded steps still come out close.
+
+The share of equal positions in two signatures estimates the Jaccard
+similarity of the feature sets. For lookups the signature is cut into
+BANDS bands of ROWS values, each hashed to one integer: near-duplicates
+share at least one band key with high probability (over 99% at 0.8
+similarity), so stores only compare against the few recipes in the same
+buckets instead of all of them. The permutations are derived from fixed
+hashes, so signatures stay valid across processes and can be stored.
+"""
+import hashlib
+import re
+import zlib
+
+import numpy as np
+
+from recipe_index import ingredient_set
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Estimated similarity from which two recipes count as the same
+DUPLICATE_THRESHOLD = 0.8
+INGREDIENT_WEIGHT = 8
+
+_PRIME = (1 << 32) + 15  # smallest prime above every crc32 value
+
+
+def _coefficients(tag, low):
+    return np.array([
+        low + int.from_bytes(hashlib.sha256(f"{tag}{i}".encode()).digest()[:4], 'big') % ((1 << 31) - low)
+        for i in range(NUM_PERM)
+    ], dtype=np.uint64)
+
+
+# (a * h + b) % _PRIME stays below 2**64 with a, b < 2**31 and h < 2**32
+_A = _coefficients('a', 1)
+_B = _coefficients('b', 0)
+
+_STEP_PREFIX_RE = re.compile(r'^\s*step \d+:\s*')
+_WORD_RE = re.compile(r'[a-z]+')
+
+
+def features(recipe):
+    """Set of weighted ingredient and step word-pair features"""
+    found = {f"i{copy}:{name}" for name in ingredient_set(recipe.get('ingredients', []))
+             for copy in range(INGREDIENT_WEIGHT)}
+    for step in recipe.get('steps', []):
+        words = _WORD_RE.findall(_STEP_PREFIX_RE.sub('', str(step).lower()))
+        found.update(f"s:{first} {second}" for first, second in zip(words, words[1:]))
+    return found
+
+
+def signature(recipe):
+    """MinHash signature as a uint64 array of NUM_PERM values, or None for an empty recipe"""
+    found = features(recipe)
+    if not found:
+        return None
+    hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in found), dtype=np.uint64,
+                         count=len(found))
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def similarities(sig, blobs):
+    """Estimated similarity of sig to each stored signature (see to_blob), as an array"""
+    if not blobs:
+        return np.zeros(0)
+    others = np.frombuffer(b''.join(blobs), dtype='<u8').reshape(len(blobs), NUM_PERM)
+    return np.count_nonzero(others == sig, axis=1) / NUM_PERM
+
+
+def band_keys(sig):
+    """One signed 64-bit bucket key per band, distinct across bands (fits an SQLite INTEGER)"""
+    raw = sig.astype('<u8').tobytes()
+    width = ROWS * 8
+    return [
+        int.from_bytes(hashlib.blake2b(raw[band * width:(band + 1) * width], digest_size=8,
+                                       salt=band.to_bytes(2, 'big')).digest(), 'big', signed=True)
+        for band in range(BANDS)
+    ]
+
+
+def to_blob(sig):
+    return sig.astype('<u8').tobytes()
@@ -0,0 +1,44 @@
+"""Coalesce identical concurrent calls into one"""
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """do(key, fn) runs fn once per key at a time; concurrent callers share its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.stats = {"calls": 0, "executed": 0, "shared": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            self.stats["calls"] += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.stats["executed"] += 1
+            else:
+                self.stats["shared"] += 1
+
+        if not leader:
+            # Re-raises the leader's exception, if any
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
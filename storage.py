@@ -0,0 +1,390 @@
+"""SQLite-backed store for saved recipes and the shopping list
+
+The database runs in WAL mode so several Streamlit sessions and processes
+can read while one writes. Duplicate checks go through unique indexes
+instead of scanning Python lists, and the pages read rows a page at a time.
+Near-duplicate recipes are found through the LSH band keys of their MinHash
+signatures (see similarity.py), which are indexed like everything else.
+"""
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from recipe_search import COLUMN_WEIGHTS, ingredient_query, match_query, parse_minutes, search_document
+from shopping_list import AISLES, ShoppingItem, aggregate, format_item, merge
+from similarity import DUPLICATE_THRESHOLD, band_keys, signature, similarities, to_blob
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    prep_minutes INTEGER,
+    cook_minutes INTEGER,
+    minhash BLOB
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_recipes_owner_name ON recipes(owner, name_key);
+
+-- Inverted index over saved recipes; rowid is recipes.id
+CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search USING fts5(
+    name, ingredients, steps, tokenize = 'porter unicode61'
+);
+
+-- Ingredient filters go through recipe_search; this table was never read
+DROP TABLE IF EXISTS recipe_ingredients;
+
+-- One row per LSH band of recipes.minhash
+CREATE TABLE IF NOT EXISTS recipe_bands (
+    recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    bucket INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipe_bands_bucket ON recipe_bands(bucket);
+CREATE INDEX IF NOT EXISTS idx_recipe_bands_recipe ON recipe_bands(recipe_id);
+
+CREATE TABLE IF NOT EXISTS list_items (
+    id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    item TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    checked INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    canonical TEXT NOT NULL DEFAULT '',
+    quantity REAL,
+    unit TEXT,
+    dimension TEXT NOT NULL DEFAULT '',
+    aisle TEXT NOT NULL DEFAULT 'Other'
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_list_items_owner_item ON list_items(owner, item_key);
+CREATE INDEX IF NOT EXISTS idx_list_items_owner_checked ON list_items(owner, checked);
+CREATE INDEX IF NOT EXISTS idx_list_items_owner_canonical ON list_items(owner, canonical);
+"""
+
+# Columns added to recipes for the search time filters
+_RECIPE_COLUMNS = (
+    ("prep_minutes", "INTEGER"),
+    ("cook_minutes", "INTEGER"),
+)
+
+# Column added to recipes for near-duplicate detection
+_SIGNATURE_COLUMNS = (
+    ("minhash", "BLOB"),
+)
+
+# Columns added to list_items when the list became quantity-aware
+_LIST_ITEM_COLUMNS = (
+    ("canonical", "TEXT NOT NULL DEFAULT ''"),
+    ("quantity", "REAL"),
+    ("unit", "TEXT"),
+    ("dimension", "TEXT NOT NULL DEFAULT ''"),
+    ("aisle", "TEXT NOT NULL DEFAULT 'Other'"),
+)
+
+# Shopping list rows come back grouped in store-walk order
+_AISLE_ORDER = "CASE aisle " + " ".join(f"WHEN '{aisle}' THEN {rank}" for rank, aisle in enumerate(AISLES)) + f" ELSE {len(AISLES)} END"
+
+DEFAULT_OWNER = "default"
+
+
+def normalize_key(text):
+    """Case- and whitespace-insensitive key used by the unique indexes"""
+    return " ".join(str(text).lower().split())
+
+
+class RecipeStore:
+    """Saved recipes and shopping list items, namespaced by owner"""
+
+    def __init__(self, path, owner=DEFAULT_OWNER):
+        self.path = path
+        self.owner = owner
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            reindex_recipes = self._add_columns("recipes", _RECIPE_COLUMNS)
+            sign_recipes = self._add_columns("recipes", _SIGNATURE_COLUMNS)
+            rebuild_list = self._add_columns("list_items", _LIST_ITEM_COLUMNS)
+            self._conn.executescript(SCHEMA)
+            if reindex_recipes:
+                self._reindex_recipes()
+            if sign_recipes:
+                self._sign_recipes()
+            if rebuild_list:
+                self._rebuild_list_items()
+            self._conn.commit()
+
+    def _add_columns(self, table, new_columns):
+        """Bring a table from an older version up to date; True if columns were added"""
+        columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        if not columns or new_columns[0][0] in columns:
+            return False
+        for name, definition in new_columns:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+        return True
+
+    def _reindex_recipes(self):
+        """Fill the time columns and the search index for recipes saved before search existed"""
+        self._conn.execute("DELETE FROM recipe_search")
+        for recipe_id, data in self._conn.execute("SELECT id, data FROM recipes").fetchall():
+            recipe = json.loads(data)
+            self._conn.execute(
+                "UPDATE recipes SET prep_minutes = ?, cook_minutes = ? WHERE id = ?",
+                (parse_minutes(recipe.get('prep_time')), parse_minutes(recipe.get('cook_time')), recipe_id)
+            )
+            self._index_recipe(recipe_id, recipe)
+
+    def _index_recipe(self, recipe_id, recipe):
+        self._conn.execute(
+            "INSERT INTO recipe_search (rowid, name, ingredients, steps) VALUES (?, ?, ?, ?)",
+            (recipe_id, *search_document(recipe))
+        )
+
+    def _sign_recipes(self):
+        """Signatures and band keys for recipes saved before near-duplicate detection"""
+        for recipe_id, data in self._conn.execute("SELECT id, data FROM recipes").fetchall():
+            sig = signature(json.loads(data))
+            if sig is not None:
+                self._sign_recipe(recipe_id, sig)
+
+    def _sign_recipe(self, recipe_id, sig):
+        self._conn.execute("UPDATE recipes SET minhash = ? WHERE id = ?", (to_blob(sig), recipe_id))
+        self._conn.executemany(
+            "INSERT INTO recipe_bands (recipe_id, bucket) VALUES (?, ?)",
+            [(recipe_id, bucket) for bucket in band_keys(sig)]
+        )
+
+    def _find_similar(self, sig, threshold):
+        """Closest saved recipe sharing a band with sig, as (id, name, similarity), if at least threshold"""
+        buckets = band_keys(sig)
+        # +owner keeps SQLite from scanning the owner index instead of starting from the buckets
+        rows = self._conn.execute(
+            "SELECT id, name, minhash FROM recipes WHERE id IN"
+            f" (SELECT recipe_id FROM recipe_bands WHERE bucket IN ({', '.join('?' * len(buckets))})) AND +owner = ?",
+            (*buckets, self.owner)
+        ).fetchall()
+        scores = similarities(sig, [blob for _, _, blob in rows])
+        if not len(scores) or scores.max() < threshold:
+            return None
+        best = int(scores.argmax())
+        return rows[best][0], rows[best][1], float(scores[best])
+
+    def _rebuild_list_items(self):
+        """Re-parse raw list rows and merge them; an item stays checked only if all its lines were"""
+        by_owner = {}
+        for owner, item, checked in self._conn.execute("SELECT owner, item, checked FROM list_items ORDER BY id"):
+            by_owner.setdefault(owner, []).append((item, checked))
+        self._conn.execute("DELETE FROM list_items")
+        now = time.time()
+        for owner, rows in by_owner.items():
+            merged = aggregate(item for item, _ in rows)
+            unchecked = {item.canonical for item in aggregate(item for item, checked in rows if not checked).values()}
+            for item in merged.values():
+                self._insert_list_item(owner, item, now, checked=item.canonical not in unchecked)
+
+    def _write(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params)
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # Saved recipes
+
+    def save_recipe(self, recipe, merge_similar=True):
+        """Insert a recipe; returns its id, or None if it is already saved
+
+        With merge_similar, a near-duplicate of a saved recipe counts as
+        already saved, and a different recipe whose name is taken is saved
+        as "Name (2)". Without it only the name is checked.
+        """
+        name = recipe.get('recipe_name', '') or 'Recipe'
+        sig = signature(recipe)
+        dedupe = merge_similar and sig is not None
+        with self._lock, self._conn:
+            if dedupe and self._find_similar(sig, DUPLICATE_THRESHOLD):
+                return None
+            title = name
+            for copy in itertools.count(2):
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO recipes (owner, name, name_key, data, created_at, prep_minutes, cook_minutes)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.owner, title, normalize_key(title), json.dumps(recipe), time.time(),
+                     parse_minutes(recipe.get('prep_time')), parse_minutes(recipe.get('cook_time')))
+                )
+                if cursor.rowcount:
+                    break
+                if not dedupe:
+                    return None
+                # Same name, different recipe
+                title = f"{name} ({copy})"
+                recipe = dict(recipe, recipe_name=title)
+            recipe_id = cursor.lastrowid
+            if sig is not None:
+                self._sign_recipe(recipe_id, sig)
+            self._index_recipe(recipe_id, recipe)
+            return recipe_id
+
+    def find_similar(self, recipe, threshold=DUPLICATE_THRESHOLD):
+        """(id, name, similarity) of the closest saved near-duplicate of a recipe, or None"""
+        sig = signature(recipe)
+        if sig is None:
+            return None
+        with self._lock:
+            return self._find_similar(sig, threshold)
+
+    def iter_recipes(self):
+        """Every saved recipe of every owner, for building indexes"""
+        for (data,) in self._read("SELECT data FROM recipes ORDER BY id"):
+            yield json.loads(data)
+
+    def count_recipes(self):
+        return self._read("SELECT COUNT(*) FROM recipes WHERE owner = ?", (self.owner,))[0][0]
+
+    def search_recipes(self, query='', include=(), exclude=(), max_prep=None, max_cook=None, offset=0, limit=20):
+        """One page of (id, recipe) matches, best BM25 match first, plus the total match count
+
+        include/exclude are ingredient names; max_prep/max_cook are minutes
+        and drop recipes whose time is unknown.
+        """
+        match = ' AND '.join(part for part in (match_query(query), ingredient_query(include)) if part)
+        excluded = ingredient_query(exclude, any_of=True)
+
+        where = ["r.owner = ?"]
+        params = [self.owner]
+        if match:
+            where.append("recipe_search MATCH ?")
+            params.append(match)
+        if excluded:
+            where.append("r.id NOT IN (SELECT rowid FROM recipe_search WHERE recipe_search MATCH ?)")
+            params.append(excluded)
+        if max_prep is not None:
+            where.append("r.prep_minutes <= ?")
+            params.append(max_prep)
+        if max_cook is not None:
+            where.append("r.cook_minutes <= ?")
+            params.append(max_cook)
+
+        if match:
+            source = "recipe_search JOIN recipes r ON r.id = recipe_search.rowid"
+            order = "bm25(recipe_search, {}, {}, {}), r.id".format(*COLUMN_WEIGHTS)
+        else:
+            source = "recipes r"
+            order = "r.id"
+        where = " AND ".join(where)
+
+        total = self._read(f"SELECT COUNT(*) FROM {source} WHERE {where}", params)[0][0]
+        rows = self._read(
+            f"SELECT r.id, r.data FROM {source} WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+        return total, [(recipe_id, json.loads(data)) for recipe_id, data in rows]
+
+    def delete_recipe(self, recipe_id):
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM recipes WHERE owner = ? AND id = ?", (self.owner, recipe_id))
+            if cursor.rowcount:
+                self._conn.execute("DELETE FROM recipe_search WHERE rowid = ?", (recipe_id,))
+
+    def clear_recipes(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM recipe_search WHERE rowid IN (SELECT id FROM recipes WHERE owner = ?)", (self.owner,)
+            )
+            self._conn.execute("DELETE FROM recipes WHERE owner = ?", (self.owner,))
+
+    # Shopping list
+
+    def _insert_list_item(self, owner, item, now, checked=False):
+        self._conn.execute(
+            "INSERT INTO list_items (owner, item, item_key, checked, created_at, canonical, quantity, unit, dimension, aisle)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (owner, item.name, item.key, int(checked), now, item.canonical,
+             item.quantity, item.unit, item.dimension, item.aisle)
+        )
+
+    def _find_list_item(self, item):
+        """The row an incoming item merges into, as (id, ShoppingItem), or None"""
+        columns = "SELECT id, item, canonical, quantity, unit, dimension FROM list_items WHERE owner = ?"
+        if item.quantity is None:
+            # Any row for the same item already covers an unquantified line
+            rows = self._conn.execute(columns + " AND canonical = ? LIMIT 1", (self.owner, item.canonical)).fetchall()
+        else:
+            rows = self._conn.execute(columns + " AND item_key = ?", (self.owner, item.key)).fetchall()
+            if not rows:
+                # An unquantified row for the same item gets upgraded
+                rows = self._conn.execute(
+                    columns + " AND item_key = ?", (self.owner, f"{item.canonical}|")
+                ).fetchall()
+        if not rows:
+            return None
+        row_id, *fields = rows[0]
+        return row_id, ShoppingItem(*fields)
+
+    def add_list_items(self, items):
+        """Merge ingredient lines into the list; returns (rows added, rows whose amount grew)"""
+        incoming = aggregate(items)
+        now = time.time()
+        added = merged = 0
+        with self._lock, self._conn:
+            for item in incoming.values():
+                found = self._find_list_item(item)
+                if found is None:
+                    self._insert_list_item(self.owner, item, now)
+                    added += 1
+                    continue
+                row_id, existing = found
+                combined = merge(existing, item)
+                if combined == existing:
+                    continue
+                # Needing more of an item puts it back on the list
+                self._conn.execute(
+                    "UPDATE list_items SET item = ?, item_key = ?, quantity = ?, unit = ?, dimension = ?, checked = 0"
+                    " WHERE id = ?",
+                    (combined.name, combined.key, combined.quantity, combined.unit, combined.dimension, row_id)
+                )
+                merged += 1
+        return added, merged
+
+    def list_items(self, offset=0, limit=50):
+        """One page of (id, text, checked, aisle) rows, grouped by aisle"""
+        rows = self._read(
+            "SELECT id, item, quantity, unit, dimension, checked, aisle FROM list_items WHERE owner = ?"
+            f" ORDER BY {_AISLE_ORDER}, id LIMIT ? OFFSET ?",
+            (self.owner, limit, offset)
+        )
+        return [
+            (item_id, format_item(name, quantity, unit, dimension), bool(checked), aisle)
+            for item_id, name, quantity, unit, dimension, checked, aisle in rows
+        ]
+
+    def count_list_items(self):
+        return self._read("SELECT COUNT(*) FROM list_items WHERE owner = ?", (self.owner,))[0][0]
+
+    def count_checked(self):
+        return self._read(
+            "SELECT COUNT(*) FROM list_items WHERE owner = ? AND checked = 1", (self.owner,)
+        )[0][0]
+
+    def set_checked(self, item_id, checked):
+        self._write(
+            "UPDATE list_items SET checked = ? WHERE owner = ? AND id = ?", (int(bool(checked)), self.owner, item_id)
+        )
+
+    def remove_list_item(self, item_id):
+        self._write("DELETE FROM list_items WHERE owner = ? AND id = ?", (self.owner, item_id))
+
+    def remove_checked(self):
+        self._write("DELETE FROM list_items WHERE owner = ? AND checked = 1", (self.owner,))
+
+    def clear_list(self):
+        self._write("DELETE FROM list_items WHERE owner = ?", (self.owner,))